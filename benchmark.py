@@ -0,0 +1,470 @@
+# Scaling benchmarks for the library build, composition and exploration
+
+"""
+Headless benchmark suite.
+
+Run the benchmarks and write their timings to a JSON file:
+
+    python benchmark.py run --output data/benchmarks/latest.json
+
+Compare a run with a stored baseline, exiting with status 1 on regressions:
+
+    python benchmark.py compare data/benchmarks/baseline.json data/benchmarks/latest.json
+
+Larger libraries are built by tiling the rows of `data/marionette_data.csv`
+under new sensor names, or with `--synthetic` drawn from a distribution fitted
+to them (see `utils.synthetic_library`), so that timings can be compared
+across library sizes.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from importlib import metadata
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from utils.synthetic_library import fit_library_distribution, generate_library
+
+# Benchmark profiles: library sizes, sensors combined by the sweeps, workers and repeats.
+# Library sizes are multiples of the number of sensors in the data file, see `library_sizes`.
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "quick": {
+        "library_scales": [1, 4],
+        "sensor_counts": [6, 8],
+        "worker_counts": [1, 2],
+        "max_combinations": 64,
+        "repeat": 3,
+    },
+    "full": {
+        "library_scales": [1, 4, 16],
+        "sensor_counts": [6, 8, 10, 14],
+        "worker_counts": [1, 2, 4, 8],
+        "max_combinations": 1024,
+        "repeat": 5,
+    },
+}
+
+# Relative slowdown of the median time flagged as a regression
+DEFAULT_THRESHOLD = 0.2
+
+
+def library_sizes(data_file: str, scales: Sequence[int]) -> List[int]:
+    """
+    Library sizes, as multiples of the number of sensors in `data_file`.
+
+    Args:
+        data_file (str): Characterization data.
+        scales (Sequence[int]): Multiples of the real library size, 1 for the real library.
+
+    Returns:
+        List[int]: The number of sensors of each library.
+    """
+    base = len(pd.read_csv(data_file, delimiter=",", engine="python"))
+    return [scale * base for scale in scales]
+
+
+def tiled_library_data(data_file: str, size: int) -> pd.DataFrame:
+    """
+    Characterization table with `size` sensors, repeating the rows of `data_file`.
+
+    Repeated sensors are renamed "<inducer>_<copy>" so that all names are distinct.
+
+    Args:
+        data_file (str): Characterization data.
+        size (int): Number of sensors.
+
+    Returns:
+        pd.DataFrame: The table, with a "std" column drawn as in `scalability.load_library`.
+    """
+    df = pd.read_csv(data_file, delimiter=",", engine="python")
+    copies = -(-size // len(df))
+    tiled = pd.concat([df] * copies, ignore_index=True).iloc[:size].copy()
+    copy_index = np.arange(size) // len(df)
+    tiled["Inducer"] = [name if c == 0 else f"{name}_{c}" for name, c in zip(tiled["Inducer"], copy_index)]
+    tiled["std"] = np.random.default_rng(0).uniform(0.7, 0.8, size)
+    return tiled
+
+
+def library_data(data_file: str, size: int, synthetic: bool = False) -> pd.DataFrame:
+    """
+    Characterization table with `size` sensors, tiled or synthetic.
+
+    Args:
+        data_file (str): Characterization data.
+        size (int): Number of sensors.
+        synthetic (bool, optional): Draw the sensors from a distribution fitted to `data_file`
+            instead of repeating its rows. Defaults to False.
+
+    Returns:
+        pd.DataFrame: The table, with a "std" column.
+    """
+    if not synthetic:
+        return tiled_library_data(data_file, size)
+    df = pd.read_csv(data_file, delimiter=",", engine="python")
+    return generate_library(fit_library_distribution(df), size, seed=0)
+
+
+def time_call(func: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None) -> List[float]:
+    """
+    Wall times of `repeat` calls of `func`, after one untimed warm-up call.
+
+    Args:
+        func (Callable[[], Any]): The benchmarked call.
+        repeat (int): Number of timed calls.
+        setup (Optional[Callable[[], Any]], optional): Called, untimed, before each call. Defaults to None.
+
+    Returns:
+        List[float]: The time of each call, in seconds.
+    """
+    times = []
+    for i in range(repeat + 1):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        if i:
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def _summary(times: Sequence[float], **params: Any) -> Dict[str, Any]:
+    return {
+        "params": params,
+        "times": list(times),
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+
+def bench_library_build(
+    data_file: str, sizes: Sequence[int], repeat: int, synthetic: bool = False
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Time the construction of sensor libraries, sensor by sensor and as one batch.
+
+    Args:
+        data_file (str): Characterization data.
+        sizes (Sequence[int]): Library sizes.
+        repeat (int): Timed calls per case.
+        synthetic (bool, optional): Use synthetic libraries, see `library_data`. Defaults to False.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The timing summary of each case.
+    """
+    import scalability
+    from utils.synbio_utils import create_sensor_contracts2
+
+    results = {}
+    for size in sizes:
+        df = library_data(data_file, size, synthetic)
+        rows = list(zip(
+            df["Inducer"], df["K (µM)"], df["ymin (RPUx10-3)"] * 1e-3, df["start"], df["ymax Linear"], df["std"]
+        ))
+
+        def build_each() -> None:
+            for name, K, leak, start, ymax, std in rows:
+                create_sensor_contracts2(
+                    sensor_input=name, output=scalability.sensor_output, K=K, yleak=leak, start=start,
+                    ymax_lin=ymax, std=std,
+                )
+
+        results[f"library_build/create_sensor_contracts2/{size}"] = _summary(
+            time_call(build_each, repeat), library_size=size
+        )
+        results[f"library_build/build_library/{size}"] = _summary(
+            time_call(lambda: scalability.build_library(df), repeat), library_size=size
+        )
+    return results
+
+
+def bench_operations(repeat: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Time single compose and quotient calls on the loaded library.
+
+    The pair is (Sal, aTc) as in the specification notebook, or the first two
+    sensors of the library if those are missing.
+
+    Args:
+        repeat (int): Timed calls per case.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The timing summary of each case.
+    """
+    import scalability
+    from utils.synbio_utils import create_top_level_contracts, rename_sensor_output
+
+    names = scalability.sensor_names
+    first, second = ("Sal", "aTc") if {"Sal", "aTc"} <= set(names) else names[:2]
+    x1 = scalability.slot_contract(first, "x1")
+    x2 = scalability.slot_contract(second, "x2")
+    pair = x2.compose(x1)
+    params = {name: scalability.sensor_library_params[name] for name in (first, second)}
+    top_level = create_top_level_contracts(
+        input1=first, input2=second, output="RFP",
+        input1_params=params[first], input2_params=params[second],
+        output_params={"max": max(p["ymax"] for p in params.values()), "leak": max(p["leak"] for p in params.values())},
+    )
+    on1 = scalability.sensor_library[first][1]
+    on2 = rename_sensor_output(scalability.sensor_library[second], "dCas9", scalability.sensor_output)[1]
+    sensors = on1.compose(on2)
+    return {
+        "compose/sensor_pair": _summary(time_call(lambda: x2.compose(x1), repeat), sensors=[first, second]),
+        "compose/processor": _summary(
+            time_call(lambda: pair.compose(scalability.processor_1), repeat), sensors=[first, second]
+        ),
+        "quotient/top_level": _summary(
+            time_call(lambda: top_level[3].quotient(sensors), repeat), sensors=[first, second]
+        ),
+    }
+
+
+def bench_explore_combination(combinations: Sequence[Tuple[str, ...]], repeat: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Time `explore_combination` with cold and warm composition caches.
+
+    Args:
+        combinations (Sequence[Tuple[str, ...]]): The combinations explored by each timed call.
+        repeat (int): Timed calls per case.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The timing summary of each case, per combination.
+    """
+    import scalability
+
+    def explore_all() -> None:
+        for count, combo in enumerate(combinations):
+            scalability.explore_combination(count, combo)
+
+    def clear_caches() -> None:
+        scalability.composition_cache.clear()
+        scalability._slot_contracts.cache_clear()
+
+    n = len(combinations)
+    cold = [t / n for t in time_call(explore_all, repeat, setup=clear_caches)]
+    warm = [t / n for t in time_call(explore_all, repeat)]
+    return {
+        "explore_combination/cold": _summary(cold, combinations=n),
+        "explore_combination/warm": _summary(warm, combinations=n),
+    }
+
+
+def bench_sweeps(data_file: str, profile: Dict[str, Any], synthetic: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Time full explorations with `run_exploration`, across library sizes, sensor and worker counts.
+
+    Each library is built once, in a temporary directory, and its snapshot is
+    loaded by the pool workers. Only the first `max_combinations`
+    combinations of the first sensors of the library are explored.
+
+    Args:
+        data_file (str): Characterization data.
+        profile (Dict[str, Any]): One of `PROFILES`, with its "library_sizes" (see `library_sizes`).
+        synthetic (bool, optional): Use synthetic libraries, see `library_data`. Defaults to False.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The timing summary of each case.
+    """
+    import scalability
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in profile["library_sizes"]:
+            size_file = os.path.join(tmp, f"library_{size}.csv")
+            library_data(data_file, size, synthetic).drop(columns="std").to_csv(size_file, index=False)
+            scalability.load_library(size_file, cache_dir=os.path.join(tmp, "snapshots"), std_data_file=None)
+            for sensors in profile["sensor_counts"]:
+                if sensors > size:
+                    continue
+                combinations = list(itertools.islice(
+                    itertools.combinations(scalability.sensor_names[:sensors], len(scalability.outputs)),
+                    profile["max_combinations"],
+                ))
+                for workers in profile["worker_counts"]:
+                    times = []
+                    for _ in range(profile["repeat"]):
+                        start = time.perf_counter()
+                        scalability.run_exploration(combinations, processes=workers)
+                        times.append(time.perf_counter() - start)
+                    results[f"sweep/{size}/{sensors}/{workers}"] = _summary(
+                        times, library_size=size, sensors=sensors, workers=workers, combinations=len(combinations)
+                    )
+    scalability.load_library(data_file, std_data_file=None)
+    return results
+
+
+def _environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        pacti_version = metadata.version("pacti")
+    except metadata.PackageNotFoundError:
+        pacti_version = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "pacti": pacti_version,
+    }
+
+
+def run_benchmarks(
+    profile: str = "quick",
+    data_file: str = "data/marionette_data.csv",
+    only: Optional[Sequence[str]] = None,
+    synthetic: bool = False,
+) -> Dict[str, Any]:
+    """
+    Run the benchmark suite.
+
+    Args:
+        profile (str, optional): One of `PROFILES`. Defaults to "quick".
+        data_file (str, optional): Characterization data. Defaults to "data/marionette_data.csv".
+        only (Optional[Sequence[str]], optional): Benchmark groups to run, among "library_build",
+            "operations", "explore_combination" and "sweeps". Defaults to all of them.
+        synthetic (bool, optional): Build the larger libraries with `utils.synthetic_library`
+            instead of tiling `data_file`. Defaults to False.
+
+    Returns:
+        Dict[str, Any]: The environment, the profile and the timing summary of each case.
+    """
+    import scalability
+
+    settings = dict(PROFILES[profile])
+    settings["library_sizes"] = library_sizes(data_file, settings["library_scales"])
+    groups = set(only or ("library_build", "operations", "explore_combination", "sweeps"))
+    scalability.load_library(data_file, std_data_file=None)
+    combinations = list(itertools.islice(
+        itertools.combinations(scalability.sensor_names, len(scalability.outputs)), settings["max_combinations"]
+    ))
+    results: Dict[str, Dict[str, Any]] = {}
+    if "library_build" in groups:
+        results.update(bench_library_build(data_file, settings["library_sizes"], settings["repeat"], synthetic))
+    if "operations" in groups:
+        results.update(bench_operations(settings["repeat"]))
+    if "explore_combination" in groups:
+        results.update(bench_explore_combination(combinations, settings["repeat"]))
+    if "sweeps" in groups:
+        results.update(bench_sweeps(data_file, settings, synthetic))
+    return {
+        "environment": _environment(),
+        "profile": {"name": profile, "synthetic": synthetic, **settings},
+        "results": results,
+    }
+
+
+def compare_benchmarks(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD
+) -> List[Dict[str, Any]]:
+    """
+    Compare the median times of two benchmark runs.
+
+    Args:
+        baseline (Dict[str, Any]): The stored run, as written by `run_benchmarks`.
+        current (Dict[str, Any]): The new run.
+        threshold (float, optional): Relative change of the median flagged as a regression (slower)
+            or an improvement (faster). Defaults to `DEFAULT_THRESHOLD`.
+
+    Returns:
+        List[Dict[str, Any]]: For each case in both runs, its medians, their ratio and its status
+        ("regression", "improvement" or "ok").
+    """
+    rows = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["median"]
+        after = result["median"]
+        ratio = after / before if before > 0 else float("inf")
+        status = "ok"
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 - threshold:
+            status = "improvement"
+        rows.append({"name": name, "baseline": before, "current": after, "ratio": ratio, "status": status})
+    return rows
+
+
+def _write_json(data: Dict[str, Any], path: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Command-line entry point.
+
+    Args:
+        argv (Optional[Sequence[str]], optional): The arguments. Defaults to `sys.argv[1:]`.
+
+    Returns:
+        int: The exit status, 1 if `compare` found a regression.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Run the benchmarks and write their timings.")
+    run.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    run.add_argument("--data-file", default="data/marionette_data.csv")
+    run.add_argument("--output", default="data/benchmarks/latest.json")
+    run.add_argument("--only", nargs="+", choices=["library_build", "operations", "explore_combination", "sweeps"])
+    run.add_argument("--synthetic", action="store_true", help="Draw the larger libraries from a fitted distribution.")
+    run.add_argument("--baseline", help="Also compare the run with this stored run.")
+    run.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    compare = commands.add_parser("compare", help="Compare a run with a stored baseline.")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        current = run_benchmarks(args.profile, args.data_file, args.only, args.synthetic)
+        _write_json(current, args.output)
+        print(f"Wrote {len(current['results'])} benchmark results to {args.output}")
+        for name, result in current["results"].items():
+            print(f"{name:<50} {result['median'] * 1e3:12.3f} ms")
+        if not args.baseline:
+            return 0
+        baseline_file = args.baseline
+    else:
+        with open(args.current) as f:
+            current = json.load(f)
+        baseline_file = args.baseline
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+
+    rows = compare_benchmarks(baseline, current, args.threshold)
+    for row in rows:
+        print(
+            f"{row['name']:<50} {row['baseline'] * 1e3:12.3f} ms -> {row['current'] * 1e3:12.3f} ms "
+            f"({row['ratio']:6.2f}x) {row['status']}"
+        )
+    regressions = [row for row in rows if row["status"] == "regression"]
+    if regressions:
+        print(f"{len(regressions)} regressions beyond {args.threshold:.0%} against {baseline_file}")
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%} against {baseline_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
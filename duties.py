@@ -334,6 +334,28 @@ def coverage(ctx):
     ctx.run("coverage html --rcfile=config/coverage.ini")
 
 
+@duty
+def benchmark(
+    ctx, profile: str = "quick", output: str = "data/benchmarks/latest.json", baseline: str = "", synthetic: bool = False
+):
+    """
+    Run the benchmark suite, and compare it with a stored run.
+
+    Arguments:
+        ctx: The context instance (passed automatically).
+        profile: The benchmark profile, "quick" or "full".
+        output: Where to write the timings.
+        baseline: A stored run to compare with. The duty fails on regressions.
+        synthetic: Draw the larger libraries from a distribution fitted to the Marionette data.
+    """
+    command = [sys.executable, "benchmark.py", "run", "--profile", profile, "--output", output]
+    if baseline:
+        command += ["--baseline", baseline]
+    if synthetic:
+        command.append("--synthetic")
+    ctx.run(command, title="Running benchmarks", pty=PTY, capture=False)
+
+
 @duty
 def test(ctx, match: str = ""):
     """
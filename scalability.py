@@ -1,42 +1,139 @@
 # Design and Computational Scalability with Pacti
 
+import functools
+import hashlib
+import io
 import itertools
+import multiprocessing
+import os
+import pickle
 import time
+from concurrent.futures import Executor
+from multiprocessing import util
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
 import pandas as pd
 import numpy as np
 from pacti.contracts import PolyhedralIoContract
-from pacti.terms.polyhedra.polyhedra import Var
-from pacti.utils import write_contracts_to_file
-from utils.synbio_utils import create_sensor_contracts2
-
-# Read the data from the paper using the CSV file "marionette_data.csv"
-df = pd.read_csv("data/marionette_data.csv", delimiter=",", engine="python")
-
-# Add the new "std" column with random values between 0.1 and 0.3
-df["std"] = np.random.uniform(0.7, 0.8, len(df))
-
-# Write the updated DataFrame to a new CSV file
-df.to_csv("data/marionette_data_with_std.csv", index=False)
-
-# Create all sensor contracts:
-sensor_names = [str(i) for i in df["Inducer"]]
-sensor_library = {}
-sensor_library_params = {}
-for sensor in sensor_names:
-    sensor_params = {}
-    yleak_s = df.loc[df["Inducer"] == sensor]["ymin (RPUx10-3)"].values[0]
-    yleak_s = yleak_s * 1e-3
-    s_start = df.loc[df["Inducer"] == sensor]["start"].values[0]
-    s_K = df.loc[df["Inducer"] == sensor]["K (µM)"].values[0]
-    ymax_s = df.loc[df["Inducer"] == sensor]["ymax Linear"].values[0]
-    std = df.loc[df["Inducer"] == sensor]["std"].values[0]
-    sensor_params = {"leak": yleak_s, "start": s_start, "K": s_K, "ymax": ymax_s, "std": std}
-    s_output = "dCas9"
-    contract_s_0, contract_s_lin, contract_s_max = create_sensor_contracts2(
-        sensor_input=sensor, output="xRFP", start=s_start, K=s_K, ymax_lin=ymax_s, yleak=yleak_s, std=std
-    )
-    sensor_library[sensor] = [contract_s_0, contract_s_lin, contract_s_max]
-    sensor_library_params[sensor] = sensor_params
+from pacti.terms.polyhedra.polyhedra import PolyhedralTerm, Var
+from utils.checkpoint import SweepCheckpoint
+from utils.composition_cache import CompositionCache
+from utils.design_ranking import RankedDesign, TopKCollector, margin_score, specification_margins
+from utils.design_store import DesignStore
+from utils.design_search import SearchStatistics, branch_and_bound, iter_slot_assignments
+from utils.failures import CompositionFailure
+from utils.feasibility import feasible_on_slot, input_requirements, output_bounds, prescreen_combinations
+from utils.robustness import monte_carlo_passes, wilson_interval
+from utils.stage_profiler import StageProfiler
+from utils.topology import CircuitTopology, compose_topology
+from utils.synbio_utils import create_sensor_contracts_batch, rename_sensor_output, sensor_contract_matrices
+
+# Sensor library, filled in place by `load_library()`.
+# Nothing is read or built at import time.
+# Contracts are built with output `sensor_output`;
+# contracts for specific output slots are renamed copies of these.
+sensor_output = "xRFP"
+sensor_names: List[str] = []
+sensor_library: Dict[str, List[PolyhedralIoContract]] = {}
+sensor_library_params: Dict[str, Dict[str, float]] = {}
+
+# Bump when the pickled snapshot layout changes
+_snapshot_version = 2
+# Arguments of the last `load_library()` call, reused by pool workers
+library_args: Dict[str, Any] = {}
+
+
+def build_library(df: pd.DataFrame) -> Tuple[Dict[str, List[PolyhedralIoContract]], Dict[str, Dict[str, float]]]:
+    """
+    Build the sensor contracts for every sensor of a characterization table.
+
+    Args:
+        df (pd.DataFrame): Marionette data with an added "std" column.
+
+    Returns:
+        Tuple[Dict[str, List[PolyhedralIoContract]], Dict[str, Dict[str, float]]]:
+            The OFF/linear/saturation contracts and the parameters of each sensor.
+    """
+    names = [str(i) for i in df["Inducer"]]
+    leak = df["ymin (RPUx10-3)"].to_numpy(dtype=float) * 1e-3
+    start = df["start"].to_numpy(dtype=float)
+    K = df["K (µM)"].to_numpy(dtype=float)
+    ymax = df["ymax Linear"].to_numpy(dtype=float)
+    std = df["std"].to_numpy(dtype=float)
+    # All regimes of all sensors are built in one batch, from coefficient matrices
+    all_contracts = create_sensor_contracts_batch(names, sensor_output, leak, start, K, ymax, std)
+    library = {}
+    library_params = {}
+    for i, sensor in enumerate(names):
+        library[sensor] = list(all_contracts[i])
+        library_params[sensor] = {"leak": leak[i], "start": start[i], "K": K[i], "ymax": ymax[i], "std": std[i]}
+    return library, library_params
+
+
+def load_library(
+    data_file: str = "data/marionette_data.csv",
+    seed: int = 0,
+    cache_dir: Optional[str] = "data/.library_cache",
+    std_data_file: Optional[str] = None,
+) -> Tuple[Dict[str, List[PolyhedralIoContract]], Dict[str, Dict[str, float]]]:
+    """
+    Load the sensor library into `sensor_library` and `sensor_library_params`.
+
+    The library is built from `data_file`, with a "std" column drawn
+    uniformly in [0.7, 0.8) from a generator seeded with `seed`. Built
+    libraries are pickled into `cache_dir`, keyed on the content of
+    `data_file` and on `seed`, so later calls (e.g. from pool workers)
+    unpickle the snapshot instead of rebuilding it.
+
+    Args:
+        data_file (str, optional): Characterization data.
+                                   Defaults to "data/marionette_data.csv".
+        seed (int, optional): Seed for the "std" column. Defaults to 0.
+        cache_dir (Optional[str], optional): Snapshot directory, or None to disable snapshots.
+                                             Defaults to "data/.library_cache".
+        std_data_file (Optional[str], optional): Where to write the data with the "std" column
+                                                 when the library is built, e.g.
+                                                 "data/marionette_data_with_std.csv", or None.
+                                                 Snapshots in `cache_dir` are the way to reuse a
+                                                 built library. Defaults to None.
+
+    Returns:
+        Tuple[Dict[str, List[PolyhedralIoContract]], Dict[str, Dict[str, float]]]:
+            `sensor_library` and `sensor_library_params`.
+    """
+    with open(data_file, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data + f"|seed={seed}|v={_snapshot_version}".encode()).hexdigest()[:16]
+    snapshot = os.path.join(cache_dir, f"library_{digest}.pkl") if cache_dir else None
+
+    if snapshot and os.path.exists(snapshot):
+        with open(snapshot, "rb") as f:
+            library, library_params = pickle.load(f)
+    else:
+        # Read the data from the paper and add the "std" column
+        df = pd.read_csv(io.BytesIO(data), delimiter=",", engine="python")
+        df["std"] = np.random.default_rng(seed).uniform(0.7, 0.8, len(df))
+        if std_data_file:
+            df.to_csv(std_data_file, index=False)
+        library, library_params = build_library(df)
+        if snapshot:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_file = f"{snapshot}.{os.getpid()}.tmp"
+            with open(tmp_file, "wb") as f:
+                pickle.dump((library, library_params), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, snapshot)
+
+    # Update in place, so that names imported from this module stay valid
+    sensor_names[:] = list(library)
+    sensor_library.clear()
+    sensor_library.update(library)
+    sensor_library_params.clear()
+    sensor_library_params.update(library_params)
+    _slot_contracts.cache_clear()
+    composition_cache.clear()
+    library_args.clear()
+    library_args.update(data_file=data_file, seed=seed, cache_dir=cache_dir)
+    return sensor_library, sensor_library_params
+
 
 outputs = ["x1", "x2", "x3", "x4"]
 
@@ -74,98 +171,729 @@ processor_3 = PolyhedralIoContract.from_strings(
     ],
 )
 
-from typing import Optional, Tuple
 from pacti_instrumentation.pacti_counters import PactiInstrumentationData
 
 save_contracts: bool = False
 save_errors: bool = False
+# Single append-only store for the saved contracts and errors of all combinations
+design_store = DesignStore("data/designs.sqlite")
+
+
+processors = {"processor_1": processor_1, "processor_2": processor_2, "processor_3": processor_3}
+
+# The processors fed by library sensors, with the slots feeding each
+subassemblies = [("processor_1", ("x1", "x2")), ("processor_2", ("x3", "x4"))]
+
+# The circuit explored by `explore_combination`: sensors on `outputs` feed the processors,
+# connected by their variable names (x1, x2 -> processor_1 -> y1, ...)
+circuit_topology = CircuitTopology(outputs, processors)
+# Optional `concurrent.futures` executor running independent branches of the topology concurrently
+topology_executor: Optional[Executor] = None
+
+# Sensor regimes, in the order returned by `create_sensor_contracts_batch`
+regimes = ["off", "lin", "max"]
+
+# Composed (sensor, sensor, processor) sub-assemblies, shared by all combinations.
+# Replace with `CompositionCache.shared(manager)` before starting a pool to share it across workers.
+composition_cache = CompositionCache()
+# Look up processors fed by other processors (but not the root) by the exact form of their inputs,
+# so that designs with identical sub-results (e.g. the same sensors in another order) share them
+canonical_compositions: bool = False
+
+# Stage timings and outcomes of the explorations of this process. Disabled by default;
+# set `profiler.enabled = True` to profile `explore_combination`, or pass a profiler to `iter_explore`.
+profiler = StageProfiler(enabled=False)
+# Checkpoint of the sweep run by this pool worker, if any
+_worker_checkpoint: Optional[SweepCheckpoint] = None
+
+
+@functools.lru_cache(maxsize=None)
+def _slot_contracts(sensor: str, slot: str) -> Tuple[PolyhedralIoContract, ...]:
+    return rename_sensor_output(sensor_library[sensor], slot, template_output=sensor_output)
+
+
+def slot_contract(sensor: str, slot: str, regime: str = "max") -> PolyhedralIoContract:
+    """
+    Contract of a library sensor placed on the given output slot.
+
+    The contract is a renamed copy of the prebuilt one in `sensor_library`.
+
+    Args:
+        sensor (str): Name of the sensor in the library.
+        slot (str): Output variable of the sensor, one of `outputs`.
+        regime (str, optional): One of `regimes`. Defaults to "max".
+
+    Returns:
+        PolyhedralIoContract: The sensor contract for that regime.
+    """
+    return _slot_contracts(sensor, slot)[regimes.index(regime)]
+
+
+def compose_subassembly(processor: str, placements: Tuple[Tuple[str, str, str], ...]) -> PolyhedralIoContract:
+    """
+    Compose the sensors feeding a processor with that processor, using `composition_cache`.
+
+    Args:
+        processor (str): Name of the processor in `processors`.
+        placements (Tuple[Tuple[str, str, str], ...]): `(slot, sensor, regime)` for each processor input.
+
+    Returns:
+        PolyhedralIoContract: The composed sub-assembly.
+
+    Raises:
+        Exception: The (possibly cached) error of a failed composition.
+    """
+
+    def compose() -> PolyhedralIoContract:
+        composed = None
+        for slot, sensor, regime in placements:
+            contract = slot_contract(sensor, slot, regime)
+            composed = contract if composed is None else contract.compose(composed)
+        return composed.compose(processors[processor])
+
+    return composition_cache.get_or_compose((processor, placements), compose)
 
 
-def explore_combination(count, combo) -> Tuple[PactiInstrumentationData, Optional[PolyhedralIoContract]]:
-    # For this iteration of chosen sensors to use
-    # compute the contracts and store them in a list
+def slot_feasibility(regime: str = "max", topology: Optional[CircuitTopology] = None) -> np.ndarray:
+    """
+    Which library sensors can possibly meet the processor assumptions on each slot.
+
+    Output intervals are derived from `sensor_library_params` and checked,
+    for all sensors at once, against the single-variable assumptions that
+    the processors make on the slots. The check is sound: a sensor is only
+    marked infeasible on a slot if Pacti would reject it there.
+
+    Args:
+        regime (str, optional): One of `regimes`. Defaults to "max".
+        topology (Optional[CircuitTopology], optional): The circuit. Defaults to `circuit_topology`.
+
+    Returns:
+        np.ndarray: A boolean array of shape `(len(topology.slots), len(sensor_names))`.
+    """
+    if not sensor_library:
+        load_library()
+    columns = ("leak", "start", "K", "ymax", "std")
+    params = [np.array([sensor_library_params[s][c] for s in sensor_names]) for c in columns]
+    lo, hi, input_dependent = output_bounds(*sensor_contract_matrices(*params)[regime])
+    masks = []
+    for req_lo, req_hi in slot_requirements(topology):
+        masks.append(feasible_on_slot(lo, hi, input_dependent, req_lo, req_hi))
+    return np.array(masks)
+
+
+def slot_requirements(topology: Optional[CircuitTopology] = None) -> List[Tuple[float, float]]:
+    """
+    Bounds that the processors of a topology assume on each of its slots.
+
+    Args:
+        topology (Optional[CircuitTopology], optional): The circuit. Defaults to `circuit_topology`.
+
+    Returns:
+        List[Tuple[float, float]]: `(lower, upper)` for each slot, in slot order.
+    """
+    if topology is None:
+        topology = circuit_topology
+    requirements = {}
+    for processor in topology.processors.values():
+        for var, (req_lo, req_hi) in input_requirements(processor).items():
+            old_lo, old_hi = requirements.get(var, (-np.inf, np.inf))
+            requirements[var] = (max(old_lo, req_lo), min(old_hi, req_hi))
+    return [requirements.get(slot, (-np.inf, np.inf)) for slot in topology.slots]
+
+
+def prescreen(combinations, regime: str = "max") -> Tuple[List[Tuple[str, ...]], int]:
+    """
+    Drop the combinations that Pacti would reject because of a sensor/processor bound mismatch.
+
+    Args:
+        combinations: Sensor combinations, assigned to `outputs` in order.
+        regime (str, optional): One of `regimes`. Defaults to "max".
+
+    Returns:
+        Tuple[List[Tuple[str, ...]], int]: The combinations to compose and the number pruned.
+    """
+    return prescreen_combinations(combinations, sensor_names, slot_feasibility(regime))
+
+
+def search_designs(
+    regime: str = "max",
+    statistics: Optional[SearchStatistics] = None,
+    nogood: Optional[Set[Tuple[int, Tuple[str, ...]]]] = None,
+) -> Iterator[Tuple[Tuple[str, ...], PolyhedralIoContract]]:
+    """
+    Branch-and-bound exploration of all combinations of `len(outputs)` library sensors.
+
+    Designs are built slot by slot. A sensor pair that fails with its
+    processor prunes every combination containing it on those slots, and is
+    recorded in `nogood` so later branches skip it without composing.
+    Sensors that `slot_feasibility` rules out are never placed.
+
+    Args:
+        regime (str, optional): One of `regimes`. Defaults to "max".
+        statistics (Optional[SearchStatistics], optional): Search counters, updated in place. Defaults to None.
+        nogood (Optional[Set[Tuple[int, Tuple[str, ...]]]], optional): Failing `(subassembly, sensors)`,
+            updated in place. Defaults to None.
+
+    Yields:
+        Tuple[Tuple[str, ...], PolyhedralIoContract]: Each successful combination and its system contract.
+    """
+    if not sensor_library:
+        load_library()
+
+    def compose_group(group: int, sensors: Tuple[str, ...]) -> PolyhedralIoContract:
+        processor, slots = subassemblies[group]
+        return compose_subassembly(processor, tuple((slot, sensor, regime) for slot, sensor in zip(slots, sensors)))
+
+    def compose_top(results: List[PolyhedralIoContract]) -> PolyhedralIoContract:
+        return results[0].compose(results[1]).compose(processor_3)
+
+    return branch_and_bound(
+        sensor_names,
+        [slots for _, slots in subassemblies],
+        compose_group,
+        compose_top,
+        slot_masks=slot_feasibility(regime),
+        nogood=nogood,
+        statistics=statistics,
+    )
+
+
+def iter_assignments(
+    regime: str = "max",
+    topology: Optional[CircuitTopology] = None,
+    statistics: Optional[SearchStatistics] = None,
+) -> Iterator[Tuple[str, ...]]:
+    """
+    Ordered assignments of library sensors to the slots of a topology, up to slot symmetries.
+
+    Every ordering of a sensor set is considered, since slots differ in what
+    they require. Assignments that only exchange sensors between
+    interchangeable slots are produced once, and sensors ruled out by
+    `slot_feasibility` are never placed. The assignments can be passed
+    to `explore_combination`, `iter_explore` or `run_exploration`.
+
+    Args:
+        regime (str, optional): One of `regimes`. Defaults to "max".
+        topology (Optional[CircuitTopology], optional): The circuit. Defaults to `circuit_topology`.
+        statistics (Optional[SearchStatistics], optional): Counts the pruned assignments. Defaults to None.
+
+    Yields:
+        Tuple[str, ...]: The sensor placed on each slot, in slot order.
+    """
+    if topology is None:
+        topology = circuit_topology
+    return iter_slot_assignments(
+        sensor_names,
+        topology.slots,
+        topology.symmetric_slot_classes(),
+        slot_masks=slot_feasibility(regime, topology),
+        statistics=statistics,
+    )
+
+
+def explore_combination(
+    count, combo, topology: Optional[CircuitTopology] = None, regime: str = "max"
+) -> Tuple[PactiInstrumentationData, Optional[PolyhedralIoContract]]:
+    # For this iteration of chosen sensors to use,
+    # place them on the slots of the topology and compose it leaves first
+    if not sensor_library:
+        # Workers that did not inherit a loaded library read the snapshot
+        load_library()
+    if topology is None:
+        topology = circuit_topology
+    wall, start = time.time(), time.perf_counter()
     sys_contract = None
     errors_log = []
-    for sensor, output_i in zip(combo, outputs):
-        # For "sensor" input and "output_i" output, we get the contracts:
-        contract_s_0, contract_s_lin, contract_s_max = create_sensor_contracts2(
-            sensor_input=sensor,
-            output=output_i,
-            start=sensor_library_params[sensor]["start"],
-            K=sensor_library_params[sensor]["K"],
-            ymax_lin=sensor_library_params[sensor]["ymax"],
-            yleak=sensor_library_params[sensor]["leak"],
-            std=sensor_library_params[sensor]["std"],
-        )
-        if output_i == "x1":
-            # Store the contract for the sensor with output "x1"
-            sensor1 = contract_s_max
-        elif output_i == "x2":
-            # Compose the sensor with output "x2" with the stored sensor "sensor1"
-            try:
-                composed_sensor12 = contract_s_max.compose(sensor1)
-            except Exception as e:
-                composed_sensor12 = None
-                errors_log.append(e)
-            # Now, compose 1+2 with processor_1
-            if composed_sensor12 is not None:
-                try:
-                    composed_subsys1 = composed_sensor12.compose(processor_1)
-                except Exception as e:
-                    composed_subsys1 = None
-                    errors_log.append(e)
-            else:
-                composed_subsys1 = None
-        if output_i == "x3":
-            # Store the contract for the sensor with output "x3"
-            sensor3 = contract_s_max
-        elif output_i == "x4":
-            # Compose the sensor with output "x2" with the stored sensor "sensor1"
-            try:
-                composed_sensor34 = contract_s_max.compose(sensor3)
-            except Exception as e:
-                composed_sensor34 = None
-                errors_log.append(e)
-            # Now, compose 3+4 with processor_2, if composed_sensor34 was successful
-            # if composed_sensor34 is not None:
-            try:
-                composed_subsys2 = composed_sensor34.compose(processor_2)
-            except Exception as e:
-                composed_subsys2 = None
-                errors_log.append(e)
-        else:
-            composed_subsys2 = None
-        # else:
-        # If composition of sensor 1 and 2 is None,
-        # then no point computing the composition of 3 and 4 with processor2.
-        # composed_subsys2 = None
-    if composed_subsys1 is not None and composed_subsys2 is not None:
-        try:
-            composed_subsys = composed_subsys1.compose(composed_subsys2)
-            sys_contract = composed_subsys.compose(processor_3)
-        except Exception as e:
-            composed_subsys = None
-            sys_contract = None
-            errors_log.append(e)
+    placements = {slot: (sensor, regime) for sensor, slot in zip(combo, topology.slots)}
+    results = compose_topology(
+        topology, placements, slot_contract, cache=composition_cache, executor=topology_executor, profiler=profiler,
+        canonical=canonical_compositions,
+    )
+    for name in topology.order:
+        if isinstance(results.get(name), Exception):
+            errors_log.append(results[name])
+    if not isinstance(results.get(topology.root), Exception):
+        sys_contract = results.get(topology.root)
 
     if sys_contract is not None:
         # Verify whether the final composed system has correct inputs and outputs
+        check_start = time.perf_counter()
         try:
-            for sensor in combo:
-                assert Var(sensor) in sys_contract.inputvars
-            assert Var("y") in sys_contract.outputvars
+            with profiler.stage("interface_check", combo):
+                _check_interface(sys_contract, combo, topology)
         except AssertionError as e:
-            errors_log.append(e)
-
-    if save_errors:
-        with open("data/design_error_log_" + str(count) + ".txt", "w") as f:
-            for error in errors_log:
-                f.write(str(error))
+            errors_log.append(CompositionFailure(
+                "interface_check", topology.root, tuple(topology.slots), tuple(combo),
+                time.perf_counter() - check_start, e,
+            ))
 
-    if save_contracts:
-        write_contracts_to_file(
-            [sys_contract], ["contract_" + str(count)], "data/successful_design_" + str(count) + ".json"
+    if save_errors or save_contracts:
+        design_store.add(
+            count,
+            combo,
+            contract=sys_contract if save_contracts else None,
+            errors=errors_log if save_errors else (),
         )
 
+    if profiler.enabled:
+        profiler.record("design", time.perf_counter() - start, sys_contract is not None, combo, wall, {"count": count})
+        _record_cache_stats()
     return PactiInstrumentationData().update_counts(), sys_contract
 
+
+def robustness(
+    designs,
+    n_samples: int = 10000,
+    seed: int = 0,
+    regime: str = "max",
+    topology: Optional[CircuitTopology] = None,
+    confidence: float = 0.95,
+    spread: Optional[Dict[str, float]] = None,
+    chunk_size: int = 1000,
+    processes: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Probability that each design works, under uncertainty on the sensor characterization.
+
+    Instead of the single "std" drawn by `load_library`, `n_samples` seeded
+    samples of std, leak, ymax and K are drawn around `sensor_library_params`
+    (see `utils.robustness.sample_parameters`). The sensor contracts of all
+    samples are built in batch as coefficient matrices, and each design is
+    checked, in each sample, with the interval check of `slot_feasibility`.
+    Chunks of samples are checked in parallel.
+
+    The per-sample check is an interval check, not a Pacti composition: it
+    only compares the output bounds of each sensor with the bounds assumed
+    on its slot. It is exact for the default circuit, whose processors only
+    assume bounds on their slots and whose guarantees meet the assumptions
+    downstream. For other topologies, a passing sample is only a necessary
+    condition for the design to work.
+
+    Args:
+        designs: Sensor combinations, assigned to the slots of the topology in order.
+        n_samples (int, optional): Number of parameter samples. Defaults to 10000.
+        seed (int, optional): Seed of the samples. Defaults to 0.
+        regime (str, optional): One of `regimes`. Defaults to "max".
+        topology (Optional[CircuitTopology], optional): The circuit. Defaults to `circuit_topology`.
+        confidence (float, optional): Level of the Wilson confidence intervals. Defaults to 0.95.
+        spread (Optional[Dict[str, float]], optional): Relative (lognormal) spread of leak, ymax and K.
+            Defaults to `utils.robustness.DEFAULT_SPREAD`.
+        chunk_size (int, optional): Samples checked at a time by a worker. Defaults to 1000.
+        processes (Optional[int], optional): Number of workers, None for `os.cpu_count()`, 1 to run
+                                             in this process. Defaults to None, as `monte_carlo_passes`.
+
+    Returns:
+        pd.DataFrame: For each design, its sensors ("combo"), the number of passing samples ("passes"),
+        the pass probability ("probability") and its confidence interval ("ci_low", "ci_high").
+    """
+    if not sensor_library:
+        load_library()
+    designs = [tuple(combo) for combo in designs]
+    index = {name: i for i, name in enumerate(sensor_names)}
+    nominal = {c: np.array([sensor_library_params[s][c] for s in sensor_names]) for c in ("leak", "start", "K", "ymax")}
+    passes = monte_carlo_passes(
+        nominal,
+        np.array([[index[sensor] for sensor in combo] for combo in designs], dtype=int),
+        n_samples,
+        slot_requirements(topology),
+        regime=regime,
+        seed=seed,
+        spread=spread,
+        chunk_size=chunk_size,
+        processes=processes,
+    )
+    ci_low, ci_high = wilson_interval(passes, n_samples, confidence)
+    return pd.DataFrame(
+        {
+            "combo": designs,
+            "passes": passes,
+            "probability": passes / n_samples,
+            "ci_low": ci_low,
+            "ci_high": ci_high,
+        }
+    )
+
+
+def _check_interface(sys_contract: PolyhedralIoContract, combo, topology: CircuitTopology) -> None:
+    for sensor in combo:
+        assert Var(sensor) in sys_contract.inputvars, f"Input {sensor} is missing from the system contract"
+    for output in topology.outputs:
+        assert Var(output) in sys_contract.outputvars, f"Output {output} is missing from the system contract"
+
+
+def explore_regimes(
+    count, combo, topology: Optional[CircuitTopology] = None, regime_vectors=None
+) -> Tuple[PactiInstrumentationData, Dict[Tuple[str, ...], Optional[PolyhedralIoContract]]]:
+    """
+    Explore a design in every combination of sensor regimes.
+
+    Each regime vector assigns one of `regimes` to the sensor on each slot,
+    for `3 ** len(topology.slots)` vectors by default. Sub-assemblies are
+    looked up in `composition_cache` under their own `(slot, sensor, regime)`
+    placements, so a sensor pair is composed once per pair of regimes and
+    shared by all vectors and designs that place it. Vectors below a failed
+    sub-assembly reuse the cached failure and skip the top-level composition.
+
+    Contracts and errors are not written to `design_store`.
+
+    Args:
+        count: The combination id.
+        combo: The sensors of the design, in slot order.
+        topology (Optional[CircuitTopology], optional): The circuit. Defaults to `circuit_topology`.
+        regime_vectors (optional): The regime vectors to explore, each with one regime per slot.
+            Defaults to all of them.
+
+    Returns:
+        Tuple[PactiInstrumentationData, Dict[Tuple[str, ...], Optional[PolyhedralIoContract]]]: The Pacti
+        instrumentation, and the system contract of each regime vector, or None for vectors that do not
+        satisfy the top-level specification.
+    """
+    if not sensor_library:
+        load_library()
+    if topology is None:
+        topology = circuit_topology
+    if regime_vectors is None:
+        regime_vectors = itertools.product(regimes, repeat=len(topology.slots))
+    designs: Dict[Tuple[str, ...], Optional[PolyhedralIoContract]] = {}
+    for vector in regime_vectors:
+        placements = {slot: (sensor, regime) for slot, sensor, regime in zip(topology.slots, combo, vector)}
+        results = compose_topology(
+            topology, placements, slot_contract, cache=composition_cache, executor=topology_executor,
+            profiler=profiler, canonical=canonical_compositions,
+        )
+        sys_contract = results.get(topology.root)
+        if isinstance(sys_contract, Exception):
+            sys_contract = None
+        if sys_contract is not None:
+            try:
+                _check_interface(sys_contract, combo, topology)
+            except AssertionError:
+                sys_contract = None
+        designs[tuple(vector)] = sys_contract
+    if profiler.enabled:
+        _record_cache_stats()
+    return PactiInstrumentationData().update_counts(), designs
+
+
+def satisfying_regimes(designs: Dict[Tuple[str, ...], Optional[PolyhedralIoContract]]) -> List[Tuple[str, ...]]:
+    """
+    The regime vectors of a design that satisfy the top-level specification.
+
+    Args:
+        designs (Dict[Tuple[str, ...], Optional[PolyhedralIoContract]]): The result of `explore_regimes`.
+
+    Returns:
+        List[Tuple[str, ...]]: The regime vectors with a system contract, in exploration order.
+    """
+    return [vector for vector, sys_contract in designs.items() if sys_contract is not None]
+
+
+def specification_terms(topology: Optional[CircuitTopology] = None) -> Dict[str, PolyhedralTerm]:
+    """
+    The terms a design is ranked against: every processor assumption and the guarantees of the root.
+
+    Args:
+        topology (Optional[CircuitTopology], optional): The circuit. Defaults to `circuit_topology`.
+
+    Returns:
+        Dict[str, PolyhedralTerm]: Each term, named after its processor, e.g. "processor_3 guarantee -1.0*y <= -2.05".
+    """
+    if topology is None:
+        topology = circuit_topology
+    terms = {}
+    for name in topology.order:
+        for term in topology.processors[name].a.terms:
+            terms[f"{name} assumption {term}"] = term
+    for term in topology.processors[topology.root].g.terms:
+        terms[f"{topology.root} guarantee {term}"] = term
+    return terms
+
+
+def design_margins(
+    combo, topology: Optional[CircuitTopology] = None, regime: str = "max", relative: bool = True
+) -> Dict[str, float]:
+    """
+    Worst-case margin of a design against each of its `specification_terms`.
+
+    The sensors are placed on the slots of the topology, and each term is
+    minimized over the signals allowed by the sensor and processor
+    guarantees (see `utils.design_ranking.specification_margins`). The
+    margins are meaningful for designs whose composition succeeded.
+
+    Args:
+        combo: The sensors of the design, in slot order.
+        topology (Optional[CircuitTopology], optional): The circuit. Defaults to `circuit_topology`.
+        regime (str, optional): One of `regimes`. Defaults to "max".
+        relative (bool, optional): Express each margin relative to the constant of its term. Defaults to True.
+
+    Returns:
+        Dict[str, float]: The margin of each term; negative if some behavior violates it.
+    """
+    if not sensor_library:
+        load_library()
+    if topology is None:
+        topology = circuit_topology
+    components = [slot_contract(sensor, slot, regime) for sensor, slot in zip(combo, topology.slots)]
+    components += list(topology.processors.values())
+    return specification_margins(components, specification_terms(topology), relative)
+
+
+def _explore_indexed(params: Tuple[int, Tuple[str, ...]]) -> tuple:
+    count, combo = params
+    instrumentation, sys_contract = explore_combination(count, combo)
+    return count, combo, instrumentation, sys_contract
+
+
+def _explore_regimes_indexed(params: Tuple[int, Tuple[str, ...]]) -> tuple:
+    count, combo = params
+    instrumentation, designs = explore_regimes(count, combo)
+    return count, combo, instrumentation, designs
+
+
+class ChunkTiming(NamedTuple):
+    """Timing of one chunk of combinations explored by a pool worker."""
+
+    pid: int
+    size: int
+    start: float
+    end: float
+    # Stage records of the chunk, if the worker profiles its explorations
+    profile: Optional[StageProfiler] = None
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+def _init_worker(args: Dict[str, Any], profile: bool = False, checkpoint: Optional[SweepCheckpoint] = None) -> None:
+    global _worker_checkpoint
+    # Load the library once per worker, from the snapshot written by the parent
+    load_library(std_data_file=None, **args)
+    profiler.reset()
+    profiler.enabled = profile
+    # Lookups made by the parent before the fork are reported by the parent
+    composition_cache.take_stats()
+    _worker_checkpoint = checkpoint
+    if checkpoint is not None:
+        # Start from the compositions of the interrupted sweep, and save this worker's when it exits
+        composition_cache.restore(checkpoint.cache_entries())
+        util.Finalize(checkpoint, _save_worker_cache, exitpriority=10)
+
+
+def _save_worker_cache() -> None:
+    if _worker_checkpoint is not None:
+        _worker_checkpoint.save_cache(composition_cache.entries())
+
+
+def _record_cache_stats() -> None:
+    # Report the lookups since the previous report, so that the records add up, and the size as a gauge
+    profiler.record_cache("composition_cache", composition_cache.take_stats(), {"size": len(composition_cache)})
+
+
+def _profile_snapshot() -> StageProfiler:
+    _record_cache_stats()
+    return profiler.snapshot()
+
+
+def _explore_chunk(
+    chunk: List[Tuple[int, Tuple[str, ...]]], all_regimes: bool = False
+) -> Tuple[ChunkTiming, List[tuple]]:
+    start = time.time()
+    explore = _explore_regimes_indexed if all_regimes else _explore_indexed
+    with profiler.stage("chunk", first=chunk[0][0], size=len(chunk)):
+        results = [explore(params) for params in chunk]
+    if _worker_checkpoint is not None and _worker_checkpoint.time_to_save():
+        _save_worker_cache()
+    profile = _profile_snapshot() if profiler.enabled else None
+    return ChunkTiming(os.getpid(), len(chunk), start, time.time(), profile), results
+
+
+def _chunked(iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
+
+
+def iter_explore(
+    combinations,
+    processes: Optional[int] = None,
+    chunk_size: int = 16,
+    timings: Optional[List[ChunkTiming]] = None,
+    start_method: Optional[str] = None,
+    all_regimes: bool = False,
+    stage_profiler: Optional[StageProfiler] = None,
+    checkpoint: Optional[SweepCheckpoint] = None,
+) -> Iterator[tuple]:
+    """
+    Explore combinations in a process pool, yielding results as soon as a worker finishes them.
+
+    Each worker loads the library once, in its initializer, with the arguments
+    of the last `load_library()` call in this process (from its snapshot if
+    snapshots are enabled). Combinations are dispatched in chunks of
+    `chunk_size` to amortize inter-process communication.
+
+    Results are not accumulated: feed them to `utils.result_sinks` sinks
+    (e.g. with `stream_to_sinks`) to persist or aggregate them.
+
+    Args:
+        combinations: Sensor combinations, assigned to `outputs` in order. May be a lazy iterable.
+        processes (Optional[int], optional): Number of workers. Defaults to `os.cpu_count()`.
+        chunk_size (int, optional): Combinations sent to a worker at a time. Defaults to 16.
+        timings (Optional[List[ChunkTiming]], optional): If given, the timing of each chunk is appended to it.
+            Defaults to None.
+        start_method (Optional[str], optional): Multiprocessing start method ("fork", "spawn", ...).
+            Defaults to the platform default.
+        all_regimes (bool, optional): Explore every regime vector of each combination with `explore_regimes`.
+            Defaults to False (the "max" regime only).
+        stage_profiler (Optional[StageProfiler], optional): If given, workers profile the stages of their
+            explorations and the records of each chunk, including `composition_cache` counters, are merged
+            into it. Defaults to None (no profiling).
+        checkpoint (Optional[SweepCheckpoint], optional): If given, results are appended to the checkpoint
+            every `checkpoint.interval` seconds and workers save their `composition_cache`. If the checkpoint
+            holds an interrupted sweep, its results are yielded first, its combinations are skipped and the
+            workers start from its caches. Defaults to None.
+
+    Yields:
+        tuple: `(count, combo, instrumentation, sys_contract)`, in completion order. With `all_regimes`,
+        the last element is the `explore_regimes` dictionary of system contracts by regime vector.
+    """
+    if not sensor_library:
+        load_library()
+    tasks = enumerate(combinations)
+    if checkpoint is not None:
+        checkpoint.check_metadata({"library": library_args, "all_regimes": all_regimes})
+        checkpoint.merge_caches(composition_cache.maxsize)
+        yield from checkpoint.restored_results()
+        tasks = (task for task in tasks if not checkpoint.completed(*task))
+    context = multiprocessing.get_context(start_method)
+    initargs = (dict(library_args), stage_profiler is not None, checkpoint)
+    pool = context.Pool(processes, initializer=_init_worker, initargs=initargs)
+    try:
+        explore_chunk = functools.partial(_explore_chunk, all_regimes=all_regimes)
+        for timing, results in pool.imap_unordered(explore_chunk, _chunked(tasks, chunk_size)):
+            if timing.profile is not None:
+                stage_profiler.merge(timing.profile)
+                timing = timing._replace(profile=None)
+            if timings is not None:
+                timings.append(timing)
+            if checkpoint is not None:
+                for result in results:
+                    checkpoint.add(result)
+            yield from results
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        # Let the workers exit normally, so that they flush their `design_store` buffers and save their caches
+        pool.close()
+    finally:
+        pool.join()
+        if checkpoint is not None:
+            checkpoint.flush()
+
+
+def run_exploration(
+    combinations,
+    processes: Optional[int] = None,
+    chunk_size: int = 16,
+    start_method: Optional[str] = None,
+    all_regimes: bool = False,
+    stage_profiler: Optional[StageProfiler] = None,
+    checkpoint: Optional[SweepCheckpoint] = None,
+) -> Tuple[List[tuple], List[ChunkTiming]]:
+    """
+    Explore combinations in a process pool and collect the results.
+
+    See `iter_explore`, which streams the results instead.
+
+    Args:
+        combinations: Sensor combinations, assigned to `outputs` in order.
+        processes (Optional[int], optional): Number of workers. Defaults to `os.cpu_count()`.
+        chunk_size (int, optional): Combinations sent to a worker at a time. Defaults to 16.
+        start_method (Optional[str], optional): Multiprocessing start method. Defaults to the platform default.
+        all_regimes (bool, optional): Explore every regime vector of each combination. Defaults to False.
+        stage_profiler (Optional[StageProfiler], optional): Collects the stage records of the workers.
+            Defaults to None.
+        checkpoint (Optional[SweepCheckpoint], optional): Checkpoint to save the sweep to and resume it from.
+            Defaults to None.
+
+    Returns:
+        Tuple[List[tuple], List[ChunkTiming]]: The `(count, combo, instrumentation, sys_contract)` results,
+        in completion order (those restored from `checkpoint` first), and the timing of each chunk
+        explored by this call.
+    """
+    timings: List[ChunkTiming] = []
+    results = list(
+        iter_explore(
+            combinations,
+            processes,
+            chunk_size,
+            timings=timings,
+            start_method=start_method,
+            all_regimes=all_regimes,
+            stage_profiler=stage_profiler,
+            checkpoint=checkpoint,
+        )
+    )
+    return results, timings
+
+
+def _rank_chunk(chunk: List[Tuple[int, Tuple[str, ...]]], k: int, regime: str = "max") -> TopKCollector:
+    collector = TopKCollector(k)
+    for count, combo in chunk:
+        _, sys_contract = explore_combination(count, combo, regime=regime)
+        if sys_contract is not None:
+            margins = design_margins(combo, regime=regime)
+            collector.add(RankedDesign(margin_score(margins), count, tuple(combo), margins, sys_contract))
+    return collector
+
+
+def rank_designs(
+    combinations,
+    k: int = 50,
+    regime: str = "max",
+    processes: Optional[int] = None,
+    chunk_size: int = 16,
+    start_method: Optional[str] = None,
+) -> List[RankedDesign]:
+    """
+    Explore combinations in a process pool and keep the `k` designs with the largest margins.
+
+    Each successful design is scored by `design_margins`: its worst-case
+    margin against the processor assumptions and the top-level guarantee,
+    ties broken by the next smallest margins (see
+    `utils.design_ranking.margin_score`). Workers rank the designs of each
+    chunk in a `TopKCollector` and send back at most `k` of them, which the
+    parent merges, so memory and inter-process traffic do not grow with the
+    number of successful designs.
+
+    Args:
+        combinations: Sensor combinations, assigned to `outputs` in order. May be a lazy iterable.
+        k (int, optional): Number of designs kept. Defaults to 50.
+        regime (str, optional): One of `regimes`. Defaults to "max".
+        processes (Optional[int], optional): Number of workers. Defaults to `os.cpu_count()`.
+        chunk_size (int, optional): Combinations sent to a worker at a time. Defaults to 16.
+        start_method (Optional[str], optional): Multiprocessing start method. Defaults to the platform default.
+
+    Returns:
+        List[RankedDesign]: At most `k` designs, best first.
+    """
+    if not sensor_library:
+        load_library()
+    collector = TopKCollector(k)
+    context = multiprocessing.get_context(start_method)
+    pool = context.Pool(processes, initializer=_init_worker, initargs=(dict(library_args),))
+    try:
+        rank_chunk = functools.partial(_rank_chunk, k=k, regime=regime)
+        for chunk_collector in pool.imap_unordered(rank_chunk, _chunked(enumerate(combinations), chunk_size)):
+            collector.merge(chunk_collector)
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    return collector.best()
@@ -0,0 +1,173 @@
+import hashlib
+from typing import Dict, Hashable, List, Mapping, Optional, Sequence, Tuple
+import numpy as np
+from pacti.iocontract import IoContract, Var
+from pacti.terms.polyhedra import PolyhedralTerm, PolyhedralTermList
+
+# Same default as `utils.synbio_utils.remove_quantization_errors`
+DEFAULT_TOLERANCE = 1e-4
+# Significant digits kept in coefficients and constants
+DEFAULT_DIGITS = 6
+
+# `((variable, coefficient), ...), constant`, variables sorted by name
+CanonicalTerm = Tuple[Tuple[Tuple[str, float], ...], float]
+# `(inputs, outputs, assumptions, guarantees)`, each sorted
+CanonicalForm = Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[CanonicalTerm, ...], Tuple[CanonicalTerm, ...]]
+# Canonical form of the terms `0 <= b` with `b < 0`, which no behavior satisfies
+FALSE_TERM: CanonicalTerm = ((), -1.0)
+
+
+def _round(value: float, digits: int) -> float:
+    # Round to significant digits; adding 0.0 turns -0.0 into 0.0
+    return float(f"{value:.{digits}g}") + 0.0
+
+
+def canonical_terms(terms: Sequence[PolyhedralTerm], tolerance: float = DEFAULT_TOLERANCE,
+                    digits: int = DEFAULT_DIGITS,
+                    rename: Optional[Mapping[str, str]] = None) -> Tuple[CanonicalTerm, ...]:
+    """
+    Canonical form of the terms of a polyhedral term list
+
+    Like `utils.synbio_utils.remove_quantization_errors`, terms whose
+    absolute coefficients sum to less than `tolerance` are taken as
+    constant terms `0 <= b`: they are dropped if `b >= -tolerance`, since
+    they always hold, and become `FALSE_TERM` otherwise, since they never
+    do. Each other term `a @ x <= b` is scaled by `1 / max|a|`, which does
+    not change the set it defines, coefficients below `tolerance` after
+    scaling are dropped, and coefficients and constant are rounded to
+    `digits` significant digits. Duplicate terms are dropped, and the terms
+    are sorted.
+    Args:
+        terms (Sequence[PolyhedralTerm]): The terms, e.g. `contract.a.terms`
+        tolerance (float, optional): Quantization tolerance. Defaults to `DEFAULT_TOLERANCE`.
+        digits (int, optional): Significant digits kept. Defaults to `DEFAULT_DIGITS`.
+        rename (Optional[Mapping[str, str]], optional): New names of some variables. Defaults to None.
+
+    Returns:
+        Tuple[CanonicalTerm, ...]: The canonical terms
+    """
+    canonical = set()
+    for term in terms:
+        coeffs = [(str(var), float(coeff)) for var, coeff in term.variables.items()]
+        scale = max((abs(coeff) for _, coeff in coeffs), default=0.0)
+        if sum(abs(coeff) for _, coeff in coeffs) < tolerance:
+            if float(term.constant) < -tolerance:
+                canonical.add(FALSE_TERM)
+            continue
+        coeffs = [(name, coeff / scale) for name, coeff in coeffs if abs(coeff) >= tolerance * scale]
+        if rename:
+            coeffs = [(rename.get(name, name), coeff) for name, coeff in coeffs]
+        canonical.add((
+            tuple(sorted((name, _round(coeff, digits)) for name, coeff in coeffs)),
+            _round(float(term.constant) / scale, digits),
+        ))
+    return tuple(sorted(canonical))
+
+
+def canonical_form(contract: IoContract, tolerance: float = DEFAULT_TOLERANCE, digits: int = DEFAULT_DIGITS,
+                   rename: Optional[Mapping[str, str]] = None) -> CanonicalForm:
+    """
+    Canonical form of a polyhedral contract
+
+    Contracts that only differ by the order of their variables or terms,
+    by scaling of their terms, by duplicate terms or by coefficient noise
+    below `tolerance` and `digits` have the same canonical form. The form
+    is hashable and can be used as a dictionary key.
+
+    Contracts with the same canonical form are only nearly equal, so the
+    form is meant to measure redundancy (see `deduplicate`). Compositions
+    and stored results are shared on `exact_form` instead, which never
+    substitutes one contract for a different one.
+    Args:
+        contract (IoContract): A polyhedral contract
+        tolerance (float, optional): Quantization tolerance. Defaults to `DEFAULT_TOLERANCE`.
+        digits (int, optional): Significant digits kept. Defaults to `DEFAULT_DIGITS`.
+        rename (Optional[Mapping[str, str]], optional): New names of some variables, e.g. to compare
+                                                        contracts over different sensors. Defaults to None.
+
+    Returns:
+        CanonicalForm: Sorted input and output names, and canonical assumptions and guarantees
+    """
+    rename = rename or {}
+
+    def names(variables: Sequence[Var]) -> Tuple[str, ...]:
+        return tuple(sorted(rename.get(str(var), str(var)) for var in variables))
+
+    return (
+        names(contract.inputvars),
+        names(contract.outputvars),
+        canonical_terms(contract.a.terms, tolerance, digits, rename),
+        canonical_terms(contract.g.terms, tolerance, digits, rename),
+    )
+
+
+def exact_form(contract: IoContract) -> CanonicalForm:
+    """
+    Exact form of a polyhedral contract
+
+    Contracts with the same exact form have the same variables and the same
+    terms, coefficient for coefficient: only the order of variables and
+    terms and duplicate terms are ignored. Unlike `canonical_form`, nothing
+    is scaled, rounded or dropped, so contracts with the same exact form
+    can be used in place of one another.
+    Args:
+        contract (IoContract): A polyhedral contract
+
+    Returns:
+        CanonicalForm: Sorted input and output names, and sorted assumptions and guarantees
+    """
+    def terms(term_list: PolyhedralTermList) -> Tuple[CanonicalTerm, ...]:
+        return tuple(sorted({
+            (tuple(sorted((str(var), float(coeff)) for var, coeff in term.variables.items())), float(term.constant))
+            for term in term_list.terms
+        }))
+
+    return (
+        tuple(sorted(str(var) for var in contract.inputvars)),
+        tuple(sorted(str(var) for var in contract.outputvars)),
+        terms(contract.a),
+        terms(contract.g),
+    )
+
+
+def exact_hash(contract: IoContract) -> str:
+    """
+    Stable hash of the exact form of a contract
+
+    Args:
+        contract (IoContract): A polyhedral contract
+
+    Returns:
+        str: The SHA-256 of the exact form, in hexadecimal
+    """
+    return hashlib.sha256(repr(exact_form(contract)).encode()).hexdigest()
+
+
+def deduplicate(contracts: Sequence[Optional[IoContract]], tolerance: float = DEFAULT_TOLERANCE,
+                digits: int = DEFAULT_DIGITS) -> Tuple[List[IoContract], np.ndarray]:
+    """
+    Groups contracts by canonical form
+
+    Use it to measure how many designs are nearly equal, e.g. in a sweep's
+    results: the first contract of a class only approximates the others.
+    Args:
+        contracts (Sequence[Optional[IoContract]]): The contracts; None entries are kept as class -1
+        tolerance (float, optional): Quantization tolerance. Defaults to `DEFAULT_TOLERANCE`.
+        digits (int, optional): Significant digits kept. Defaults to `DEFAULT_DIGITS`.
+
+    Returns:
+        Tuple[List[IoContract], np.ndarray]: The first contract of each class, and the
+        class of each contract, so that `unique[classes[i]]` is nearly equal to `contracts[i]`
+    """
+    classes: Dict[Hashable, int] = {}
+    unique: List[IoContract] = []
+    index = np.full(len(contracts), -1, dtype=np.int64)
+    for i, contract in enumerate(contracts):
+        if contract is None:
+            continue
+        form = canonical_form(contract, tolerance, digits)
+        if form not in classes:
+            classes[form] = len(unique)
+            unique.append(contract)
+        index[i] = classes[form]
+    return unique, index
@@ -0,0 +1,263 @@
+import glob
+import json
+import os
+import pickle
+import time
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+from utils.composition_cache import CachedFailure
+
+# Files of a checkpoint directory
+_META_FILE = "meta.json"
+_RESULTS_FILE = "results.pkl"
+_CACHE_FILE = "cache.pkl"
+_WORKER_CACHE_PATTERN = "cache-*.pkl"
+# Raised when unpickling a file cut short by a crash
+_TRUNCATED_ERRORS = (EOFError, pickle.UnpicklingError, AttributeError, ValueError)
+
+
+def _atomic_pickle(obj: Any, path: str) -> None:
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, path)
+
+
+def _read_frames(path: str) -> Iterator[Any]:
+    # Pickles appended one after the other; a frame cut short by a crash ends the log
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except _TRUNCATED_ERRORS:
+                return
+
+
+class SweepCheckpoint:
+    """
+    Checkpoint of a design sweep, to resume it after the process is killed.
+
+    A checkpoint is a directory. The sweep (see `scalability.iter_explore`)
+    appends its results to it in batches, every `interval` seconds, and
+    each pool worker periodically saves the contents of its composition
+    cache. Appending batches keeps the cost of a checkpoint proportional to
+    the new results, and the sweep never waits on more than one write per
+    `interval`.
+
+    When resumed, the results of the completed combinations are read back
+    and these combinations are skipped, and the worker caches are merged
+    and preloaded by the new workers. Combinations are identified by their
+    position in the sweep, so a resumed sweep must enumerate the same
+    combinations in the same order; `completed()` checks that the sensors
+    match.
+
+    Args:
+        path (str): Checkpoint directory, created if needed.
+        interval (float, optional): Seconds between checkpoints. Defaults to 60.
+        resume (bool, optional): Resume from the checkpoint in `path`, if any. Otherwise any
+            checkpoint in `path` is discarded. Defaults to True.
+    """
+
+    def __init__(self, path: str, interval: float = 60, resume: bool = True):
+        self.path = path
+        self.interval = interval
+        self.resume = resume
+        self._pending: List[tuple] = []
+        self._last_write = time.monotonic()
+        self._completed: Optional[Dict[int, Tuple[str, ...]]] = None
+        self._restored: List[tuple] = []
+        os.makedirs(path, exist_ok=True)
+        if not resume:
+            self.discard()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Workers receive the configuration only
+        return {"path": self.path, "interval": self.interval, "resume": True}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._pending, self._last_write = [], time.monotonic()
+        self._completed, self._restored = None, []
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def discard(self) -> None:
+        """Delete the saved results, caches and metadata."""
+        names = [_META_FILE, _RESULTS_FILE, _CACHE_FILE]
+        files = [self._file(name) for name in names] + glob.glob(self._file(_WORKER_CACHE_PATTERN))
+        for file in files:
+            if os.path.exists(file):
+                os.remove(file)
+        self._pending.clear()
+        self._completed, self._restored = {}, []
+
+    def check_metadata(self, metadata: Dict[str, Any]) -> None:
+        """
+        Save the settings of the sweep, or check them against the saved ones.
+
+        Args:
+            metadata (Dict[str, Any]): JSON-serializable settings, e.g. the library arguments.
+
+        Raises:
+            ValueError: If the checkpoint was written by a sweep with other settings.
+        """
+        file = self._file(_META_FILE)
+        metadata = json.loads(json.dumps(metadata))
+        if os.path.exists(file):
+            with open(file) as f:
+                saved = json.load(f)
+            if saved != metadata:
+                raise ValueError(
+                    f"The checkpoint in {self.path} is for another sweep: {saved} instead of {metadata}. "
+                    "Use `resume=False` to discard it."
+                )
+            return
+        with open(file, "w") as f:
+            json.dump(metadata, f)
+
+    def _load(self) -> None:
+        self._completed, self._restored = {}, []
+        file = self._file(_RESULTS_FILE)
+        if not os.path.exists(file):
+            return
+        with open(file, "rb") as f:
+            complete = 0
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except _TRUNCATED_ERRORS:
+                    break
+                complete = f.tell()
+                for result in batch:
+                    self._completed[result[0]] = tuple(result[1])
+                    self._restored.append(result)
+            size = f.seek(0, os.SEEK_END)
+        if complete < size:
+            # Drop a batch cut short by a crash, so that new batches are appended after the complete ones
+            with open(file, "r+b") as f:
+                f.truncate(complete)
+
+    def completed(self, count: int, combo: Sequence[str]) -> bool:
+        """
+        Whether a combination was completed before the checkpoint.
+
+        Args:
+            count (int): The combination id.
+            combo (Sequence[str]): Its sensors.
+
+        Returns:
+            bool: True if the combination can be skipped.
+
+        Raises:
+            ValueError: If another combination was completed under this id.
+        """
+        if self._completed is None:
+            self._load()
+        saved = self._completed.get(count)
+        if saved is None:
+            return False
+        if saved != tuple(combo):
+            raise ValueError(
+                f"Combination {count} is {tuple(combo)}, but {saved} in the checkpoint in {self.path}: "
+                "resumed sweeps must explore the same combinations in the same order."
+            )
+        return True
+
+    def restored_results(self) -> List[tuple]:
+        """
+        The results saved before the checkpoint.
+
+        Returns:
+            List[tuple]: `(count, combo, instrumentation, result)` tuples, as yielded by
+            `scalability.iter_explore`.
+        """
+        if self._completed is None:
+            self._load()
+        return list(self._restored)
+
+    def add(self, result: tuple) -> None:
+        """
+        Record a completed combination, and write a checkpoint if `interval` has passed.
+
+        Args:
+            result (tuple): `(count, combo, instrumentation, result)`.
+        """
+        self._pending.append(result)
+        if time.monotonic() - self._last_write >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Append the pending results to the checkpoint."""
+        self._last_write = time.monotonic()
+        if not self._pending:
+            return
+        with open(self._file(_RESULTS_FILE), "ab") as f:
+            pickle.dump(self._pending, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = []
+
+    def save_cache(self, entries: List[Tuple[Hashable, Any]]) -> None:
+        """
+        Save the cache entries of this process, replacing the ones it saved before.
+
+        Args:
+            entries (List[Tuple[Hashable, Any]]): From `CompositionCache.entries()`.
+        """
+        try:
+            _atomic_pickle(entries, self._file(f"cache-{os.getpid()}.pkl"))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # Some cached error cannot be pickled: save the contracts only
+            entries = [(key, value) for key, value in entries if not isinstance(value, CachedFailure)]
+            _atomic_pickle(entries, self._file(f"cache-{os.getpid()}.pkl"))
+
+    def merge_caches(self, maxsize: Optional[int] = None) -> int:
+        """
+        Merge the caches saved by the workers into one file, read by `cache_entries()`.
+
+        Call it before starting the workers of a resumed sweep.
+
+        Args:
+            maxsize (Optional[int], optional): Keep at most this many entries. Defaults to None (all).
+
+        Returns:
+            int: The number of merged entries.
+        """
+        merged: Dict[Hashable, Any] = dict(self.cache_entries())
+        worker_files = sorted(glob.glob(self._file(_WORKER_CACHE_PATTERN)), key=os.path.getmtime)
+        for file in worker_files:
+            for frame in _read_frames(file):
+                merged.update(frame)
+        entries = list(merged.items())
+        if maxsize is not None:
+            entries = entries[-maxsize:]
+        _atomic_pickle(entries, self._file(_CACHE_FILE))
+        for file in worker_files:
+            os.remove(file)
+        return len(entries)
+
+    def cache_entries(self) -> List[Tuple[Hashable, Any]]:
+        """
+        The cache entries merged by `merge_caches()`.
+
+        Returns:
+            List[Tuple[Hashable, Any]]: `(key, value)` pairs, to pass to `CompositionCache.restore()`.
+        """
+        file = self._file(_CACHE_FILE)
+        if not os.path.exists(file):
+            return []
+        for entries in _read_frames(file):
+            return entries
+        return []
+
+    def time_to_save(self) -> bool:
+        """
+        Whether `interval` has passed since the last checkpoint of this process.
+
+        Returns:
+            bool: True once per `interval`; the next call returns False.
+        """
+        if time.monotonic() - self._last_write < self.interval:
+            return False
+        self._last_write = time.monotonic()
+        return True
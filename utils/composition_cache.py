@@ -0,0 +1,238 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, MutableMapping, Optional, Tuple
+
+# Returned by `CompositionCache._lookup` on a miss, since None is a valid cached value
+_MISSING = object()
+
+
+class CachedFailure:
+    """
+    Marker stored in a `CompositionCache` for compositions that raised.
+
+    Args:
+        error (Exception): The exception raised by the composition.
+    """
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+    def __repr__(self) -> str:
+        return f"CachedFailure({self.error!r})"
+
+
+class CompositionCache:
+    """
+    Size-bounded cache of composed sub-assemblies.
+
+    Keys are arbitrary hashable tuples, typically
+    `(processor, ((slot, sensor, regime), ...))`. Both successful compositions
+    and failures (as `CachedFailure`) are cached, so a failing sub-assembly
+    is only attempted once.
+
+    Entries are kept in a local LRU map. If a `store` mapping is given
+    (for example `multiprocessing.Manager().dict()`), entries are also written
+    through to it and looked up there on a local miss, which lets pool workers
+    share their results. The shared store is trimmed in FIFO order.
+
+    Args:
+        maxsize (int, optional): Maximum number of entries kept locally and in
+                                 the shared store. Defaults to 4096.
+        store (MutableMapping, optional): Shared backing mapping.
+                                          Defaults to None.
+    """
+
+    def __init__(self, maxsize: int = 4096, store: Optional[MutableMapping] = None):
+        if maxsize < 1:
+            raise ValueError("The cache `maxsize` must be at least 1.")
+        self.maxsize = maxsize
+        self._local: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._store = store
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Counters already returned by `take_stats()`, and counts cleared before being returned
+        self._reported = {"hits": 0, "misses": 0, "evictions": 0}
+        self._unreported = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @classmethod
+    def shared(cls, manager: Any, maxsize: int = 4096) -> "CompositionCache":
+        """
+        Create a cache whose entries are shared through a multiprocessing manager.
+
+        Args:
+            manager: A started `multiprocessing.Manager()`.
+            maxsize (int, optional): Maximum number of entries. Defaults to 4096.
+
+        Returns:
+            CompositionCache: A cache backed by `manager.dict()`.
+        """
+        return cls(maxsize=maxsize, store=manager.dict())
+
+    def __len__(self) -> int:
+        return len(self._local)
+
+    def __contains__(self, key: Hashable) -> bool:
+        if key in self._local:
+            return True
+        return self._store is not None and key in self._store
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Look up a cached entry, updating the hit/miss counters.
+
+        Args:
+            key (Hashable): The cache key.
+            default (optional): Returned on a miss. Defaults to None.
+
+        Returns:
+            The cached contract, a `CachedFailure`, or `default` on a miss.
+        """
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def _lookup(self, key: Hashable) -> Any:
+        with self._lock:
+            if key in self._local:
+                self._local.move_to_end(key)
+                self.hits += 1
+                return self._local[key]
+            if self._store is not None:
+                try:
+                    value = self._store[key]
+                except KeyError:
+                    pass
+                else:
+                    self.hits += 1
+                    self._put_local(key, value)
+                    return value
+            self.misses += 1
+            return _MISSING
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Store an entry locally and, if configured, in the shared store.
+
+        Args:
+            key (Hashable): The cache key.
+            value: A composed contract or a `CachedFailure`.
+        """
+        with self._lock:
+            self._put_local(key, value)
+            if self._store is not None:
+                self._store[key] = value
+                while len(self._store) > self.maxsize:
+                    try:
+                        self._store.pop(next(iter(self._store)), None)
+                    except (StopIteration, KeyError):
+                        break
+
+    def get_or_compose(self, key: Hashable, compose: Callable[[], Any]) -> Any:
+        """
+        Return the cached composition for `key`, computing it on a miss.
+
+        Exceptions raised by `compose` are cached and re-raised on every
+        later lookup of the same key.
+
+        Args:
+            key (Hashable): The cache key.
+            compose (Callable[[], Any]): Computes the composition.
+
+        Returns:
+            The composed contract.
+
+        Raises:
+            Exception: The (possibly cached) error raised by `compose`.
+        """
+        value = self._lookup(key)
+        if value is _MISSING:
+            try:
+                value = compose()
+            except Exception as e:
+                value = CachedFailure(e)
+            self.put(key, value)
+        if isinstance(value, CachedFailure):
+            raise value.error
+        return value
+
+    def clear(self, shared: bool = False) -> None:
+        """
+        Drop all local entries and reset the counters.
+
+        The shared store is left untouched unless `shared` is set, so lookups
+        after a local clear can still hit entries written by other processes.
+
+        Args:
+            shared (bool, optional): Also drop the entries of the shared store, for every
+                process using it. Defaults to False.
+        """
+        with self._lock:
+            for name, value in self._counters().items():
+                self._unreported[name] += value - self._reported[name]
+                self._reported[name] = 0
+            self._local.clear()
+            if shared and self._store is not None:
+                self._store.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def entries(self) -> List[Tuple[Hashable, Any]]:
+        """
+        The local entries, least recently used first, e.g. to checkpoint them.
+
+        Returns:
+            List[Tuple[Hashable, Any]]: `(key, value)` pairs.
+        """
+        with self._lock:
+            return list(self._local.items())
+
+    def restore(self, entries: Iterable[Tuple[Hashable, Any]]) -> None:
+        """
+        Add entries from `entries()`, without counting hits or misses.
+
+        Entries are added in order, so with more than `maxsize` entries
+        the last ones are kept.
+
+        Args:
+            entries (Iterable[Tuple[Hashable, Any]]): `(key, value)` pairs.
+        """
+        with self._lock:
+            for key, value in entries:
+                self._put_local(key, value)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Cache statistics of this process.
+
+        Returns:
+            Dict[str, int]: Hits, misses, evictions and current local size.
+        """
+        return {**self._counters(), "size": len(self._local)}
+
+    def take_stats(self) -> Dict[str, int]:
+        """
+        The hits, misses and evictions since the previous call, e.g. to add them to a profiler.
+
+        Unlike the differences of `stats()`, these also count the lookups made before a `clear()`.
+
+        Returns:
+            Dict[str, int]: The new hits, misses and evictions.
+        """
+        with self._lock:
+            counters = self._counters()
+            changes = {name: value - self._reported[name] + self._unreported[name] for name, value in counters.items()}
+            self._reported = counters
+            self._unreported = dict.fromkeys(counters, 0)
+            return changes
+
+    def _counters(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def _put_local(self, key: Hashable, value: Any) -> None:
+        self._local[key] = value
+        self._local.move_to_end(key)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,154 @@
+from typing import List, Mapping, Sequence, Tuple
+import numpy as np
+from scipy.optimize import linprog
+from pacti.iocontract import Var
+from pacti.contracts import PolyhedralIoContract
+from pacti.terms.polyhedra import PolyhedralTerm, PolyhedralTermList
+
+
+def termlist_from_matrix(matrix: np.ndarray, vector: np.ndarray,
+                         variables: Sequence[Var]) -> PolyhedralTermList:
+    """
+    Builds the polyhedral term list `matrix @ variables <= vector`
+
+    Args:
+        matrix (np.ndarray): Coefficients, one row per term and one
+                             column per variable
+        vector (np.ndarray): Right-hand side constant of each term
+        variables (Sequence[Var]): The variables of the columns of `matrix`
+
+    Returns:
+        PolyhedralTermList: One term per row of `matrix`
+    """
+    terms = []
+    for row, constant in zip(np.asarray(matrix, dtype=float).tolist(),
+                             np.asarray(vector, dtype=float).tolist()):
+        terms.append(PolyhedralTerm({var: coeff for var, coeff in zip(variables, row) if coeff != 0},
+                                    constant))
+    return PolyhedralTermList(terms)
+
+
+def contract_from_matrices(a_matrix: np.ndarray, a_vector: np.ndarray,
+                           g_matrix: np.ndarray, g_vector: np.ndarray,
+                           input_vars: List[str],
+                           output_vars: List[str]) -> PolyhedralIoContract:
+    """
+    Builds a polyhedral contract from coefficient matrices, without parsing strings
+
+    The columns of both matrices are the variables `input_vars + output_vars`.
+    Args:
+        a_matrix (np.ndarray): Assumption coefficients
+        a_vector (np.ndarray): Assumption constants
+        g_matrix (np.ndarray): Guarantee coefficients
+        g_vector (np.ndarray): Guarantee constants
+        input_vars (List[str]): Input variables of the contract
+        output_vars (List[str]): Output variables of the contract
+
+    Returns:
+        PolyhedralIoContract: The contract
+        `a_matrix @ x <= a_vector` / `g_matrix @ x <= g_vector`
+    """
+    inputs = [Var(v) for v in input_vars]
+    outputs = [Var(v) for v in output_vars]
+    variables = inputs + outputs
+    return PolyhedralIoContract(
+        assumptions=termlist_from_matrix(a_matrix, a_vector, variables),
+        guarantees=termlist_from_matrix(g_matrix, g_vector, variables),
+        input_vars=inputs,
+        output_vars=outputs,
+    )
+
+
+def termlist_to_matrix(terms: Sequence[PolyhedralTerm],
+                       variables: Sequence[Var]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reads the coefficients of a polyhedral term list, the inverse of `termlist_from_matrix`
+
+    Args:
+        terms (Sequence[PolyhedralTerm]): The terms, e.g. `contract.g.terms`
+        variables (Sequence[Var]): The variables of the columns of the matrix.
+                                   Must include every variable of `terms`
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: `matrix` and `vector` such that the
+        terms are `matrix @ variables <= vector`
+    """
+    column = {str(var): i for i, var in enumerate(variables)}
+    matrix = np.zeros((len(terms), len(variables)))
+    vector = np.zeros(len(terms))
+    for row, term in enumerate(terms):
+        for var, coeff in term.variables.items():
+            matrix[row, column[str(var)]] = float(coeff)
+        vector[row] = float(term.constant)
+    return matrix, vector
+
+
+def output_bounds_at(contract: PolyhedralIoContract, output: str,
+                     points: Mapping[str, np.ndarray],
+                     tolerance: float = 1e-9) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Bounds that the guarantees of a contract place on an output, at given input values
+
+    The values of `points` are broadcast against each other, so a grid of
+    input levels is evaluated in one call. When `output` is the only
+    variable of the guarantees without a value, the bounds are read off
+    the guarantee rows with NumPy. Otherwise, the remaining variables are
+    eliminated by solving one pair of linear programs per point, in which
+    inputs without a value range over the assumptions.
+
+    Args:
+        contract (PolyhedralIoContract): The contract, typically a composed system
+        output (str): The output to bound
+        points (Mapping[str, np.ndarray]): Value (or array of values) of each input
+        tolerance (float, optional): Slack allowed on guarantee rows that do not
+                                     involve `output`. Defaults to 1e-9.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Lower and upper bounds of `output` at each point,
+        with the broadcast shape of `points`. Unbounded sides are infinite; points where
+        the guarantees cannot hold have a lower bound above the upper bound.
+    """
+    fixed = [Var(var) for var in points]
+    names = {str(var) for var in fixed}
+    free = [Var(output)]
+    for term in contract.g.terms:
+        for var in term.variables:
+            if str(var) not in names and all(str(var) != str(v) for v in free):
+                free.append(var)
+    terms = list(contract.g.terms)
+    if len(free) > 1:
+        terms += contract.a.terms
+        for term in contract.a.terms:
+            for var in term.variables:
+                if str(var) not in names and all(str(var) != str(v) for v in free):
+                    free.append(var)
+    matrix, vector = termlist_to_matrix(terms, fixed + free)
+    values = np.stack(np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in points.values()]), axis=-1)
+    # Right-hand side of `free_matrix @ free <= rhs` at each point
+    rhs = vector - values @ matrix[:, :len(fixed)].T
+    free_matrix = matrix[:, len(fixed):]
+    shape = rhs.shape[:-1]
+    if len(free) == 1:
+        coeff = free_matrix[:, 0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = rhs / coeff
+        hi = np.min(np.where(coeff > 0, ratio, np.inf), axis=-1, initial=np.inf)
+        lo = np.max(np.where(coeff < 0, ratio, -np.inf), axis=-1, initial=-np.inf)
+        violated = np.any((coeff == 0) & (rhs < -tolerance), axis=-1)
+        return np.where(violated, np.inf, lo), np.where(violated, -np.inf, hi)
+    lo = np.empty(shape)
+    hi = np.empty(shape)
+    objective = np.zeros(len(free))
+    objective[0] = 1.0
+    for index in np.ndindex(*shape):
+        bounds = []
+        for sign in (1.0, -1.0):
+            res = linprog(sign * objective, A_ub=free_matrix, b_ub=rhs[index], bounds=(None, None))
+            if res.status == 2:
+                bounds.append(sign * np.inf)
+            elif res.status == 3:
+                bounds.append(-sign * np.inf)
+            else:
+                bounds.append(sign * res.fun)
+        lo[index], hi[index] = bounds
+    return lo, hi
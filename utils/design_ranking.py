@@ -0,0 +1,175 @@
+import heapq
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from scipy.optimize import linprog
+from pacti.contracts import PolyhedralIoContract
+from pacti.terms.polyhedra import PolyhedralTerm
+from utils.contract_numerics import termlist_to_matrix
+
+
+def specification_margins(components: Sequence[PolyhedralIoContract],
+                          specification: Mapping[str, PolyhedralTerm],
+                          relative: bool = True) -> Dict[str, float]:
+    """
+    Worst-case slack of each specification term over the behaviors of a circuit
+
+    The behaviors are the values of all signals allowed by the guarantees
+    of the components, when the external inputs (the variables no
+    component drives) meet the assumptions on them. For each term
+    `a @ x <= b` of `specification`, the slack `b - a @ x` is minimized
+    over the behaviors with one linear program. A negative margin means
+    that some behavior violates the term.
+    Args:
+        components (Sequence[PolyhedralIoContract]): The contracts of the circuit, e.g. the
+                                                     sensors on their slots and the processors
+        specification (Mapping[str, PolyhedralTerm]): The terms to check, by name
+        relative (bool, optional): Divide each slack by `|b|` (when not zero), so that
+                                   terms on signals of different scales are comparable.
+                                   Defaults to True.
+
+    Returns:
+        Dict[str, float]: The margin of each term, `-inf` if it is unbounded
+        and NaN if the components have no behavior
+    """
+    driven = {str(var) for contract in components for var in contract.outputvars}
+    terms = [term for contract in components for term in contract.g.terms]
+    terms += [
+        term for contract in components for term in contract.a.terms
+        if not any(str(var) in driven for var in term.variables)
+    ]
+    variables = {}
+    for term in list(terms) + list(specification.values()):
+        for var in term.variables:
+            variables.setdefault(str(var), var)
+    matrix, vector = termlist_to_matrix(terms, list(variables.values()))
+    margins = {}
+    for name, term in specification.items():
+        (objective,), (constant,) = termlist_to_matrix([term], list(variables.values()))
+        # max a @ x, i.e. min -a @ x, over the behaviors
+        res = linprog(-objective, A_ub=matrix, b_ub=vector, bounds=(None, None))
+        if res.status == 2:
+            margins[name] = np.nan
+            continue
+        slack = constant + res.fun if res.status == 0 else -np.inf
+        margins[name] = slack / abs(constant) if relative and constant != 0 else slack
+    return margins
+
+
+def margin_score(margins: Mapping[str, float]) -> Tuple[float, ...]:
+    """
+    Ranking key of a design, from its `specification_margins`
+
+    Designs are compared by their worst-case margin first, then by their
+    second smallest margin, and so on, so that terms that are tight for
+    every design (e.g. a guarantee copied from the top-level processor)
+    do not tie all designs. NaN margins count as `-inf`.
+    Args:
+        margins (Mapping[str, float]): The margins of the design
+
+    Returns:
+        Tuple[float, ...]: The margins in increasing order; larger keys are better designs
+    """
+    return tuple(sorted(-np.inf if np.isnan(m) else float(m) for m in margins.values()))
+
+
+class RankedDesign(NamedTuple):
+    """A successful design and its margins, as kept by `TopKCollector`."""
+
+    # `margin_score` of the margins
+    score: Tuple[float, ...]
+    count: int
+    combo: Tuple[str, ...]
+    margins: Dict[str, float]
+    # The composed system contract
+    contract: Any
+
+    @property
+    def margin(self) -> float:
+        """The worst-case margin of the design."""
+        return self.score[0] if self.score else np.inf
+
+
+class TopKCollector:
+    """
+    Keeps the `k` best designs of a stream in a bounded min-heap.
+
+    Adding a design costs `O(log k)` and memory stays `O(k)` however many
+    designs are explored. Collectors are picklable and can be merged, so
+    each pool worker ranks its own designs and the parent merges the
+    collectors it receives. Ties are broken in favor of the lower
+    combination id, so the result does not depend on the order in which
+    designs arrive.
+
+    Args:
+        k (int): Number of designs kept.
+    """
+
+    def __init__(self, k: int):
+        if k < 1:
+            raise ValueError("`k` must be at least 1.")
+        self.k = k
+        # Min-heap of `(score, -count, design)`: the root is the worst design kept
+        self._heap: List[Tuple[Tuple[float, ...], int, RankedDesign]] = []
+        self.offered = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def threshold(self) -> Optional[Tuple[float, ...]]:
+        """
+        The score a design must beat to be kept.
+
+        Returns:
+            Optional[Tuple[float, ...]]: The score of the worst design kept, or None while fewer than `k` are kept.
+        """
+        return self._heap[0][0] if len(self._heap) >= self.k else None
+
+    def add(self, design: RankedDesign) -> bool:
+        """
+        Offer a design.
+
+        Args:
+            design (RankedDesign): The design.
+
+        Returns:
+            bool: Whether the design is kept, for now.
+        """
+        self.offered += 1
+        entry = (design.score, -design.count, design)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+            return True
+        if entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def extend(self, designs: Iterable[RankedDesign]) -> None:
+        """
+        Offer several designs.
+
+        Args:
+            designs (Iterable[RankedDesign]): The designs.
+        """
+        for design in designs:
+            self.add(design)
+
+    def merge(self, other: "TopKCollector") -> None:
+        """
+        Add the designs kept by another collector, e.g. the one of a pool worker.
+
+        Args:
+            other (TopKCollector): The collector to add.
+        """
+        offered = self.offered
+        self.extend(entry[2] for entry in other._heap)
+        self.offered = offered + other.offered
+
+    def best(self) -> List[RankedDesign]:
+        """
+        The designs kept, best first.
+
+        Returns:
+            List[RankedDesign]: At most `k` designs.
+        """
+        return [entry[2] for entry in sorted(self._heap, key=lambda entry: entry[:2], reverse=True)]
@@ -0,0 +1,176 @@
+from math import comb, perm
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Set, Tuple
+import numpy as np
+
+
+class SearchStatistics:
+    """
+    Counters of a branch-and-bound design search.
+
+    Attributes:
+        evaluated (int): Complete designs that reached the top-level composition.
+        found (int): Designs whose top-level composition succeeded.
+        pruned (int): Complete designs skipped because a partial design failed.
+        group_compositions (int): Sub-assembly compositions attempted.
+        nogood_hits (int): Sub-assemblies skipped because they were known to fail.
+    """
+
+    def __init__(self) -> None:
+        self.evaluated = 0
+        self.found = 0
+        self.pruned = 0
+        self.group_compositions = 0
+        self.nogood_hits = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"SearchStatistics(evaluated={self.evaluated}, found={self.found}, pruned={self.pruned}, "
+            f"group_compositions={self.group_compositions}, nogood_hits={self.nogood_hits})"
+        )
+
+
+def branch_and_bound(
+    sensors: Sequence[str],
+    groups: Sequence[Sequence[str]],
+    compose_group: Callable[[int, Tuple[str, ...]], Any],
+    compose_top: Callable[[List[Any]], Any],
+    slot_masks: Optional[np.ndarray] = None,
+    nogood: Optional[Set[Tuple[int, Tuple[str, ...]]]] = None,
+    statistics: Optional[SearchStatistics] = None,
+) -> Iterator[Tuple[Tuple[str, ...], Any]]:
+    """
+    Enumerate sensor combinations slot by slot, pruning failed partial designs.
+
+    Sensors are assigned to the slots of `groups`, in order, as
+    `itertools.combinations(sensors, k)` would. As soon as all slots of a
+    group are filled, the group's sub-assembly is composed. If that fails,
+    the group's sensors are added to the `nogood` set and every combination
+    extending the partial design is skipped. Later branches consult `nogood`
+    before composing the same group again.
+
+    Args:
+        sensors (Sequence[str]): The library sensors, in enumeration order.
+        groups (Sequence[Sequence[str]]): The slots of each sub-assembly, e.g. `[("x1", "x2"), ("x3", "x4")]`.
+        compose_group (Callable[[int, Tuple[str, ...]], Any]): Composes group `i` from its sensors.
+            Raises on failure.
+        compose_top (Callable[[List[Any]], Any]): Composes the group results into the design.
+            Raises on failure.
+        slot_masks (Optional[np.ndarray], optional): Boolean `(slots, sensors)` array of sensors allowed
+            on each slot, e.g. from `utils.feasibility.feasible_on_slot`. Defaults to None.
+        nogood (Optional[Set[Tuple[int, Tuple[str, ...]]]], optional): Known failing `(group, sensors)`,
+            updated in place. Defaults to None.
+        statistics (Optional[SearchStatistics], optional): Counters, updated in place. Defaults to None.
+
+    Yields:
+        Tuple[Tuple[str, ...], Any]: Each successful combination and its composed design.
+    """
+    if nogood is None:
+        nogood = set()
+    if statistics is None:
+        statistics = SearchStatistics()
+    n = len(sensors)
+    k = sum(len(group) for group in groups)
+    # Group index of each slot, and whether the slot completes its group
+    slot_group = [g for g, group in enumerate(groups) for _ in group]
+    closes_group = [i == len(group) - 1 for group in groups for i in range(len(group))]
+
+    def extend(position: int, last: int, chosen: List[int], results: List[Any]) -> Iterator:
+        if position == k:
+            statistics.evaluated += 1
+            try:
+                design = compose_top(results)
+            except Exception:
+                return
+            statistics.found += 1
+            yield tuple(sensors[i] for i in chosen), design
+            return
+        for i in range(last + 1, n - (k - position) + 1):
+            # Complete designs below this branch
+            subtree = comb(n - i - 1, k - position - 1)
+            if slot_masks is not None and not slot_masks[position, i]:
+                statistics.pruned += subtree
+                continue
+            chosen.append(i)
+            group_results = results
+            if closes_group[position]:
+                g = slot_group[position]
+                key = (g, tuple(sensors[j] for j in chosen[position + 1 - len(groups[g]):]))
+                if key in nogood:
+                    statistics.nogood_hits += 1
+                    statistics.pruned += subtree
+                    chosen.pop()
+                    continue
+                statistics.group_compositions += 1
+                try:
+                    group_results = results + [compose_group(g, key[1])]
+                except Exception:
+                    nogood.add(key)
+                    statistics.pruned += subtree
+                    chosen.pop()
+                    continue
+            yield from extend(position + 1, i, chosen, group_results)
+            chosen.pop()
+
+    yield from extend(0, -1, [], [])
+
+
+def iter_slot_assignments(
+    sensors: Sequence[str],
+    slots: Sequence[str],
+    symmetric_classes: Sequence[Sequence[str]] = (),
+    slot_masks: Optional[np.ndarray] = None,
+    statistics: Optional[SearchStatistics] = None,
+) -> Iterator[Tuple[str, ...]]:
+    """
+    Enumerate ordered assignments of distinct sensors to slots, up to slot symmetries.
+
+    Unlike `itertools.combinations`, every ordering of a sensor set is
+    considered, since slots generally place different requirements on their
+    sensor. Within each class of `symmetric_classes` (interchangeable slots,
+    e.g. from `CircuitTopology.symmetric_slot_classes`), only the assignment
+    with sensors in library order is produced. Sensors excluded by
+    `slot_masks` are never placed, and the skipped assignments are counted
+    in `statistics.pruned`.
+
+    Args:
+        sensors (Sequence[str]): The library sensors.
+        slots (Sequence[str]): The slots to fill, in order.
+        symmetric_classes (Sequence[Sequence[str]], optional): Groups of interchangeable slots. Defaults to ().
+        slot_masks (Optional[np.ndarray], optional): Boolean `(slots, sensors)` array of sensors allowed
+            on each slot. Defaults to None.
+        statistics (Optional[SearchStatistics], optional): Counters, updated in place. Defaults to None.
+
+    Yields:
+        Tuple[str, ...]: The sensor placed on each slot, in slot order.
+    """
+    n = len(sensors)
+    k = len(slots)
+    # Previous slot of the same symmetry class, whose sensor must come earlier in the library
+    previous_in_class: List[Optional[int]] = [None] * k
+    position = {slot: i for i, slot in enumerate(slots)}
+    for symmetric in symmetric_classes:
+        members = sorted(position[slot] for slot in symmetric)
+        for before, after in zip(members, members[1:]):
+            previous_in_class[after] = before
+
+    def assignments_below(depth: int) -> int:
+        # Ordered assignments of the remaining slots, ignoring symmetry
+        return perm(n - depth - 1, k - depth - 1)
+
+    def extend(depth: int, chosen: List[int]) -> Iterator[Tuple[str, ...]]:
+        if depth == k:
+            yield tuple(sensors[i] for i in chosen)
+            return
+        lowest = 0 if previous_in_class[depth] is None else chosen[previous_in_class[depth]] + 1
+        for i in range(lowest, n):
+            if i in chosen:
+                continue
+            if slot_masks is not None and not slot_masks[depth, i]:
+                if statistics is not None:
+                    statistics.pruned += assignments_below(depth)
+                continue
+            chosen.append(i)
+            yield from extend(depth + 1, chosen)
+            chosen.pop()
+
+    yield from extend(0, [])
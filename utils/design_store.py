@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import sqlite3
+from multiprocessing import util
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from utils.failures import failure_record
+from utils.result_sinks import ResultSink
+
+
+class DesignStore(ResultSink):
+    """
+    Append-only store of explored designs and their errors, in a single SQLite file.
+
+    Each process (e.g. each pool worker) buffers its records and appends them
+    in one transaction per `batch_size` records, so a sweep creates one file
+    instead of one file per combination. The database runs in WAL mode, so
+    several workers can append while others read. Buffers are also flushed
+    when a worker process exits normally, or on `flush()`/`close()`.
+
+    Contracts are stored once per serialization in a "contracts" table,
+    keyed by the SHA-256 of their JSON, which designs reference by hash:
+    designs that compose to identical contracts share one row, and each
+    design reads back exactly the contract it stored.
+
+    Errors are saved as structured failure records (see
+    `utils.failures.failure_record`): stage, failure class, processor,
+    slots, sensors and duration, along with the Pacti message. Records are
+    indexed by combination id and can be queried with `get()` and
+    `errors()` once flushed, or indexed in bulk with
+    `utils.failures.FailureIndex.from_store`.
+
+    Args:
+        path (str): Database file.
+        batch_size (int, optional): Records buffered before a write. Defaults to 100.
+        timeout (float, optional): Seconds to wait for another writer's lock. Defaults to 60.
+    """
+
+    def __init__(self, path: str, batch_size: int = 100, timeout: float = 60):
+        self.path = path
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._pid: Optional[int] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._designs: List[Tuple[int, str, Optional[str], Optional[str]]] = []
+        self._errors: List[tuple] = []
+        self._contracts: Dict[str, str] = {}
+        # Hashes of the contracts this process already wrote or buffered
+        self._stored_hashes: Set[str] = set()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Workers receive the configuration only and open their own connection
+        return {"path": self.path, "batch_size": self.batch_size, "timeout": self.timeout}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(**state)
+
+    def add(self, count: int, combo: Sequence[str], contract: Any = None, errors: Sequence[Any] = ()) -> None:
+        """
+        Buffer one explored combination.
+
+        Args:
+            count (int): The combination id.
+            combo (Sequence[str]): The sensors of the design.
+            contract (optional): The composed contract, if it should be stored. Defaults to None.
+            errors (Sequence[Any], optional): Errors raised while exploring the design, preferably
+                `CompositionFailure`. Defaults to ().
+        """
+        self._ensure_open()
+        serialized = json.dumps(contract.to_dict()) if contract is not None else None
+        self._append_design(int(count), json.dumps([str(s) for s in combo]), serialized)
+        for position, error in enumerate(errors):
+            record = failure_record(count, error)
+            self._errors.append((
+                record.count, position, record.stage, record.failure_class, record.processor,
+                json.dumps(list(record.slots)), json.dumps(list(record.sensors)), record.duration,
+                record.error_type, record.message,
+            ))
+        if len(self._designs) >= self.batch_size:
+            self.flush()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._ensure_open()
+        contract = json.dumps(record["contract"]) if record["contract"] is not None else None
+        self._append_design(record["count"], json.dumps(record["combo"]), contract)
+        if len(self._designs) >= self.batch_size:
+            self.flush()
+
+    def _append_design(self, count: int, combo: str, contract: Optional[str]) -> None:
+        digest = None
+        if contract is not None:
+            digest = hashlib.sha256(contract.encode()).hexdigest()
+            if digest not in self._stored_hashes:
+                self._stored_hashes.add(digest)
+                self._contracts[digest] = contract
+        self._designs.append((count, combo, None, digest))
+
+    def flush(self) -> None:
+        """Append buffered records in one transaction."""
+        if not (self._designs or self._errors) or self._connection is None:
+            return
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO contracts (hash, contract) VALUES (?, ?)", self._contracts.items()
+            )
+            self._connection.executemany(
+                "INSERT INTO designs (count, combo, contract, contract_hash) VALUES (?, ?, ?, ?)", self._designs
+            )
+            self._connection.executemany(
+                "INSERT INTO failures (count, position, stage, failure_class, processor, slots, sensors, duration, "
+                "type, message) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._errors,
+            )
+        self._designs.clear()
+        self._errors.clear()
+        self._contracts.clear()
+
+    def close(self) -> None:
+        self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            self._pid = None
+
+    def get(self, count: int) -> Optional[Dict[str, Any]]:
+        """
+        The latest stored record of a combination.
+
+        Args:
+            count (int): The combination id.
+
+        Returns:
+            Optional[Dict[str, Any]]: `{"count", "combo", "contract"}`, the contract
+            as a dictionary (or None), or None if the combination is not stored.
+        """
+        self._ensure_open()
+        row = self._connection.execute(
+            "SELECT designs.combo, COALESCE(designs.contract, contracts.contract) FROM designs "
+            "LEFT JOIN contracts ON contracts.hash = designs.contract_hash "
+            "WHERE designs.count = ? ORDER BY designs.id DESC LIMIT 1",
+            (int(count),),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"count": int(count), "combo": json.loads(row[0]), "contract": json.loads(row[1]) if row[1] else None}
+
+    def errors(self, count: int) -> List[Dict[str, Any]]:
+        """
+        The failure records stored for a combination.
+
+        Args:
+            count (int): The combination id.
+
+        Returns:
+            List[Dict[str, Any]]: `{"stage", "failure_class", "processor", "slots", "sensors", "duration",
+            "type", "message"}` for each error, in the order they were raised.
+        """
+        self._ensure_open()
+        rows = self._connection.execute(
+            "SELECT stage, failure_class, processor, slots, sensors, duration, type, message "
+            "FROM failures WHERE count = ? ORDER BY id",
+            (int(count),),
+        ).fetchall()
+        return [
+            {
+                "stage": stage, "failure_class": failure_class, "processor": processor,
+                "slots": json.loads(slots), "sensors": json.loads(sensors), "duration": duration,
+                "type": error_type, "message": message,
+            }
+            for stage, failure_class, processor, slots, sensors, duration, error_type, message in rows
+        ]
+
+    def _ensure_open(self) -> None:
+        if self._connection is not None and self._pid == os.getpid():
+            return
+        # A connection inherited through fork cannot be used: open a new one
+        self._designs, self._errors, self._contracts, self._stored_hashes = [], [], {}, set()
+        self._pid = os.getpid()
+        self._connection = sqlite3.connect(self.path, timeout=self.timeout)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS designs "
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT, count INTEGER, combo TEXT, contract TEXT, contract_hash TEXT)"
+            )
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(designs)")]
+            if "contract_hash" not in columns:
+                # Stores created before contracts were deduplicated
+                self._connection.execute("ALTER TABLE designs ADD COLUMN contract_hash TEXT")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS contracts (hash TEXT PRIMARY KEY, contract TEXT)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS failures "
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT, count INTEGER, position INTEGER, stage TEXT, "
+                "failure_class TEXT, processor TEXT, slots TEXT, sensors TEXT, duration REAL, type TEXT, message TEXT)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS designs_count ON designs (count)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS failures_count ON failures (count)")
+        # Flush what is left when a pool worker exits
+        util.Finalize(self, self.flush, exitpriority=10)
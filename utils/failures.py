@@ -0,0 +1,331 @@
+import json
+import sqlite3
+import traceback
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+
+# Failure classes, from the Pacti error raised by a failed stage
+UNSATISFIABLE_ASSUMPTIONS = "unsatisfiable_assumptions"
+EMPTY_GUARANTEES = "empty_guarantees"
+MISSING_VARIABLE = "missing_variable"
+ELIMINATION_FAILED = "elimination_failed"
+LP_ERROR = "lp_error"
+INCOMPATIBLE_IO = "incompatible_io"
+OTHER = "other"
+FAILURE_CLASSES = (
+    UNSATISFIABLE_ASSUMPTIONS, EMPTY_GUARANTEES, MISSING_VARIABLE, ELIMINATION_FAILED, LP_ERROR, INCOMPATIBLE_IO, OTHER
+)
+
+# Messages of the errors Pacti raises when a linear program fails, without further context
+_LP_MESSAGES = (
+    "Constraints are unfeasible", "Cannot decide emptiness", "Unbounded",
+    "Context has insufficient information", "Found context will produce empty transformation",
+)
+_MISSING_VARIABLE_MESSAGES = (
+    "are not inputs", "neither inputs nor outputs", "were not assigned values", "is not a term variable",
+)
+
+
+def classify_failure(error: BaseException) -> str:
+    """
+    Failure class of an error raised by a Pacti operation
+
+    The class is read from the exception type, the outermost message and
+    the Pacti function that raised it: an "unsatisfiable in context" error
+    raised while refining assumptions means that the assumptions cannot
+    be met, while one raised while relaxing guarantees or building a
+    contract means that the guarantees are empty under the assumptions.
+    Args:
+        error (BaseException): The error, or a `CompositionFailure`
+
+    Returns:
+        str: One of `FAILURE_CLASSES`
+    """
+    if isinstance(error, CompositionFailure):
+        return error.failure_class
+    message = str(error)
+    raised_in = ""
+    frames = traceback.extract_tb(error.__traceback__) if error.__traceback__ is not None else []
+    if frames:
+        raised_in = frames[-1].name
+    if isinstance(error, (AssertionError, KeyError)) or any(m in message for m in _MISSING_VARIABLE_MESSAGES):
+        return MISSING_VARIABLE
+    if "unsatisfiable" in message:
+        if raised_in in ("elim_vars_by_relaxing", "simplify", "__init__"):
+            return EMPTY_GUARANTEES
+        return UNSATISFIABLE_ASSUMPTIONS
+    if "eliminat" in message or "Tactic" in message:
+        return ELIMINATION_FAILED
+    if any(m in message for m in _LP_MESSAGES):
+        return LP_ERROR
+    if type(error).__name__ == "IncompatibleArgsError":
+        return INCOMPATIBLE_IO
+    return OTHER
+
+
+class CompositionFailure(Exception):
+    """
+    Error raised by one stage of the composition of a design.
+
+    Args:
+        stage (str): The failed stage, e.g. "pair_compose" or "final_compose".
+        processor (str): The processor being composed.
+        slots (Tuple[str, ...]): The slots below the processor.
+        sensors (Tuple[str, ...]): The sensors placed on those slots.
+        duration (float): Wall time of the stage until it failed, in seconds.
+        cause (BaseException): The error raised by Pacti.
+        failure_class (Optional[str], optional): One of `FAILURE_CLASSES`. Defaults to `classify_failure(cause)`.
+    """
+
+    def __init__(self, stage: str, processor: str, slots: Tuple[str, ...], sensors: Tuple[str, ...],
+                 duration: float, cause: BaseException, failure_class: Optional[str] = None):
+        if failure_class is None:
+            # Classify now, while the traceback of the cause is available (it is not pickled)
+            failure_class = classify_failure(cause)
+        super().__init__(stage, processor, tuple(slots), tuple(sensors), duration, cause, failure_class)
+        self.stage = stage
+        self.processor = processor
+        self.slots = tuple(slots)
+        self.sensors = tuple(sensors)
+        self.duration = duration
+        self.cause = cause
+        self.failure_class = failure_class
+
+    def __str__(self) -> str:
+        cause = f"{type(self.cause).__name__}: {self.cause}"
+        return f"{self.stage} of {self.processor} failed ({self.failure_class}): {cause}"
+
+
+class FailureRecord(NamedTuple):
+    """Structured record of one failure of one design."""
+
+    count: int
+    stage: str
+    failure_class: str
+    processor: Optional[str]
+    slots: Tuple[str, ...]
+    sensors: Tuple[str, ...]
+    duration: float
+    # Type and message of the Pacti error, for inspection only
+    error_type: str
+    message: str
+
+
+def failure_record(count: int, error: BaseException) -> FailureRecord:
+    """
+    Structured record of an error raised while exploring a design
+
+    Args:
+        count (int): The combination id
+        error (BaseException): A `CompositionFailure`, or any other error
+
+    Returns:
+        FailureRecord: The record; errors other than `CompositionFailure` get stage "unknown"
+    """
+    if isinstance(error, CompositionFailure):
+        return FailureRecord(int(count), error.stage, error.failure_class, error.processor, error.slots,
+                             error.sensors, float(error.duration), type(error.cause).__name__, str(error.cause))
+    return FailureRecord(int(count), "unknown", classify_failure(error), None, (), (), float("nan"),
+                         type(error).__name__, str(error))
+
+
+class FailureIndex:
+    """
+    Compact columnar index of failure records.
+
+    Stages, classes, processors, sensors and slots are dictionary-encoded
+    as small integers, and the variable-length sensors of each record are
+    stored as one flat array with offsets, so counting failures by sensor,
+    stage or class over millions of records is a few vectorized passes.
+    Messages are not indexed; they stay in the `DesignStore`.
+    """
+
+    _CATEGORIES = ("stage", "failure_class", "processor", "sensor", "slot", "error_type")
+
+    def __init__(self) -> None:
+        self.categories: Dict[str, List[str]] = {name: [] for name in self._CATEGORIES}
+        self._codes: Dict[str, Dict[str, int]] = {name: {} for name in self._CATEGORIES}
+        self._columns: Dict[str, List[Any]] = {
+            name: [] for name in ("count", "stage", "failure_class", "processor", "error_type", "duration")
+        }
+        self._sensor_codes: List[int] = []
+        self._slot_codes: List[int] = []
+        self._offsets: List[int] = [0]
+
+    def __len__(self) -> int:
+        return len(self._columns["count"])
+
+    def _code(self, category: str, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        codes = self._codes[category]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self.categories[category].append(value)
+        return code
+
+    def add(self, record: FailureRecord) -> None:
+        """
+        Add one record.
+
+        Args:
+            record (FailureRecord): The record, e.g. from `failure_record`.
+        """
+        columns = self._columns
+        columns["count"].append(record.count)
+        columns["stage"].append(self._code("stage", record.stage))
+        columns["failure_class"].append(self._code("failure_class", record.failure_class))
+        columns["processor"].append(self._code("processor", record.processor))
+        columns["error_type"].append(self._code("error_type", record.error_type))
+        columns["duration"].append(record.duration)
+        self._sensor_codes.extend(self._code("sensor", sensor) for sensor in record.sensors)
+        self._slot_codes.extend(self._code("slot", slot) for slot in record.slots)
+        self._offsets.append(len(self._sensor_codes))
+
+    def extend(self, records: Iterable[FailureRecord]) -> None:
+        """
+        Add many records.
+
+        Args:
+            records (Iterable[FailureRecord]): The records.
+        """
+        for record in records:
+            self.add(record)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """
+        The columns of the index.
+
+        Returns:
+            Dict[str, np.ndarray]: One entry per record for "count", "stage", "failure_class",
+            "processor", "error_type" (codes into `categories`, -1 for None) and "duration";
+            "sensors" and "slots" (codes) of all records, split by "offsets".
+        """
+        arrays = {
+            "count": np.asarray(self._columns["count"], dtype=np.int64),
+            "duration": np.asarray(self._columns["duration"], dtype=np.float32),
+            "sensors": np.asarray(self._sensor_codes, dtype=np.int32),
+            "slots": np.asarray(self._slot_codes, dtype=np.int32),
+            "offsets": np.asarray(self._offsets, dtype=np.int64),
+        }
+        for name in ("stage", "failure_class", "processor", "error_type"):
+            arrays[name] = np.asarray(self._columns[name], dtype=np.int16)
+        return arrays
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        The records as a data frame, one row per record.
+
+        Returns:
+            pd.DataFrame: Categorical "stage", "failure_class", "processor" and "error_type"
+            columns, plus "count" and "duration".
+        """
+        arrays = self.arrays()
+        frame = pd.DataFrame({"count": arrays["count"], "duration": arrays["duration"]})
+        for name in ("stage", "failure_class", "processor", "error_type"):
+            frame[name] = pd.Categorical.from_codes(arrays[name], categories=self.categories[name])
+        return frame
+
+    def _record_mask(self, arrays: Dict[str, np.ndarray], stage: Optional[str],
+                     failure_class: Optional[str]) -> np.ndarray:
+        mask = np.ones(len(arrays["count"]), dtype=bool)
+        for category, value in (("stage", stage), ("failure_class", failure_class)):
+            if value is not None:
+                mask &= arrays[category] == self._codes[category].get(value, -2)
+        return mask
+
+    def sensor_counts(self, stage: Optional[str] = None, failure_class: Optional[str] = None) -> pd.Series:
+        """
+        Number of failures that involve each sensor.
+
+        For example, `sensor_counts(stage="processor_compose")` tells which
+        sensors cause most failures when composing the first-level processors.
+
+        Args:
+            stage (Optional[str], optional): Only count failures of this stage. Defaults to None.
+            failure_class (Optional[str], optional): Only count failures of this class. Defaults to None.
+
+        Returns:
+            pd.Series: The count of each sensor, most frequent first.
+        """
+        arrays = self.arrays()
+        lengths = np.diff(arrays["offsets"])
+        selected = np.repeat(self._record_mask(arrays, stage, failure_class), lengths)
+        counts = np.bincount(arrays["sensors"][selected], minlength=len(self.categories["sensor"]))
+        return pd.Series(counts, index=self.categories["sensor"], name="failures").sort_values(ascending=False)
+
+    def counts(self, by: Sequence[str] = ("stage", "failure_class")) -> pd.Series:
+        """
+        Number of failures by stage, class, processor or error type.
+
+        Args:
+            by (Sequence[str], optional): The columns to group by. Defaults to ("stage", "failure_class").
+
+        Returns:
+            pd.Series: The count of each group, most frequent first.
+        """
+        frame = self.to_frame()
+        return frame.groupby(list(by), observed=True).size().sort_values(ascending=False)
+
+    def save(self, path: str) -> None:
+        """
+        Write the index as a compressed NumPy archive.
+
+        Args:
+            path (str): Output file, usually ending in ".npz".
+        """
+        categories = {f"categories_{name}": np.asarray(values, dtype=str) for name, values in self.categories.items()}
+        np.savez_compressed(path, **self.arrays(), **categories)
+
+    @classmethod
+    def load(cls, path: str) -> "FailureIndex":
+        """
+        Read an index written by `save`.
+
+        Args:
+            path (str): The archive.
+
+        Returns:
+            FailureIndex: The index.
+        """
+        index = cls()
+        with np.load(path) as data:
+            for name in cls._CATEGORIES:
+                values = [str(value) for value in data[f"categories_{name}"]]
+                index.categories[name] = values
+                index._codes[name] = {value: code for code, value in enumerate(values)}
+            for name in index._columns:
+                index._columns[name] = data[name].tolist()
+            index._sensor_codes = data["sensors"].tolist()
+            index._slot_codes = data["slots"].tolist()
+            index._offsets = data["offsets"].tolist()
+        return index
+
+    @classmethod
+    def from_store(cls, path: str) -> "FailureIndex":
+        """
+        Index the failures saved in a `DesignStore` database.
+
+        Args:
+            path (str): The database file, e.g. "data/designs.sqlite".
+
+        Returns:
+            FailureIndex: The index.
+        """
+        index = cls()
+        connection = sqlite3.connect(path)
+        try:
+            rows = connection.execute(
+                "SELECT count, stage, failure_class, processor, slots, sensors, duration, type, message "
+                "FROM failures ORDER BY id"
+            )
+            for count, stage, failure_class, processor, slots, sensors, duration, error_type, message in rows:
+                index.add(FailureRecord(
+                    count, stage, failure_class, processor, tuple(json.loads(slots)), tuple(json.loads(sensors)),
+                    float("nan") if duration is None else duration, error_type, message,
+                ))
+        finally:
+            connection.close()
+        return index
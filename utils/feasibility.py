@@ -0,0 +1,126 @@
+from typing import Dict, Iterable, List, Sequence, Tuple
+import numpy as np
+from pacti.iocontract import IoContract
+
+# Slack under which a bound is treated as met, to stay on the safe side of Pacti's own tolerances
+FEASIBILITY_TOLERANCE = 1e-6
+
+
+def output_bounds(a_matrix: np.ndarray, a_vector: np.ndarray,
+                  g_matrix: np.ndarray, g_vector: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Output intervals guaranteed by a batch of single-input, single-output contracts
+
+    The matrices are those of `utils.synbio_utils.sensor_contract_matrices`,
+    with columns `(input, output)`. For each contract, the input interval is
+    read from its assumptions, and each guarantee row bounding the output is
+    maximized (upper bounds) or minimized (lower bounds) over that interval.
+    Args:
+        a_matrix (np.ndarray): Assumption coefficients, shape `(n, rows, 2)`
+        a_vector (np.ndarray): Assumption constants, shape `(n, rows)`
+        g_matrix (np.ndarray): Guarantee coefficients, shape `(n, rows, 2)`
+        g_vector (np.ndarray): Guarantee constants, shape `(n, rows)`
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Lower and upper output
+        bounds, and whether the output bounds depend on the input. Bounds
+        are exact for input-independent contracts and enclose the
+        achievable outputs otherwise.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Input interval from the assumptions `c_u * u <= b`
+        c_u = a_matrix[..., 0]
+        u_lo = np.max(np.where(c_u < 0, a_vector / c_u, -np.inf), axis=1, initial=-np.inf)
+        u_hi = np.min(np.where(c_u > 0, a_vector / c_u, np.inf), axis=1, initial=np.inf)
+        # Guarantee rows `g_u * u + g_y * y <= b`, i.e. y <= (b - g_u * u) / g_y if g_y > 0
+        g_u = g_matrix[..., 0]
+        g_y = g_matrix[..., 1]
+        at_lo = (g_vector - g_u * u_lo[:, None]) / g_y
+        at_hi = (g_vector - g_u * u_hi[:, None]) / g_y
+        at_lo = np.where(g_u == 0, g_vector / g_y, at_lo)
+        at_hi = np.where(g_u == 0, g_vector / g_y, at_hi)
+        upper = np.where(g_y > 0, np.fmax(at_lo, at_hi), np.inf)
+        lower = np.where(g_y < 0, np.fmin(at_lo, at_hi), -np.inf)
+    hi = np.min(np.nan_to_num(upper, nan=np.inf), axis=1, initial=np.inf)
+    lo = np.max(np.nan_to_num(lower, nan=-np.inf), axis=1, initial=-np.inf)
+    input_dependent = np.any((g_u != 0) & (g_y != 0), axis=1)
+    return lo, hi, input_dependent
+
+
+def input_requirements(contract: IoContract) -> Dict[str, Tuple[float, float]]:
+    """
+    Bounds that a contract assumes on each of its inputs
+
+    Only single-variable assumptions (`c * x <= b`) are taken into account,
+    which is sufficient for a sound pre-screen: every behavior accepted by
+    the contract meets these bounds.
+    Args:
+        contract (IoContract): A polyhedral contract
+
+    Returns:
+        Dict[str, Tuple[float, float]]: `(lower, upper)` for each constrained input
+    """
+    requirements: Dict[str, Tuple[float, float]] = {}
+    for term in contract.a.terms:
+        if len(term.variables) != 1:
+            continue
+        (var, coeff), = term.variables.items()
+        lo, hi = requirements.get(str(var), (-np.inf, np.inf))
+        if coeff > 0:
+            hi = min(hi, term.constant / coeff)
+        elif coeff < 0:
+            lo = max(lo, term.constant / coeff)
+        requirements[str(var)] = (lo, hi)
+    return requirements
+
+
+def feasible_on_slot(lo: np.ndarray, hi: np.ndarray, input_dependent: np.ndarray,
+                     required_lo: float, required_hi: float,
+                     tolerance: float = FEASIBILITY_TOLERANCE) -> np.ndarray:
+    """
+    Whether each sensor can possibly meet the bounds a processor assumes on its input
+
+    A sensor is rejected if none of its outputs meets the bounds, or if its
+    output does not depend on its input and some of its outputs violate them
+    (Pacti can then neither discharge the assumption nor move it onto the
+    sensor input).
+    Args:
+        lo (np.ndarray): Lower output bound of each sensor
+        hi (np.ndarray): Upper output bound of each sensor
+        input_dependent (np.ndarray): Whether the output bounds depend on the input
+        required_lo (float): Lower bound assumed by the processor
+        required_hi (float): Upper bound assumed by the processor
+        tolerance (float, optional): Slack granted to the sensor.
+                                     Defaults to `FEASIBILITY_TOLERANCE`.
+
+    Returns:
+        np.ndarray: A boolean mask over the sensors
+    """
+    no_overlap = (hi < required_lo - tolerance) | (lo > required_hi + tolerance)
+    not_contained = (lo < required_lo - tolerance) | (hi > required_hi + tolerance)
+    return ~(no_overlap | (~input_dependent & not_contained))
+
+
+def prescreen_combinations(combinations: Iterable[Sequence[str]], sensor_names: List[str],
+                           slot_masks: np.ndarray) -> Tuple[List[Tuple[str, ...]], int]:
+    """
+    Drops the combinations in which some sensor is infeasible on its slot
+
+    Args:
+        combinations (Iterable[Sequence[str]]): Sensors assigned to the slots, in slot order
+        sensor_names (List[str]): The sensors indexing the columns of `slot_masks`
+        slot_masks (np.ndarray): Boolean array of shape `(slots, sensors)`,
+                                 as given by `feasible_on_slot` for each slot
+
+    Returns:
+        Tuple[List[Tuple[str, ...]], int]: The surviving combinations
+                                           and the number of pruned ones
+    """
+    combinations = [tuple(combo) for combo in combinations]
+    if not combinations:
+        return [], 0
+    index = {name: i for i, name in enumerate(sensor_names)}
+    idx = np.array([[index[s] for s in combo] for combo in combinations])
+    keep = np.all(slot_masks[np.arange(idx.shape[1]), idx], axis=1)
+    survivors = [combo for combo, ok in zip(combinations, keep.tolist()) if ok]
+    return survivors, len(combinations) - len(survivors)
@@ -0,0 +1,222 @@
+import functools
+import itertools
+import multiprocessing
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from scipy.optimize import linprog
+from pacti.contracts import PolyhedralIoContract
+from pacti.iocontract import Var
+from utils.contract_numerics import contract_from_matrices, termlist_to_matrix
+
+# Constants of `examples/sequential_circuit_parameters.ipynb`
+DEFAULT_PARAMETERS = {
+    # Upper threshold
+    "F_1_u_max": 5.0,
+    "F_1_u_H": 4.0,
+    "p2_H": 0.6,
+    "F_2_p_1_max": 4.1,
+    "F_2_p_1_H": 4.0,
+    # Lower threshold
+    "F_1_u_min": 0.0,
+    "F_1_u_L": 2.0,
+    "p2_L": 0.4,
+    "F_2_p_1_min": 0.0,
+    "F_2_p_1_L": 0.1,
+}
+
+# The J1/J2 plane of the missing specification
+REGION_VARS = ("J1", "J2")
+
+
+# The constants that each threshold depends on
+LEVEL_PARAMETERS = {
+    "H": ("F_1_u_max", "F_1_u_H", "p2_H", "F_2_p_1_max", "F_2_p_1_H"),
+    "L": ("F_1_u_min", "F_1_u_L", "p2_L", "F_2_p_1_min", "F_2_p_1_L"),
+}
+
+
+def sequential_circuit_contracts(params: Mapping[str, float]) -> Dict[str, PolyhedralIoContract]:
+    """
+    Contracts of the sequential circuit example, for given constants
+
+    Only the coefficients depend on `params`: the contracts are built from
+    coefficient matrices with a fixed structure, without parsing strings.
+    Args:
+        params (Mapping[str, float]): The constants, named as in `DEFAULT_PARAMETERS`
+
+    Returns:
+        Dict[str, PolyhedralIoContract]: `top_level_objective`, `sigma1` and `sigma2`
+        for the upper ("_H") and lower ("_L") thresholds
+    """
+    contracts = {}
+    for level in ("H", "L"):
+        level_contracts = _level_contracts(level, *(params[name] for name in LEVEL_PARAMETERS[level]))
+        for name, contract in zip(("top_level_objective", "sigma1", "sigma2"), level_contracts):
+            contracts[f"{name}_{level}"] = contract
+    return contracts
+
+
+def _level_contracts(level: str, f1_a: float, f1_b: float, p2: float,
+                     f2_a: float, f2_b: float) -> Tuple[PolyhedralIoContract, ...]:
+    # Constants in the order of `LEVEL_PARAMETERS[level]`
+    if level == "H":
+        # p2_H d1 + (p2_H - 1) d2 <= -p2_H
+        objective = ([[p2, p2 - 1]], [-p2])
+        f1_hi, f1_lo, f2_hi, f2_lo = f1_a, f1_b, f2_a, f2_b
+    else:
+        # -p2_L d1 + (1 - p2_L) d2 <= p2_L
+        objective = ([[-p2, 1 - p2]], [p2])
+        f1_lo, f1_hi, f2_lo, f2_hi = f1_a, f1_b, f2_a, f2_b
+    no_assumption = (np.zeros((0, 3)), np.zeros(0))
+    top_level_objective = contract_from_matrices(
+        np.zeros((0, 2)), np.zeros(0), np.array(objective[0]), np.array(objective[1]),
+        input_vars=[], output_vars=["d1", "d2"])
+    # Columns (d2, d1, J1): f1_lo J1 <= d1 <= f1_hi J1
+    sigma1 = contract_from_matrices(
+        *no_assumption, np.array([[0, 1, -f1_hi], [0, -1, f1_lo]]), np.zeros(2),
+        input_vars=["d2"], output_vars=["d1", "J1"])
+    # Columns (d1, d2, J2): f2_lo J2 <= d2 <= f2_hi J2
+    sigma2 = contract_from_matrices(
+        *no_assumption, np.array([[0, 1, -f2_hi], [0, -1, f2_lo]]), np.zeros(2),
+        input_vars=["d1"], output_vars=["d2", "J2"])
+    return top_level_objective, sigma1, sigma2
+
+
+@functools.lru_cache(maxsize=1024)
+def threshold_spec(level: str, *constants: float) -> PolyhedralIoContract:
+    """
+    Missing J1/J2 specification for one threshold
+
+    `sigma1` and `sigma2` are composed and quotiented out of the top-level
+    objective. Results are cached on the constants of the threshold, so a
+    sweep that does not vary them reuses the quotient.
+    Args:
+        level (str): "H" (upper threshold) or "L" (lower threshold)
+        *constants (float): The constants of `LEVEL_PARAMETERS[level]`, in order
+
+    Returns:
+        PolyhedralIoContract: The quotient, over `J1` and `J2`
+    """
+    top_level_objective, sigma1, sigma2 = _level_contracts(level, *constants)
+    system_spec = sigma1.compose(sigma2, vars_to_keep=["d1", "d2"])
+    return top_level_objective.quotient(system_spec)
+
+
+def missing_spec(params: Mapping[str, float]) -> PolyhedralIoContract:
+    """
+    Specification of the J1/J2 parameters meeting both thresholds
+
+    This is the pipeline of the example notebook: the quotients of the lower
+    and upper thresholds (see `threshold_spec`) are merged.
+    Args:
+        params (Mapping[str, float]): The constants, named as in `DEFAULT_PARAMETERS`
+
+    Returns:
+        PolyhedralIoContract: The merged missing specification, over `J1` and `J2`
+    """
+    system_l_threshold, system_h_threshold = (
+        threshold_spec(level, *(float(params[name]) for name in LEVEL_PARAMETERS[level])) for level in ("L", "H")
+    )
+    return system_l_threshold.merge(system_h_threshold)
+
+
+class SweepPoint(NamedTuple):
+    """Outcome of the pipeline at one point of a sweep."""
+
+    # Whether some J1/J2 meets both the assumptions and guarantees of the missing spec
+    feasible: bool
+    # Region `matrix @ (J1, J2) <= vector`, or None if the pipeline failed
+    region: Optional[Tuple[np.ndarray, np.ndarray]]
+    # `[[J1 min, J1 max], [J2 min, J2 max]]` over the region, NaN if infeasible
+    bounds: np.ndarray
+    # The error raised by Pacti, if any
+    error: Optional[str]
+
+
+def evaluate_point(params: Mapping[str, float]) -> SweepPoint:
+    """
+    Runs the compose/quotient/merge pipeline at one point and extracts the J1/J2 region
+
+    Args:
+        params (Mapping[str, float]): The constants, named as in `DEFAULT_PARAMETERS`
+
+    Returns:
+        SweepPoint: Feasibility, region and bounding box of the J1/J2 parameters
+    """
+    bounds = np.full((len(REGION_VARS), 2), np.nan)
+    try:
+        spec = missing_spec(params)
+    except Exception as e:
+        return SweepPoint(False, None, bounds, f"{type(e).__name__}: {e}")
+    variables = [Var(v) for v in REGION_VARS]
+    matrix, vector = termlist_to_matrix(list(spec.a.terms) + list(spec.g.terms), variables)
+    feasible = linprog(np.zeros(len(variables)), A_ub=matrix, b_ub=vector, bounds=(None, None)).status != 2
+    if feasible:
+        for i in range(len(variables)):
+            for j, sign in enumerate((1.0, -1.0)):
+                objective = np.zeros(len(variables))
+                objective[i] = sign
+                res = linprog(objective, A_ub=matrix, b_ub=vector, bounds=(None, None))
+                # Unbounded below when minimizing (sign 1) or above when maximizing (sign -1)
+                bounds[i, j] = sign * res.fun if res.status == 0 else -sign * np.inf
+    return SweepPoint(feasible, (matrix, vector), bounds, None)
+
+
+class SweepResult(NamedTuple):
+    """Outcome of a parameter sweep, as arrays over the grid."""
+
+    # The swept constants and their values, in grid axis order
+    axes: Dict[str, np.ndarray]
+    # Boolean feasibility map
+    feasible: np.ndarray
+    # `[[J1 min, J1 max], [J2 min, J2 max]]` at each point, shape `grid + (2, 2)`
+    bounds: np.ndarray
+    # `SweepPoint.region` at each point (object array)
+    regions: np.ndarray
+    # Pacti error at each point, or None (object array)
+    errors: np.ndarray
+
+
+def sweep(grid: Mapping[str, Sequence[float]], base: Optional[Mapping[str, float]] = None,
+          processes: Optional[int] = None, chunksize: int = 16) -> SweepResult:
+    """
+    Evaluates the missing J1/J2 specification over a grid of constants, in parallel
+
+    Args:
+        grid (Mapping[str, Sequence[float]]): Values of each swept constant,
+                                              e.g. `{"p2_H": np.linspace(0.5, 0.9, 20)}`
+        base (Optional[Mapping[str, float]], optional): Values of the other constants.
+                                                       Defaults to `DEFAULT_PARAMETERS`.
+        processes (Optional[int], optional): Number of worker processes, None for `os.cpu_count()`,
+                                             1 to run in this process. Defaults to None.
+        chunksize (int, optional): Points sent to a worker at a time. Defaults to 16.
+
+    Returns:
+        SweepResult: Feasibility map, J1/J2 bounds, regions and errors over the grid
+    """
+    base = dict(DEFAULT_PARAMETERS if base is None else base)
+    unknown = [name for name in grid if name not in base]
+    if unknown:
+        raise ValueError(f"Unknown parameters {unknown}, expected some of {list(base)}.")
+    axes = {name: np.asarray(values, dtype=float) for name, values in grid.items()}
+    shape = tuple(len(values) for values in axes.values())
+    points: List[Dict[str, float]] = [
+        {**base, **dict(zip(axes, map(float, values)))} for values in itertools.product(*axes.values())
+    ]
+    if processes == 1:
+        outcomes = [evaluate_point(point) for point in points]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            outcomes = pool.map(evaluate_point, points, chunksize=chunksize)
+    regions = np.empty(len(outcomes), dtype=object)
+    errors = np.empty(len(outcomes), dtype=object)
+    for i, outcome in enumerate(outcomes):
+        regions[i] = outcome.region
+        errors[i] = outcome.error
+    return SweepResult(
+        axes=axes,
+        feasible=np.array([outcome.feasible for outcome in outcomes], dtype=bool).reshape(shape),
+        bounds=np.array([outcome.bounds for outcome in outcomes]).reshape(shape + (len(REGION_VARS), 2)),
+        regions=regions.reshape(shape),
+        errors=errors.reshape(shape),
+    )
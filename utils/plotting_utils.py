@@ -6,6 +6,20 @@ from typing import List
 import matplotlib.pyplot as plt
 from matplotlib.figure import Figure as MplFigure
 import matplotlib as mpl
+import multiprocessing
+import os
+from typing import Dict, Optional, Sequence, Tuple, Union
+import pandas as pd
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.lines import Line2D
+from matplotlib.patches import Patch
+
+# Colors and labels of the OFF, linear and saturation regimes, as in `utils.synbio_utils.display_sensor_contracts`
+REGIME_STYLES = {
+    "off": {"color": "r", "label": "OFF", "linestyle": "--"},
+    "lin": {"color": "#006400", "label": "Linear", "linestyle": "-"},
+    "max": {"color": "blue", "label": "Saturation", "linestyle": "--"},
+}
 
 def stitch_mpl_plots(plots: List[MplFigure], show: bool = True, ax: mpl.pyplot.Axes = None, **kwargs) -> MplFigure:
     """
@@ -87,3 +101,250 @@ def stitch_mpl_plots(plots: List[MplFigure], show: bool = True, ax: mpl.pyplot.A
         plt.show()
 
     return stitched_figure, ax
+
+
+def sensor_envelopes(df: pd.DataFrame, std: Optional[Union[float, np.ndarray]] = None,
+                     xlim: Tuple[float, float] = (1e-3, 1e4)) -> Dict[str, np.ndarray]:
+    """
+    Vertices of the OFF, linear and saturation envelopes of every sensor of a table
+
+    The envelopes are those drawn by `display_sensor_contracts` (a single
+    line per regime) or, with `std`, by `display_sensor_contracts_range`
+    (a band per regime, between the bounds of `create_sensor_contracts2`),
+    computed for all sensors at once.
+    Args:
+        df (pd.DataFrame): Marionette data, e.g. `data/marionette_data.csv`
+        std (Optional[Union[float, np.ndarray]], optional): Relative spread of leak and ymax,
+                                                           per sensor or for all, e.g. `df["std"]`.
+                                                           Defaults to None (lines only).
+        xlim (Tuple[float, float], optional): Input range the OFF and saturation regimes extend to.
+                                              Defaults to (1e-3, 1e4).
+
+    Returns:
+        Dict[str, np.ndarray]: For each regime, the lower and upper bound lines, shape `(n, 2, 2, 2)`
+        (sensor, bound, point, xy), and "bands", the band polygons of each regime, shape `(n, 3, 4, 2)`.
+        Lower and upper lines coincide without `std`. "thresholds" holds `start` and `K`, shape `(n, 2)`.
+    """
+    leak = df["ymin (RPUx10-3)"].to_numpy(dtype=float) * 1e-3
+    start = df["start"].to_numpy(dtype=float)
+    K = df["K (µM)"].to_numpy(dtype=float)
+    ymax = df["ymax Linear"].to_numpy(dtype=float)
+    spread = np.zeros(len(df)) if std is None else np.broadcast_to(np.asarray(std, dtype=float), len(df))
+    # The bounds of `create_sensor_contracts2`: low leak with high ymax, and high leak with low ymax
+    leak_bounds = np.stack([leak * (1 - spread), leak * (1 + spread)], axis=1)
+    ymax_bounds = np.stack([ymax * (1 + spread), ymax * (1 - spread)], axis=1)
+    x_low = np.full_like(start, xlim[0])
+    x_high = np.full_like(start, xlim[1])
+
+    def segments(x0: np.ndarray, y0: np.ndarray, x1: np.ndarray, y1: np.ndarray) -> np.ndarray:
+        # `(n, 2, 2, 2)` from the end points of the lower and upper bounds
+        first = np.stack([np.broadcast_to(x0[:, None], y0.shape), y0], axis=-1)
+        last = np.stack([np.broadcast_to(x1[:, None], y1.shape), y1], axis=-1)
+        return np.stack([first, last], axis=2)
+
+    lines = {
+        "off": segments(x_low, leak_bounds, start, leak_bounds),
+        "lin": segments(start, leak_bounds, K, ymax_bounds),
+        "max": segments(K, ymax_bounds, x_high, ymax_bounds),
+    }
+    # Each band goes along its lower bound, then back along its upper bound
+    bands = np.stack([np.concatenate([line[:, 0], line[:, 1, ::-1]], axis=1) for line in lines.values()], axis=1)
+    return {**lines, "bands": bands, "thresholds": np.stack([start, K], axis=1)}
+
+
+class SensorGrid:
+    """
+    Reusable grid of axes on which pages of sensors are drawn.
+
+    The figure, its axes, their shared log scales and limits, their ticks
+    and the legend are created once; `draw()` only replaces the
+    collections and labels of the previous page. Matplotlib creates tick
+    artists the first time a figure is drawn, which is most of the cost of
+    rendering a page, so saving many pages with one grid is several times
+    faster than creating a figure per page. The figure is created without
+    `pyplot` and can be saved by any process without an interactive backend.
+
+    Args:
+        nrows (int): Rows of axes.
+        ncols (int): Axes per row.
+        bands (bool, optional): Whether pages are drawn with `std` bands, which sets the legend. Defaults to False.
+        xlim (Tuple[float, float], optional): Input axis limits. Defaults to (1e-3, 1e4).
+        ylim (Tuple[float, float], optional): Output axis limits. Defaults to (1e-3, 1e2).
+        figsize (Optional[Tuple[float, float]], optional): Figure size. Defaults to 6.4 x 6.7 inches per axes.
+        fontsize (float, optional): Size of labels and ticks. Defaults to 16.
+        minor_ticks (bool, optional): Draw the minor ticks of the log axes, which are several times
+            more expensive to render than the rest of a page. Defaults to True.
+        alpha (float, optional): Opacity of the bands. Defaults to 0.2.
+        lw (float, optional): Line width. Defaults to 2.
+    """
+
+    def __init__(self, nrows: int, ncols: int, bands: bool = False, xlim: Tuple[float, float] = (1e-3, 1e4),
+                 ylim: Tuple[float, float] = (1e-3, 1e2), figsize: Optional[Tuple[float, float]] = None,
+                 fontsize: float = 16, minor_ticks: bool = True, alpha: float = 0.2, lw: float = 2):
+        self.bands = bands
+        self.xlim = xlim
+        self.ylim = ylim
+        self.fontsize = fontsize
+        self.alpha = alpha
+        self.lw = lw
+        self.figure = MplFigure(figsize=figsize or (6.4 * ncols, 6.7 * nrows))
+        self.axes = self.figure.subplots(nrows=nrows, ncols=ncols, sharex=True, sharey=True, squeeze=False).ravel()
+        self.ncols = ncols
+        # Scales and limits are shared, so they are set once
+        self.axes[0].set_xscale("log")
+        self.axes[0].set_yscale("log")
+        self.axes[0].set_xlim(*xlim)
+        self.axes[0].set_ylim(*ylim)
+        for i, ax in enumerate(self.axes):
+            ax.tick_params(axis="both", which="major", labelsize=fontsize)
+            if not minor_ticks:
+                ax.minorticks_off()
+            if i % ncols == 0:
+                ax.set_ylabel("Output", fontsize=fontsize)
+        handles = [
+            Patch(facecolor=style["color"], alpha=alpha, label=f"{style['label']} Region") if bands
+            else Line2D([], [], color=style["color"], lw=lw, ls=style["linestyle"], label=style["label"])
+            for style in REGIME_STYLES.values()
+        ]
+        self.figure.legend(handles=handles, loc="upper center", ncol=len(handles), fontsize=fontsize)
+        self._collections: List[mpl.collections.Collection] = []
+
+    def draw(self, df: pd.DataFrame, std: Optional[Union[float, np.ndarray]] = None) -> MplFigure:
+        """
+        Draws one page of sensors, replacing the previous page.
+
+        Each axes gets one `LineCollection` per regime, plus one `PolyCollection`
+        per regime for the bands, from the envelopes of `sensor_envelopes`.
+
+        Args:
+            df (pd.DataFrame): Marionette data, one axes per row, labeled with its "Inducer".
+            std (Optional[Union[float, np.ndarray]], optional): Relative spread of leak and ymax.
+                Required if the grid has `bands`. Defaults to None.
+
+        Returns:
+            MplFigure: The figure of the grid.
+        """
+        if len(df) > len(self.axes):
+            raise ValueError(f"The grid has {len(self.axes)} axes, not enough for {len(df)} sensors.")
+        if self.bands != (std is not None):
+            raise ValueError("`std` must be given if and only if the grid draws bands.")
+        for collection in self._collections:
+            collection.remove()
+        self._collections = []
+        envelopes = sensor_envelopes(df, std, self.xlim)
+        thresholds = envelopes["thresholds"]
+        # Vertical dotted lines at `start` and `K`, over the whole output range
+        markers = np.stack([
+            np.stack([thresholds, np.full_like(thresholds, self.ylim[0])], axis=-1),
+            np.stack([thresholds, np.full_like(thresholds, self.ylim[1])], axis=-1),
+        ], axis=2)
+        names = [str(name) for name in df["Inducer"]]
+        for i, ax in enumerate(self.axes):
+            if i >= len(df):
+                ax.set_axis_off()
+                continue
+            ax.set_axis_on()
+            for j, (regime, style) in enumerate(REGIME_STYLES.items()):
+                if self.bands:
+                    self._collections.append(ax.add_collection(
+                        PolyCollection(envelopes["bands"][i, j:j + 1], facecolors=style["color"], edgecolors="none",
+                                       alpha=self.alpha), autolim=False))
+                self._collections.append(ax.add_collection(
+                    LineCollection(envelopes[regime][i], colors=style["color"], linewidths=self.lw,
+                                   linestyles=style["linestyle"]), autolim=False))
+            self._collections.append(ax.add_collection(
+                LineCollection(markers[i], colors="k", linestyles="dotted", linewidths=1), autolim=False))
+            ax.set_xlabel(names[i], fontsize=self.fontsize)
+        return self.figure
+
+
+def draw_sensor_grid(df: pd.DataFrame, std: Optional[Union[float, np.ndarray]] = None, ncols: int = 5,
+                     **kwargs) -> MplFigure:
+    """
+    Draws the regimes of every sensor of a table in a grid of axes, with matplotlib collections
+
+    This is the grid of `display_sensor_contracts` (or, with `std`,
+    `display_sensor_contracts_range`) plots of the notebook, drawn in
+    batch on a `SensorGrid`: the envelopes are computed at once, the axes
+    share their scales and limits, and a single legend is drawn.
+    Args:
+        df (pd.DataFrame): Marionette data, one axes per row, labeled with its "Inducer"
+        std (Optional[Union[float, np.ndarray]], optional): Relative spread of leak and ymax, to draw
+                                                           bands, e.g. `df["std"]`. Defaults to None.
+        ncols (int, optional): Axes per row of the grid. Defaults to 5.
+        **kwargs: Passed to `SensorGrid`, e.g. `ylim` or `minor_ticks`
+
+    Returns:
+        MplFigure: The figure
+    """
+    ncols = max(1, min(ncols, len(df)))
+    grid = SensorGrid(-(-len(df) // ncols), ncols, bands=std is not None, **kwargs)
+    return grid.draw(df, std)
+
+
+# Grids of this process, reused for every page of the same shape and style
+_grids: Dict[tuple, SensorGrid] = {}
+
+
+def _render_page(task: tuple) -> List[str]:
+    records, stem, formats, dpi, ncols, with_std, kwargs = task
+    page = pd.DataFrame.from_records(records)
+    nrows = -(-len(page) // ncols)
+    key = (nrows, ncols, with_std, tuple(sorted(kwargs.items())))
+    grid = _grids.get(key)
+    if grid is None:
+        grid = _grids[key] = SensorGrid(nrows, ncols, bands=with_std, **kwargs)
+    figure = grid.draw(page, page["std"].to_numpy(dtype=float) if with_std else None)
+    paths = []
+    for fmt in formats:
+        path = f"{stem}.{fmt}"
+        figure.savefig(path, format=fmt, dpi=dpi)
+        paths.append(path)
+    return paths
+
+
+def render_sensor_reports(df: pd.DataFrame, directory: str, per_page: int = 15, ncols: int = 5,
+                          formats: Sequence[str] = ("png", "svg"), with_std: bool = False,
+                          dpi: float = 100, prefix: str = "sensors", minor_ticks: bool = False,
+                          processes: Optional[int] = None, **kwargs) -> List[str]:
+    """
+    Renders the sensor grid of a whole library to image files, one page per `per_page` sensors, in parallel
+
+    Pages are drawn by worker processes, each reusing one `SensorGrid` for
+    all the pages it renders, and saved with matplotlib's non-interactive
+    canvases (Agg for raster formats), so no display is needed.
+    Args:
+        df (pd.DataFrame): Marionette data, e.g. from `utils.synthetic_library.generate_library`
+        directory (str): Output directory, created if needed
+        per_page (int, optional): Sensors per page. Defaults to 15.
+        ncols (int, optional): Axes per row of a page. Defaults to 5.
+        formats (Sequence[str], optional): File formats of each page. Defaults to ("png", "svg").
+        with_std (bool, optional): Draw the bands of the "std" column of `df`. Defaults to False.
+        dpi (float, optional): Resolution of raster formats. Defaults to 100.
+        prefix (str, optional): File name prefix, followed by the page number. Defaults to "sensors".
+        minor_ticks (bool, optional): Draw minor ticks, at several times the cost. Defaults to False.
+        processes (Optional[int], optional): Number of worker processes, None for `os.cpu_count()`,
+                                             1 to render in this process. Defaults to None.
+        **kwargs: Passed to `SensorGrid`, e.g. `ylim` or `fontsize`
+
+    Returns:
+        List[str]: The written files, page by page
+    """
+    os.makedirs(directory, exist_ok=True)
+    ncols = max(1, min(ncols, per_page))
+    pages = max(1, -(-len(df) // per_page))
+    digits = len(str(pages - 1))
+    kwargs = dict(kwargs, minor_ticks=minor_ticks)
+    tasks = [
+        (df.iloc[page * per_page:(page + 1) * per_page].to_dict("records"),
+         os.path.join(directory, f"{prefix}_{page:0{digits}d}"), tuple(formats), dpi, ncols, with_std, kwargs)
+        for page in range(pages)
+    ]
+    if processes == 1 or len(tasks) == 1:
+        results = [_render_page(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            # Contiguous pages per worker, so that each worker reuses its grid
+            chunksize = max(1, -(-len(tasks) // (4 * (processes or os.cpu_count() or 1))))
+            results = pool.map(_render_page, tasks, chunksize=chunksize)
+    return [path for paths in results for path in paths]
@@ -0,0 +1,192 @@
+import itertools
+import multiprocessing
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from scipy.optimize import linprog
+from pacti.contracts import PolyhedralIoContract
+from utils.canonical import exact_hash
+from utils.contract_numerics import termlist_to_matrix
+from utils.synbio_utils import create_top_level_contracts, rename_sensor_output
+
+# Conditions of `create_top_level_contracts`, in order, as the states of its two inputs
+CONDITIONS = (("off", "off"), ("on", "off"), ("off", "on"), ("on", "on"))
+
+# Sensor regime (index into the library contracts) realizing each input state
+STATE_REGIMES = {"off": 0, "on": 1}
+
+# Sensor contracts placed on the second output, keyed by `(exact_hash(contract), template output, output)`.
+# A sensor is the second input of every pair it is in, so each process renames it once per regime.
+_placements: Dict[Tuple[str, str, str], PolyhedralIoContract] = {}
+
+
+class MissingPartSpec(NamedTuple):
+    """Specification of the missing part for one sensor pair and condition."""
+
+    sensor1: str
+    sensor2: str
+    # `(state of sensor1, state of sensor2)`, one of `CONDITIONS`
+    condition: Tuple[str, str]
+    # The quotient, or None if it could not be computed
+    spec: Optional[PolyhedralIoContract]
+    # Log10-volume of the input box on which the missing part must meet the spec
+    # (lower: fewer input levels to handle)
+    input_log_volume: float
+    # The error raised by Pacti, if any
+    error: Optional[str]
+
+
+def input_log_volume(contract: PolyhedralIoContract, nonnegative: bool = True) -> float:
+    """
+    Log10-volume of the bounding box of the inputs accepted by a contract
+
+    Each input is minimized and maximized over the assumptions. The smaller
+    the box, the fewer input levels an implementation must handle.
+    Args:
+        contract (PolyhedralIoContract): The contract
+        nonnegative (bool, optional): Restrict the inputs to nonnegative levels. Defaults to True.
+
+    Returns:
+        float: The log10-volume, `inf` if some input is unbounded and `-inf` if the box is flat
+    """
+    variables = list(contract.inputvars)
+    matrix, vector = termlist_to_matrix(contract.a.terms, variables)
+    bounds = (0, None) if nonnegative else (None, None)
+    log_volume = 0.0
+    for i in range(len(variables)):
+        objective = np.zeros(len(variables))
+        objective[i] = 1.0
+        low = linprog(objective, A_ub=matrix, b_ub=vector, bounds=bounds)
+        high = linprog(-objective, A_ub=matrix, b_ub=vector, bounds=bounds)
+        if low.status == 3 or high.status == 3:
+            return np.inf
+        if low.status != 0 or high.status != 0:
+            return -np.inf
+        width = -high.fun - low.fun
+        log_volume += np.log10(width) if width > 0 else -np.inf
+    return log_volume
+
+
+def _placed_contract(contract: PolyhedralIoContract, template_output: str, output: str) -> PolyhedralIoContract:
+    key = (exact_hash(contract), template_output, output)
+    placed = _placements.get(key)
+    if placed is None:
+        placed = _placements[key] = rename_sensor_output((contract,), output, template_output=template_output)[0]
+    return placed
+
+
+def _pair_specs(task: tuple) -> List[MissingPartSpec]:
+    sensor1, sensor2, contracts1, contracts2, params1, params2, outputs, conditions = task
+    output1, output2, output = outputs
+    try:
+        top_level = create_top_level_contracts(
+            input1=sensor1, input2=sensor2, output=output,
+            input1_params=params1, input2_params=params2,
+            output_params={"max": max(params1["ymax"], params2["ymax"]), "leak": max(params1["leak"], params2["leak"])},
+        )
+    except ValueError as e:
+        # Some top-level contract is itself inconsistent for these sensors
+        error = f"Top-level contracts: {type(e).__name__}: {e}"
+        return [MissingPartSpec(sensor1, sensor2, condition, None, np.inf, error) for condition in conditions]
+    specs = []
+    for condition in conditions:
+        regime1, regime2 = (STATE_REGIMES[state] for state in condition)
+        try:
+            placed2 = _placed_contract(contracts2[regime2], output1, output2)
+            sensors = contracts1[regime1].compose(placed2)
+            spec = top_level[CONDITIONS.index(condition)].quotient(sensors)
+        except Exception as e:
+            specs.append(MissingPartSpec(sensor1, sensor2, condition, None, np.inf, f"{type(e).__name__}: {e}"))
+            continue
+        specs.append(MissingPartSpec(sensor1, sensor2, condition, spec, input_log_volume(spec), None))
+    return specs
+
+
+def synthesize_missing_parts(library: Mapping[str, Sequence[PolyhedralIoContract]],
+                             library_params: Mapping[str, Mapping[str, float]],
+                             pairs: Optional[Sequence[Tuple[str, str]]] = None,
+                             conditions: Sequence[Tuple[str, str]] = CONDITIONS,
+                             outputs: Tuple[str, str, str] = ("xRFP", "dCas9", "RFP"),
+                             processes: Optional[int] = None) -> List[MissingPartSpec]:
+    """
+    Computes the specification of the missing part for sensor pairs of a library
+
+    For each pair `(sensor1, sensor2)` and each condition, the sensors are
+    placed in the regimes of the condition's input states (see `STATE_REGIMES`),
+    composed, and quotiented out of the matching top-level contract of
+    `create_top_level_contracts`, as the notebook does for (Sal, aTc).
+    Pairs are processed in parallel. Within a process, the contracts of the
+    second sensor placed on `outputs[1]` are reused across pairs and conditions.
+    Args:
+        library (Mapping[str, Sequence[PolyhedralIoContract]]): OFF, linear and saturation
+                                                                contracts of each sensor,
+                                                                with output `outputs[0]`
+        library_params (Mapping[str, Mapping[str, float]]): "leak", "start", "K" and "ymax"
+                                                            of each sensor
+        pairs (Optional[Sequence[Tuple[str, str]]], optional): The pairs to consider.
+                                                              Defaults to all ordered pairs.
+        conditions (Sequence[Tuple[str, str]], optional): The conditions to consider.
+                                                         Defaults to `CONDITIONS`.
+        outputs (Tuple[str, str, str], optional): Outputs of the first sensor, of the second
+                                                  sensor and of the system.
+                                                  Defaults to ("xRFP", "dCas9", "RFP").
+        processes (Optional[int], optional): Number of worker processes, None for
+                                             `os.cpu_count()`, 1 to run in this process.
+                                             Defaults to None.
+
+    Returns:
+        List[MissingPartSpec]: One specification per pair and condition
+    """
+    if pairs is None:
+        pairs = list(itertools.permutations(library, 2))
+    tasks = [
+        (sensor1, sensor2, tuple(library[sensor1]), tuple(library[sensor2]),
+         dict(library_params[sensor1]), dict(library_params[sensor2]), tuple(outputs), tuple(conditions))
+        for sensor1, sensor2 in pairs
+    ]
+    if processes == 1:
+        results = [_pair_specs(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_pair_specs, tasks)
+    return [spec for specs in results for spec in specs]
+
+
+def rank_pairs(specs: Sequence[MissingPartSpec]) -> List[Tuple[Tuple[str, str], int, float]]:
+    """
+    Ranks sensor pairs by how little their missing-part specifications require
+
+    The quotient is the weakest specification the missing part must meet,
+    and it only constrains the part on the inputs its assumptions accept.
+    The smaller the input box of `input_log_volume`, the fewer input levels
+    the part must handle, so the smaller the total log-volume the better.
+    This is a heuristic: the volume ignores how tight the guarantees are.
+
+    Pairs for which more conditions have a specification come first. Ties
+    are broken by the total input log-volume of their specifications. A
+    pair with some unbounded input box has a total of `inf`, and otherwise
+    a pair with some flat box has a total of `-inf`; pairs with the same
+    total are ordered by name.
+    Args:
+        specs (Sequence[MissingPartSpec]): Specifications from `synthesize_missing_parts`
+
+    Returns:
+        List[Tuple[Tuple[str, str], int, float]]: Each pair, its number of specified
+        conditions and its total input log-volume, best first
+    """
+    volumes: Dict[Tuple[str, str], List[float]] = {}
+    for spec in specs:
+        pair_volumes = volumes.setdefault((spec.sensor1, spec.sensor2), [])
+        if spec.spec is not None:
+            pair_volumes.append(float(spec.input_log_volume))
+    ranking = []
+    for pair, pair_volumes in volumes.items():
+        # inf + -inf is NaN, which has no order: unbounded boxes take precedence
+        if any(volume == np.inf for volume in pair_volumes):
+            total = np.inf
+        elif any(volume == -np.inf for volume in pair_volumes):
+            total = -np.inf
+        else:
+            total = float(sum(pair_volumes))
+        ranking.append((pair, len(pair_volumes), total))
+    ranking.sort(key=lambda item: (-item[1], item[2], item[0]))
+    return ranking
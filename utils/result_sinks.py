@@ -0,0 +1,237 @@
+import abc
+import json
+import sqlite3
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+def design_record(count: int, combo: Sequence[str], contract: Any) -> Dict[str, Any]:
+    """
+    Serializable record of one explored design.
+
+    `contract` may also be the dictionary of system contracts by regime
+    vector of `scalability.explore_regimes` (as yielded by
+    `scalability.iter_explore` with `all_regimes`). The design then succeeds
+    if any regime vector does, and the record's contract is the list of
+    `{"regimes": [...], "contract": ...}` of every vector, in order.
+
+    Args:
+        count (int): The combination id.
+        combo (Sequence[str]): The sensors of the design, in slot order.
+        contract: The composed system contract, or None if the design failed.
+
+    Returns:
+        Dict[str, Any]: The record, with the contract as `contract.to_dict()`.
+    """
+    if isinstance(contract, dict):
+        success = any(regime_contract is not None for regime_contract in contract.values())
+        serialized = [
+            {
+                "regimes": [str(regime) for regime in vector],
+                "contract": regime_contract.to_dict() if regime_contract is not None else None,
+            }
+            for vector, regime_contract in contract.items()
+        ]
+    else:
+        success = contract is not None
+        serialized = contract.to_dict() if contract is not None else None
+    return {
+        "count": int(count),
+        "combo": [str(sensor) for sensor in combo],
+        "success": success,
+        "contract": serialized,
+    }
+
+
+class ResultSink(abc.ABC):
+    """
+    Consumer of design records, written incrementally.
+
+    Sinks are context managers; `close()` flushes any buffered records.
+    Subclasses must implement `write()`.
+    """
+
+    @abc.abstractmethod
+    def write(self, record: Dict[str, Any]) -> None:
+        """
+        Consume one record.
+
+        Args:
+            record (Dict[str, Any]): A record from `design_record`.
+        """
+
+    def close(self) -> None:
+        """Flush buffered records and release resources."""
+
+    def __enter__(self) -> "ResultSink":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class JsonlSink(ResultSink):
+    """
+    Appends records to a JSON-lines file.
+
+    Args:
+        path (str): Output file.
+        successful_only (bool, optional): Only write successful designs. Defaults to True.
+    """
+
+    def __init__(self, path: str, successful_only: bool = True):
+        self.successful_only = successful_only
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self.successful_only and not record["success"]:
+            return
+        self._file.write(json.dumps(record) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SqliteSink(ResultSink):
+    """
+    Inserts records into an SQLite table, committing in batches.
+
+    Args:
+        path (str): Database file.
+        table (str, optional): Table name. Defaults to "designs".
+        successful_only (bool, optional): Only write successful designs. Defaults to True.
+        batch_size (int, optional): Records per transaction. Defaults to 1000.
+    """
+
+    def __init__(self, path: str, table: str = "designs", successful_only: bool = True, batch_size: int = 1000):
+        self.table = table
+        self.successful_only = successful_only
+        self.batch_size = batch_size
+        self._buffer: List[Tuple[int, str, int, Optional[str]]] = []
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(count INTEGER PRIMARY KEY, combo TEXT, success INTEGER, contract TEXT)"
+        )
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self.successful_only and not record["success"]:
+            return
+        contract = json.dumps(record["contract"]) if record["contract"] is not None else None
+        self._buffer.append((record["count"], json.dumps(record["combo"]), int(record["success"]), contract))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered records in one transaction."""
+        if self._buffer:
+            with self._connection:
+                self._connection.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)", self._buffer  # noqa: S608
+                )
+            self._buffer.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
+
+
+class ParquetSink(ResultSink):
+    """
+    Writes records to a Parquet file, one row group per batch.
+
+    Requires `pyarrow`. Contracts are stored as JSON strings.
+
+    Args:
+        path (str): Output file.
+        successful_only (bool, optional): Only write successful designs. Defaults to True.
+        batch_size (int, optional): Records per row group. Defaults to 10000.
+    """
+
+    def __init__(self, path: str, successful_only: bool = True, batch_size: int = 10000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("ParquetSink requires `pyarrow`: pip install pyarrow") from e
+        self._pa = pa
+        self.successful_only = successful_only
+        self.batch_size = batch_size
+        self._buffer: List[Dict[str, Any]] = []
+        self._schema = pa.schema(
+            [
+                ("count", pa.int64()),
+                ("combo", pa.list_(pa.string())),
+                ("success", pa.bool_()),
+                ("contract", pa.string()),
+            ]
+        )
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self.successful_only and not record["success"]:
+            return
+        row = dict(record)
+        row["contract"] = json.dumps(record["contract"]) if record["contract"] is not None else None
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered records as one row group."""
+        if self._buffer:
+            self._writer.write_table(self._pa.Table.from_pylist(self._buffer, schema=self._schema))
+            self._buffer.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._writer.close()
+
+
+class StatisticsSink(ResultSink):
+    """Aggregates exploration statistics from the stream, without keeping the records."""
+
+    def __init__(self) -> None:
+        self.explored = 0
+        self.successful = 0
+        self.sensor_successes: Counter = Counter()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.explored += 1
+        if record["success"]:
+            self.successful += 1
+            self.sensor_successes.update(record["combo"])
+
+    def stats(self) -> str:
+        """
+        Human-readable summary.
+
+        Returns:
+            str: The number of explored and successful designs, and the sensors used most.
+        """
+        most_used = ", ".join(f"{sensor} ({n})" for sensor, n in self.sensor_successes.most_common(5))
+        return (
+            f"Explored {self.explored} designs, {self.successful} successful.\n"
+            f"Sensors in most successful designs: {most_used or 'none'}"
+        )
+
+
+def stream_to_sinks(results: Iterable[Tuple[int, Sequence[str], Any, Any]], sinks: Sequence[ResultSink]) -> int:
+    """
+    Feed exploration results to sinks as they arrive.
+
+    Args:
+        results (Iterable[Tuple[int, Sequence[str], Any, Any]]): `(count, combo, instrumentation, contract)`
+            tuples, e.g. from `scalability.iter_explore`, with or without `all_regimes` (see `design_record`).
+        sinks (Sequence[ResultSink]): The consumers of the records.
+
+    Returns:
+        int: The number of results consumed.
+    """
+    consumed = 0
+    for count, combo, _, contract in results:
+        record = design_record(count, combo, contract)
+        for sink in sinks:
+            sink.write(record)
+        consumed += 1
+    return consumed
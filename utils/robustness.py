@@ -0,0 +1,170 @@
+import multiprocessing
+from statistics import NormalDist
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+import numpy as np
+from utils.feasibility import feasible_on_slot, output_bounds
+from utils.synbio_utils import sensor_contract_matrices
+
+# Default relative spread (lognormal sigma) of the sampled characterization parameters
+DEFAULT_SPREAD = {"leak": 0.1, "ymax": 0.1, "K": 0.1}
+
+
+def sample_parameters(nominal: Mapping[str, np.ndarray], n_samples: int,
+                      rng: np.random.Generator,
+                      std_range: Tuple[float, float] = (0.7, 0.8),
+                      spread: Optional[Mapping[str, float]] = None) -> Dict[str, np.ndarray]:
+    """
+    Draws samples of the characterization parameters of a sensor library
+
+    In each sample, "std" is drawn uniformly in `std_range` for every
+    sensor, as `scalability.load_library` does once, and each parameter of
+    `spread` is multiplied by a lognormal factor of that sigma. The other
+    parameters keep their nominal value. Draws in which "K" is not above
+    "start" have no linear regime, so "K" and "start" are drawn again for
+    these sensors until it is (a truncated lognormal).
+    Args:
+        nominal (Mapping[str, np.ndarray]): Nominal "leak", "start", "K" and "ymax" of each sensor
+        n_samples (int): Number of samples
+        rng (np.random.Generator): Random generator
+        std_range (Tuple[float, float], optional): Range of "std". Defaults to (0.7, 0.8).
+        spread (Optional[Mapping[str, float]], optional): Relative spread of each parameter.
+                                                         Defaults to `DEFAULT_SPREAD`.
+
+    Returns:
+        Dict[str, np.ndarray]: Each parameter, with shape `(n_samples, sensors)`
+
+    Raises:
+        ValueError: If the nominal "K" of a sensor is not above its "start".
+    """
+    if spread is None:
+        spread = DEFAULT_SPREAD
+    if np.any(np.asarray(nominal["K"], dtype=float) <= np.asarray(nominal["start"], dtype=float)):
+        raise ValueError("The nominal K of every sensor must be above its start.")
+    n_sensors = len(nominal["leak"])
+    samples = {}
+    for name in ("leak", "start", "K", "ymax"):
+        value = np.broadcast_to(np.asarray(nominal[name], dtype=float), (n_samples, n_sensors))
+        sigma = spread.get(name, 0.0)
+        if sigma:
+            value = value * rng.lognormal(0.0, sigma, (n_samples, n_sensors))
+        samples[name] = value
+    invalid = samples["K"] <= samples["start"]
+    if np.any(invalid):
+        samples["start"], samples["K"] = np.array(samples["start"]), np.array(samples["K"])
+    while np.any(invalid):
+        rows, cols = np.nonzero(invalid)
+        for name in ("start", "K"):
+            factor = rng.lognormal(0.0, spread.get(name, 0.0), len(rows))
+            samples[name][rows, cols] = np.asarray(nominal[name], dtype=float)[cols] * factor
+        invalid = samples["K"] <= samples["start"]
+    samples["std"] = rng.uniform(std_range[0], std_range[1], (n_samples, n_sensors))
+    return samples
+
+
+def sample_slot_masks(samples: Mapping[str, np.ndarray], regime: str,
+                      requirements: Sequence[Tuple[float, float]]) -> np.ndarray:
+    """
+    Which sensors meet the bounds assumed on each slot, in each sample
+
+    The contracts of all sensors of all samples are built as one batch of
+    coefficient matrices, and checked as in `feasible_on_slot`.
+    Args:
+        samples (Mapping[str, np.ndarray]): Parameters from `sample_parameters`
+        regime (str): One of "off", "lin", "max"
+        requirements (Sequence[Tuple[float, float]]): `(lower, upper)` bounds assumed on each slot
+
+    Returns:
+        np.ndarray: A boolean array of shape `(samples, slots, sensors)`
+    """
+    shape = samples["leak"].shape
+    params = [samples[name].ravel() for name in ("leak", "start", "K", "ymax", "std")]
+    lo, hi, input_dependent = output_bounds(*sensor_contract_matrices(*params)[regime])
+    masks = [feasible_on_slot(lo, hi, input_dependent, req_lo, req_hi).reshape(shape)
+             for req_lo, req_hi in requirements]
+    return np.stack(masks, axis=1)
+
+
+def design_passes(slot_masks: np.ndarray, designs: np.ndarray) -> np.ndarray:
+    """
+    Whether each design passes the slot check, in each sample
+
+    Args:
+        slot_masks (np.ndarray): Boolean array of shape `(samples, slots, sensors)`
+        designs (np.ndarray): Sensor index on each slot of each design, shape `(designs, slots)`
+
+    Returns:
+        np.ndarray: A boolean array of shape `(samples, designs)`
+    """
+    slots = np.arange(designs.shape[1])
+    return np.all(slot_masks[:, slots, designs], axis=2)
+
+
+def wilson_interval(successes: np.ndarray, trials: int,
+                    confidence: float = 0.95) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Wilson score confidence interval of binomial proportions
+
+    Args:
+        successes (np.ndarray): Number of successes
+        trials (int): Number of trials
+        confidence (float, optional): Confidence level. Defaults to 0.95.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Lower and upper bounds of the interval
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = np.asarray(successes, dtype=float) / trials
+    center = (p + z ** 2 / (2 * trials)) / (1 + z ** 2 / trials)
+    half_width = z * np.sqrt(p * (1 - p) / trials + z ** 2 / (4 * trials ** 2)) / (1 + z ** 2 / trials)
+    return np.clip(center - half_width, 0, 1), np.clip(center + half_width, 0, 1)
+
+
+def _count_passes(task: tuple) -> np.ndarray:
+    seed, n_samples, nominal, std_range, spread, regime, requirements, designs = task
+    samples = sample_parameters(nominal, n_samples, np.random.default_rng(seed), std_range, spread)
+    return design_passes(sample_slot_masks(samples, regime, requirements), designs).sum(axis=0)
+
+
+def monte_carlo_passes(nominal: Mapping[str, np.ndarray], designs: np.ndarray, n_samples: int,
+                       requirements: Sequence[Tuple[float, float]], regime: str = "max",
+                       seed: int = 0, std_range: Tuple[float, float] = (0.7, 0.8),
+                       spread: Optional[Mapping[str, float]] = None,
+                       chunk_size: int = 1000, processes: Optional[int] = None) -> np.ndarray:
+    """
+    Counts, for each design, the parameter samples in which it passes the slot check
+
+    Samples are drawn and checked in chunks of `chunk_size`, each from its
+    own child of `np.random.SeedSequence(seed)`, so the counts only depend
+    on `seed` and `chunk_size`, not on the number of processes.
+    Args:
+        nominal (Mapping[str, np.ndarray]): Nominal "leak", "start", "K" and "ymax" of each sensor
+        designs (np.ndarray): Sensor index on each slot of each design, shape `(designs, slots)`
+        n_samples (int): Number of samples
+        requirements (Sequence[Tuple[float, float]]): `(lower, upper)` bounds assumed on each slot
+        regime (str, optional): One of "off", "lin", "max". Defaults to "max".
+        seed (int, optional): Seed of the samples. Defaults to 0.
+        std_range (Tuple[float, float], optional): Range of "std". Defaults to (0.7, 0.8).
+        spread (Optional[Mapping[str, float]], optional): Relative spread of each parameter.
+                                                         Defaults to `DEFAULT_SPREAD`.
+        chunk_size (int, optional): Samples drawn and checked at a time. Defaults to 1000.
+        processes (Optional[int], optional): Number of worker processes, None for `os.cpu_count()`,
+                                             1 to run in this process. Defaults to None.
+
+    Returns:
+        np.ndarray: The number of passing samples of each design
+    """
+    designs = np.asarray(designs, dtype=int).reshape(-1, len(requirements))
+    nominal = {name: np.asarray(nominal[name], dtype=float) for name in ("leak", "start", "K", "ymax")}
+    sizes = [min(chunk_size, n_samples - start) for start in range(0, n_samples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(s, size, nominal, std_range, spread, regime, list(requirements), designs)
+             for s, size in zip(seeds, sizes)]
+    passes = np.zeros(len(designs), dtype=int)
+    if processes == 1:
+        counts: List[np.ndarray] = [_count_passes(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            counts = pool.map(_count_passes, tasks)
+    for count in counts:
+        passes += count
+    return passes
@@ -0,0 +1,329 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+# Upper edges of the wall-time histogram buckets, in seconds: 4 per decade from 10 µs to 100 s.
+# Times above the last edge go to an overflow bucket.
+BUCKET_EDGES = [10 ** (exponent / 4) for exponent in range(-20, 9)]
+
+# Returned by disabled profilers, so that timing a stage costs a single attribute check
+_DISABLED = contextlib.nullcontext()
+
+
+class StageStatistics:
+    """
+    Wall-time histogram and outcome counters of one stage.
+
+    Attributes:
+        buckets (List[int]): Number of runs in each bucket of `BUCKET_EDGES`, plus an overflow bucket.
+        successes (int): Runs that returned.
+        failures (int): Runs that raised.
+        total (float): Total wall time, in seconds.
+        min (float): Shortest run, in seconds.
+        max (float): Longest run, in seconds.
+    """
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(BUCKET_EDGES) + 1)
+        self.successes = 0
+        self.failures = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    @property
+    def count(self) -> int:
+        return self.successes + self.failures
+
+    def add(self, duration: float, success: bool) -> None:
+        self.buckets[bisect.bisect_left(BUCKET_EDGES, duration)] += 1
+        if success:
+            self.successes += 1
+        else:
+            self.failures += 1
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+
+    def merge(self, other: "StageStatistics") -> None:
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.successes += other.successes
+        self.failures += other.failures
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """
+        Approximate quantile of the wall time, as the upper edge of its bucket.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float: The quantile in seconds, NaN if the stage never ran.
+        """
+        if not self.count:
+            return float("nan")
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKET_EDGES[i], self.max) if i < len(BUCKET_EDGES) else self.max
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        ran = self.count > 0
+        return {
+            "count": self.count,
+            "successes": self.successes,
+            "failures": self.failures,
+            "total": self.total,
+            "mean": self.total / self.count if ran else None,
+            "min": self.min if ran else None,
+            "max": self.max if ran else None,
+            "p50": self.quantile(0.5) if ran else None,
+            "p90": self.quantile(0.9) if ran else None,
+            "p99": self.quantile(0.99) if ran else None,
+            "buckets": list(self.buckets),
+        }
+
+
+class StageProfiler:
+    """
+    Per-stage wall-time histograms, outcome counters and timeline of a design exploration.
+
+    Stages are timed with `stage()`. A disabled profiler records nothing
+    and `stage()` returns a shared no-op context manager. Profilers are
+    picklable: pool workers send theirs back (see `snapshot()`), and the
+    parent combines them with `merge()`.
+
+    Args:
+        enabled (bool, optional): Whether stages are recorded. Defaults to True.
+        max_events (int, optional): Maximum number of timeline events kept, the
+            histograms and counters being exact regardless. Defaults to 100000.
+    """
+
+    def __init__(self, enabled: bool = True, max_events: int = 100000):
+        self.enabled = enabled
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Drop everything recorded so far."""
+        self.stages: Dict[str, StageStatistics] = {}
+        # Outcomes of each stage per sensor involved: {stage: {sensor: [successes, failures]}}
+        self.sensor_outcomes: Dict[str, Dict[str, List[int]]] = {}
+        self.cache_stats: Dict[str, Dict[str, int]] = {}
+        # Largest value of each cache gauge (e.g. its size) in any one process: {cache: {gauge: value}}
+        self.cache_gauges: Dict[str, Dict[str, int]] = {}
+        # Timeline as Chrome trace "complete" events
+        self.events: List[Dict[str, Any]] = []
+        self.dropped_events = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def stage(self, name: str, sensors: Sequence[str] = (), **args: Any) -> Any:
+        """
+        Context manager timing one run of a stage.
+
+        The run is a failure if the block raises; the exception is propagated.
+
+        Args:
+            name (str): The stage.
+            sensors (Sequence[str], optional): The sensors involved, counted in `sensor_outcomes`. Defaults to ().
+            **args: Shown with the event in the timeline.
+
+        Returns:
+            A context manager.
+        """
+        if not self.enabled:
+            return _DISABLED
+        return self._timed(name, sensors, args)
+
+    @contextlib.contextmanager
+    def _timed(self, name: str, sensors: Sequence[str], args: Dict[str, Any]) -> Iterator[None]:
+        wall = time.time()
+        start = time.perf_counter()
+        success = False
+        try:
+            yield
+            success = True
+        finally:
+            self.record(name, time.perf_counter() - start, success, sensors, wall, args)
+
+    def record(self, name: str, duration: float, success: bool = True, sensors: Sequence[str] = (),
+               start: Optional[float] = None, args: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Record one run of a stage timed elsewhere.
+
+        Args:
+            name (str): The stage.
+            duration (float): Wall time, in seconds.
+            success (bool, optional): Whether the run succeeded. Defaults to True.
+            sensors (Sequence[str], optional): The sensors involved. Defaults to ().
+            start (Optional[float], optional): Start time (`time.time()`), to add the run to the timeline.
+                Defaults to None.
+            args (Optional[Dict[str, Any]], optional): Shown with the event in the timeline. Defaults to None.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            statistics = self.stages.get(name)
+            if statistics is None:
+                statistics = self.stages[name] = StageStatistics()
+            statistics.add(duration, success)
+            if sensors:
+                outcomes = self.sensor_outcomes.setdefault(name, {})
+                for sensor in sensors:
+                    outcomes.setdefault(sensor, [0, 0])[0 if success else 1] += 1
+            if start is None:
+                return
+            if len(self.events) >= self.max_events:
+                self.dropped_events += 1
+                return
+            event_args = dict(args or {}, success=success)
+            if sensors:
+                event_args["sensors"] = list(sensors)
+            self.events.append({
+                "name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6,
+                "pid": os.getpid(), "tid": threading.get_ident(), "args": event_args,
+            })
+
+    def record_cache(self, name: str, stats: Dict[str, int], gauges: Optional[Dict[str, int]] = None) -> None:
+        """
+        Add to the statistics of a cache, e.g. `CompositionCache.take_stats()`.
+
+        Counters are summed over calls, and over processes by `merge()`.
+        Gauges, such as the size of the cache, keep their largest value.
+
+        Args:
+            name (str): The cache.
+            stats (Dict[str, int]): Counters to add.
+            gauges (Optional[Dict[str, int]], optional): Current values of the gauges. Defaults to None.
+        """
+        if self.enabled:
+            with self._lock:
+                self._add_cache_stats(name, stats, gauges or {})
+
+    def _add_cache_stats(self, name: str, stats: Dict[str, int], gauges: Dict[str, int]) -> None:
+        counters = self.cache_stats.setdefault(name, {})
+        for key, value in stats.items():
+            counters[key] = counters.get(key, 0) + value
+        if gauges:
+            maxima = self.cache_gauges.setdefault(name, {})
+            for key, value in gauges.items():
+                maxima[key] = max(maxima.get(key, value), value)
+
+    def merge(self, other: "StageProfiler") -> None:
+        """
+        Add the records of another profiler, e.g. the snapshot of a pool worker.
+
+        Args:
+            other (StageProfiler): The profiler to add.
+        """
+        with self._lock:
+            for name, statistics in other.stages.items():
+                self.stages.setdefault(name, StageStatistics()).merge(statistics)
+            for name, outcomes in other.sensor_outcomes.items():
+                mine = self.sensor_outcomes.setdefault(name, {})
+                for sensor, (successes, failures) in outcomes.items():
+                    counts = mine.setdefault(sensor, [0, 0])
+                    counts[0] += successes
+                    counts[1] += failures
+            for name in set(other.cache_stats) | set(other.cache_gauges):
+                self._add_cache_stats(name, other.cache_stats.get(name, {}), other.cache_gauges.get(name, {}))
+            room = max(self.max_events - len(self.events), 0)
+            self.events.extend(other.events[:room])
+            self.dropped_events += other.dropped_events + max(len(other.events) - room, 0)
+
+    def snapshot(self, reset: bool = True) -> "StageProfiler":
+        """
+        Copy of the records, to send to another process.
+
+        Args:
+            reset (bool, optional): Drop the records from this profiler, so that they
+                are not sent twice. Defaults to True.
+
+        Returns:
+            StageProfiler: A profiler holding the records.
+        """
+        copy = StageProfiler(self.enabled, self.max_events)
+        copy.merge(self)
+        if reset:
+            with self._lock:
+                self.reset()
+        return copy
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Summary of the records.
+
+        Returns:
+            Dict[str, Any]: Bucket edges, the statistics of each stage, the outcomes per
+            stage and sensor, and the cache statistics, with the largest value of each gauge
+            as "max_<gauge>".
+        """
+        cache_stats = {name: dict(stats) for name, stats in self.cache_stats.items()}
+        for name, gauges in self.cache_gauges.items():
+            cache_stats.setdefault(name, {}).update({f"max_{key}": value for key, value in gauges.items()})
+        return {
+            "bucket_edges": BUCKET_EDGES,
+            "stages": {name: statistics.to_dict() for name, statistics in self.stages.items()},
+            "sensor_outcomes": {
+                name: {sensor: {"successes": s, "failures": f} for sensor, (s, f) in outcomes.items()}
+                for name, outcomes in self.sensor_outcomes.items()
+            },
+            "cache_stats": cache_stats,
+            "events": len(self.events),
+            "dropped_events": self.dropped_events,
+        }
+
+    def write_json(self, path: str) -> None:
+        """
+        Write the summary of `to_dict()` as JSON.
+
+        Args:
+            path (str): Output file.
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """
+        The timeline in the Chrome trace event format.
+
+        Returns:
+            Dict[str, Any]: Load its JSON in `chrome://tracing` or https://ui.perfetto.dev.
+            Each process (e.g. pool worker) is a row, so stragglers stand out.
+        """
+        pids = sorted({event["pid"] for event in self.events})
+        metadata = [
+            {"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": f"worker {pid}"}}
+            for pid in pids
+        ]
+        return {"traceEvents": metadata + sorted(self.events, key=lambda event: event["ts"]),
+                "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str) -> None:
+        """
+        Write the timeline of `chrome_trace()` as JSON.
+
+        Args:
+            path (str): Output file.
+        """
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
@@ -1,9 +1,10 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import copy
-from typing import Union
-from pacti.iocontract import IoContract
+from typing import Dict, Iterable, List, Mapping, Tuple, Union
+from pacti.iocontract import IoContract, Var
 from pacti.contracts import PolyhedralIoContract
+from utils.contract_numerics import contract_from_matrices, output_bounds_at
 
 def display_sensor_contracts(
     sensor_input: str = "u",
@@ -80,7 +81,8 @@ def display_sensor_contracts(
 
 
 def remove_quantization_errors(contract: IoContract,
-                               tolerance: float = 1e-4) -> IoContract:
+                               tolerance: float = 1e-4,
+                               inplace: bool = False) -> IoContract:
     """Removes quantization errors that creep in Pacti computations
        All terms that have coefficients lower than the specified `tolerance`
        are removed.
@@ -88,30 +90,59 @@ def remove_quantization_errors(contract: IoContract,
         contract (IoContract): A contract (`pacti.iocontract.IoContract`)
                                object
         tolerance (float, optional): The tolerance value. Defaults to 1e-4.
+        inplace (bool, optional): Remove the terms from `contract` itself
+                                  instead of from a copy. Defaults to False.
 
     Returns:
         IoContract: Updated contract (`pacti.iocontract.IoContract`)
     """
-    from_contract = copy.deepcopy(contract)
-    index = 0
-    # Remove quantization error from assumptions
-    for t_i in list(from_contract.a.terms):
-        all_coeff = 0
-        for _, coeff in t_i.variables.items():
-            all_coeff += np.abs(coeff)
-        if all_coeff < tolerance:
-            from_contract.a.terms.remove(t_i)
-        index += 1
-    # Remove quantization error from guarantees
-    index = 0
-    for t_i in list(from_contract.g.terms):
-        all_coeff = 0
-        for _, coeff in t_i.variables.items():
-            all_coeff += np.abs(coeff)
-        if all_coeff < tolerance:
-            from_contract.g.terms.remove(t_i)
-        index += 1
-    return from_contract
+    return remove_quantization_errors_batch([contract], tolerance, inplace)[0]
+
+
+def remove_quantization_errors_batch(contracts: Iterable[IoContract],
+                                     tolerance: float = 1e-4,
+                                     inplace: bool = False) -> List[IoContract]:
+    """Removes quantization errors from many contracts at once
+       The absolute coefficients of all assumption and guarantee terms of
+       `contracts` are summed in one vectorized pass, and the terms below
+       `tolerance` are dropped. Unless `inplace` is set, each contract is
+       copied shallowly: only the term lists that lose a term are rebuilt,
+       the others are shared with the original contract.
+    Args:
+        contracts (Iterable[IoContract]): The contracts
+        tolerance (float, optional): The tolerance value. Defaults to 1e-4.
+        inplace (bool, optional): Remove the terms from the given contracts,
+                                  for pipelines that own them. Defaults to False.
+
+    Returns:
+        List[IoContract]: The updated contracts, in the same order
+    """
+    contracts = list(contracts)
+    term_lists = [term_list for contract in contracts for term_list in (contract.a, contract.g)]
+    terms = [term for term_list in term_lists for term in term_list.terms]
+    # Flattened coefficients, with the index of the term of each
+    lengths = np.fromiter((len(term.variables) for term in terms), dtype=int, count=len(terms))
+    coeffs = np.fromiter((float(coeff) for term in terms for coeff in term.variables.values()),
+                         dtype=float, count=int(lengths.sum()))
+    rows = np.repeat(np.arange(len(terms)), lengths)
+    keep = np.bincount(rows, weights=np.abs(coeffs), minlength=len(terms)) >= tolerance
+    updated = []
+    position = 0
+    for contract in contracts:
+        result = contract if inplace else copy.copy(contract)
+        for attr in ("a", "g"):
+            term_list = getattr(contract, attr)
+            mask = keep[position:position + len(term_list.terms)]
+            position += len(term_list.terms)
+            if mask.all():
+                continue
+            kept = [term for term, k in zip(term_list.terms, mask) if k]
+            if inplace:
+                term_list.terms[:] = kept
+            else:
+                setattr(result, attr, type(term_list)(kept))
+        updated.append(result)
+    return updated
 
 
 # +
@@ -330,4 +361,255 @@ def create_sensor_contracts2(sensor_input="AHL", output="FP", K=0.0, yleak=0.0,
             f"-{output} <= {-1 * ymax_lin1}",
         ]
     )
-    return contract_0, contract_lin, contract_max
\ No newline at end of file
+    return contract_0, contract_lin, contract_max
+
+def create_top_level_contracts(input1="u1", input2="u2", output="y",
+                               input1_params=None, input2_params=None,
+                               output_params=None):
+    """
+    Creates the top level system contracts of the NAND gate
+
+    One contract is created for each condition of the two inputs, with the
+    output ON unless both inputs are ON.
+    Args:
+        input1 (str, optional): First input. Defaults to "u1".
+        input2 (str, optional): Second input. Defaults to "u2".
+        output (str, optional): Output of the system. Defaults to "y".
+        input1_params (dict, optional): "start" and "K" of the first input.
+        input2_params (dict, optional): "start" and "K" of the second input.
+        output_params (dict, optional): "max" (ON level) and "leak" (OFF level)
+                                        of the output.
+
+    Returns:
+        List[PolyhedralIoContract]: The contracts for the input conditions
+        (OFF, OFF), (ON, OFF), (OFF, ON) and (ON, ON), in this order
+    """
+    u1_start = input1_params["start"]
+    u1_K = input1_params["K"]
+
+    u2_start = input2_params["start"]
+    u2_K = input2_params["K"]
+
+    y_max = output_params["max"]
+    y_leak = output_params["leak"]
+    all_contracts = []
+    contract_top_level_on1 = PolyhedralIoContract.from_strings(
+        # "u1:OFF, u2:OFF, y:ON",
+        input_vars=[
+            input1, input2
+        ],
+        output_vars=[
+            output
+        ],
+        assumptions=[
+            f"{input1} <= {u1_start - u1_start*0.01}",
+            f"{input2} <= {u2_start - u2_start*0.01}"
+        ],
+        guarantees=[
+            f"-{output}<={-1*y_max}",
+        ]
+    )
+    all_contracts.append(contract_top_level_on1)
+    contract_top_level_on2 = PolyhedralIoContract.from_strings(
+        # "u1:ON, u2:OFF, y:ON",
+        input_vars=[
+            input1, input2
+        ],
+        output_vars=[
+            output
+        ],
+        assumptions=[
+            f"-{input1} <= {-1*(u1_start + u1_start*0.01)}",
+            f"{input1} <= {u1_K - u1_K*0.01}",
+            f"{input2} <= {u2_start - u2_start*0.01}"
+        ],
+        guarantees=[
+            f"-{output} <= {-1*y_max}"
+        ]
+    )
+    all_contracts.append(contract_top_level_on2)
+    contract_top_level_on3 = PolyhedralIoContract.from_strings(
+        # "u1:OFF, u2:ON, y:ON",
+        input_vars=[
+            input1, input2
+        ],
+        output_vars=[
+            output
+        ],
+        assumptions=[
+            f"{input1} <= {u1_start - u1_start*0.01}",
+            f"-{input2} <= {-1*(u2_start + u2_start*0.01)}",
+            f"{input2} <= {u2_K - u2_K*0.01}",
+        ],
+        guarantees=[
+            f"-{output}<={-1*y_max}",
+        ]
+    )
+    all_contracts.append(contract_top_level_on3)
+    contract_top_level_off = PolyhedralIoContract.from_strings(
+        # "u1:ON, u2:ON, y:OFF",
+        input_vars=[
+            input1, input2
+        ],
+        output_vars=[
+            output
+        ],
+        assumptions=[
+            f"-{input1} <= {-1*(u1_start + u1_start*0.01)}",
+            f"{input1} <= {u1_K - u1_K*0.01}",
+            f"-{input2} <= {-1*(u2_start + u2_start*0.01)}",
+            f"{input2} <= {u2_K - u2_K*0.01}",
+        ],
+        guarantees=[
+            f"{output} <= {y_leak}"
+        ]
+    )
+    all_contracts.append(contract_top_level_off)
+    return all_contracts
+
+
+def rename_sensor_output(contracts: Tuple[PolyhedralIoContract, ...], output: str,
+                         template_output: str = "xRFP") -> Tuple[PolyhedralIoContract, ...]:
+    """
+    Copies prebuilt sensor contracts with their output variable renamed.
+
+    This is used to place a library sensor, built once with the output
+    `template_output`, on a specific output slot without rebuilding
+    its contracts from strings.
+    Args:
+        contracts (Tuple[PolyhedralIoContract, ...]): The regime contracts of
+                                                      a sensor, as returned by
+                                                      `create_sensor_contracts2`
+        output (str): The new output variable
+        template_output (str, optional): The output variable used when
+                                         building `contracts`.
+                                         Defaults to "xRFP".
+
+    Returns:
+        Tuple[PolyhedralIoContract, ...]: The renamed contracts, in the same order
+    """
+    if output == template_output:
+        return tuple(contracts)
+    return tuple(contract.rename_variable(Var(template_output), Var(output))
+                 for contract in contracts)
+
+
+def sensor_contract_matrices(leak, start, K, ymax_lin, std) -> dict:
+    """
+    Coefficient matrices of the OFF, linear and saturation sensor contracts
+
+    This computes, for a whole table of sensors at once, the same bounds as
+    `create_sensor_contracts2`. The columns of all matrices are
+    `(sensor_input, output)`.
+    Args:
+        leak (array_like): Leak (minimum) expression of each sensor
+        start (array_like): Inducer value at which induction starts
+        K (array_like): Hill activation parameter, end of the linear regime
+        ymax_lin (array_like): Expression at the end of the linear regime
+        std (array_like): Relative standard deviation of each sensor
+
+    Returns:
+        dict: For each regime ("off", "lin", "max"), a tuple
+              `(a_matrix, a_vector, g_matrix, g_vector)` with shapes
+              `(n, rows, 2)` and `(n, rows)`, `n` being the number of sensors
+    """
+    leak, start, K, ymax_lin, std = (np.atleast_1d(np.asarray(p, dtype=float))
+                                     for p in (leak, start, K, ymax_lin, std))
+    n = leak.shape[0]
+    yleak1 = leak + std * leak
+    yleak2 = leak - std * leak
+    ymax_lin1 = ymax_lin - std * ymax_lin
+    ymax_lin2 = ymax_lin + std * ymax_lin
+    slope1 = (ymax_lin1 - yleak1) / (K - start)
+    slope2 = (ymax_lin2 - yleak2) / (K - start)
+    intercept1 = yleak1 - slope1 * start
+    intercept2 = yleak2 - slope2 * start
+    zeros = np.zeros(n)
+    ones = np.ones(n)
+
+    def rows(*coeffs):
+        # Stack (input, output) coefficient pairs into an (n, rows, 2) array
+        return np.stack([np.stack(pair, axis=-1) for pair in coeffs], axis=1)
+
+    return {
+        # u <= start  =>  -yleak2 <= -y, y <= yleak1
+        "off": (rows((ones, zeros)), np.stack([start], axis=1),
+                rows((zeros, ones), (zeros, -ones)), np.stack([yleak1, -yleak2], axis=1)),
+        # start <= u <= K  =>  slope1 u + intercept1 <= y <= slope2 u + intercept2
+        "lin": (rows((ones, zeros), (-ones, zeros)), np.stack([K, -start], axis=1),
+                rows((slope1, -ones), (-slope2, ones)), np.stack([-intercept1, intercept2], axis=1)),
+        # u >= K  =>  y >= ymax_lin1
+        "max": (rows((-ones, zeros)), np.stack([-K], axis=1),
+                rows((zeros, -ones)), np.stack([-ymax_lin1], axis=1)),
+    }
+
+
+def create_sensor_contracts_batch(sensor_inputs: List[str], output: str,
+                                  leak, start, K, ymax_lin, std) -> List[Tuple[PolyhedralIoContract, ...]]:
+    """
+    Creates the contracts of many Marionette sensing subsystems at once
+
+    Equivalent to calling `create_sensor_contracts2` for each sensor, but the
+    contracts are built directly from coefficient matrices instead of being
+    formatted into strings and parsed back.
+    Args:
+        sensor_inputs (List[str]): The inducer input of each sensor
+        output (str): The output of the genetic constructs
+        leak (array_like): Leak (minimum) expression of each sensor
+        start (array_like): Inducer value at which induction starts
+        K (array_like): Hill activation parameter, end of the linear regime
+        ymax_lin (array_like): Expression at the end of the linear regime
+        std (array_like): Relative standard deviation of each sensor
+
+    Returns:
+        List[Tuple[PolyhedralIoContract, ...]]: The OFF, linear and saturation
+                                                contracts of each sensor
+    """
+    matrices = sensor_contract_matrices(leak, start, K, ymax_lin, std)
+    all_contracts = []
+    for i, sensor_input in enumerate(sensor_inputs):
+        all_contracts.append(tuple(
+            contract_from_matrices(a_mat[i], a_vec[i], g_mat[i], g_vec[i],
+                                   input_vars=[sensor_input], output_vars=[output])
+            for a_mat, a_vec, g_mat, g_vec in matrices.values()
+        ))
+    return all_contracts
+
+
+def screen_fold_change(on_contracts: Mapping[str, IoContract],
+                       off_contracts: Mapping[str, IoContract],
+                       output: str,
+                       on_points: Mapping[str, Mapping[str, np.ndarray]],
+                       off_points: Mapping[str, Mapping[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """
+    Computes the fold-change of the output of many candidate systems, over grids of input levels
+
+    For each candidate, the fold-change is the lowest output that the ON
+    system guarantees at `on_points`, divided by the highest output that the
+    OFF system guarantees at `off_points`. Both bounds are evaluated
+    numerically from the guarantee coefficients with `output_bounds_at`.
+    Args:
+        on_contracts (Mapping[str, IoContract]): For each candidate, the system
+                                                 contract in which `output` is ON
+        off_contracts (Mapping[str, IoContract]): For each candidate, the system
+                                                  contract in which `output` is OFF
+        output (str): The output of the systems, e.g. "RFP"
+        on_points (Mapping[str, Mapping[str, np.ndarray]]): For each candidate,
+                                                            the value (or array of
+                                                            values) of each input
+                                                            in the ON system
+        off_points (Mapping[str, Mapping[str, np.ndarray]]): Same for the OFF system
+
+    Returns:
+        Dict[str, np.ndarray]: The fold-change of each candidate present in both
+                               `on_contracts` and `off_contracts`, with the
+                               broadcast shape of its ON and OFF points
+    """
+    fold_change = {}
+    for candidate, on_contract in on_contracts.items():
+        if candidate not in off_contracts:
+            continue
+        output_on, _ = output_bounds_at(on_contract, output, on_points[candidate])
+        _, output_off = output_bounds_at(off_contracts[candidate], output, off_points[candidate])
+        fold_change[candidate] = output_on / output_off
+    return fold_change
@@ -0,0 +1,191 @@
+from typing import NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from utils.feasibility import feasible_on_slot, output_bounds
+from utils.synbio_utils import sensor_contract_matrices
+
+# Positive quantities fitted as a joint lognormal, as derived from the characterization columns.
+# "K/start" is fitted instead of "start" so that the linear regime is never empty.
+FITTED_QUANTITIES = ("ymin (RPUx10-3)", "K (µM)", "K/start", "ymax Linear", "ymax (RPU)", "n")
+
+# Range of "std" when the data has no "std" column, as drawn by `scalability.load_library`
+DEFAULT_STD_RANGE = (0.7, 0.8)
+
+
+class LibraryDistribution(NamedTuple):
+    """Joint distribution of the sensor characterization parameters."""
+
+    # Mean of the logarithms of `FITTED_QUANTITIES`
+    log_mean: np.ndarray
+    # Covariance of the logarithms of `FITTED_QUANTITIES`
+    log_cov: np.ndarray
+    # "std" is drawn uniformly in this range
+    std_range: Tuple[float, float]
+
+
+def fit_library_distribution(df: pd.DataFrame, shrinkage: float = 0.1) -> LibraryDistribution:
+    """
+    Fits a joint lognormal distribution to the characterization parameters of a sensor table
+
+    Leaks, thresholds and expression levels span several decades and are
+    correlated (e.g. "start" scales with "K"), so their logarithms are
+    fitted as a multivariate normal. The covariance is shrunk towards its
+    diagonal, which keeps it well conditioned for small tables such as the
+    Marionette sensors (14 in `data/marionette_data.csv`).
+    Args:
+        df (pd.DataFrame): Marionette data, e.g. `data/marionette_data.csv`
+        shrinkage (float, optional): Weight of the diagonal in the covariance,
+                                     between 0 and 1. Defaults to 0.1.
+
+    Returns:
+        LibraryDistribution: The fitted distribution
+    """
+    logs = np.log(_quantities(df))
+    cov = np.cov(logs, rowvar=False)
+    cov = (1 - shrinkage) * cov + shrinkage * np.diag(np.diag(cov))
+    if "std" in df:
+        std_range = (float(df["std"].min()), float(df["std"].max()))
+    else:
+        std_range = DEFAULT_STD_RANGE
+    return LibraryDistribution(logs.mean(axis=0), cov, std_range)
+
+
+def _quantities(df: pd.DataFrame) -> np.ndarray:
+    start = df["start"].to_numpy(dtype=float)
+    K = df["K (µM)"].to_numpy(dtype=float)
+    columns = {name: df[name].to_numpy(dtype=float) for name in FITTED_QUANTITIES if name in df}
+    columns["K/start"] = K / start
+    return np.stack([columns[name] for name in FITTED_QUANTITIES], axis=1)
+
+
+def compatible_sensors(df: pd.DataFrame, requirements: Sequence[Tuple[float, float]],
+                       regime: str = "max", require_all: bool = True,
+                       std: Optional[float] = None) -> np.ndarray:
+    """
+    Which sensors of a table can be placed on the slots of the processors
+
+    This is the check of `scalability.slot_feasibility`, for a table
+    instead of the loaded library.
+    Args:
+        df (pd.DataFrame): Sensor table, with the Marionette columns and "std"
+        requirements (Sequence[Tuple[float, float]]): `(lower, upper)` bounds assumed on each slot,
+                                                       e.g. from `scalability.slot_requirements()`
+        regime (str, optional): One of "off", "lin", "max". Defaults to "max".
+        require_all (bool, optional): Require a sensor to fit every slot instead of some slot.
+                                      Defaults to True.
+        std (Optional[float], optional): Use this "std" for all sensors instead of the column.
+                                         Defaults to None.
+
+    Returns:
+        np.ndarray: A boolean mask over the sensors
+    """
+    n = len(df)
+    params = [
+        df["ymin (RPUx10-3)"].to_numpy(dtype=float) * 1e-3,
+        df["start"].to_numpy(dtype=float),
+        df["K (µM)"].to_numpy(dtype=float),
+        df["ymax Linear"].to_numpy(dtype=float),
+        np.full(n, std) if std is not None else df["std"].to_numpy(dtype=float),
+    ]
+    lo, hi, input_dependent = output_bounds(*sensor_contract_matrices(*params)[regime])
+    masks = np.array([feasible_on_slot(lo, hi, input_dependent, req_lo, req_hi) for req_lo, req_hi in requirements])
+    return masks.all(axis=0) if require_all else masks.any(axis=0)
+
+
+def _sample_table(distribution: LibraryDistribution, n: int, rng: np.random.Generator) -> pd.DataFrame:
+    logs = rng.multivariate_normal(distribution.log_mean, distribution.log_cov, size=n, method="cholesky")
+    values = dict(zip(FITTED_QUANTITIES, np.exp(logs).T))
+    df = pd.DataFrame({
+        "ymax (RPU)": values["ymax (RPU)"],
+        "ymin (RPUx10-3)": values["ymin (RPUx10-3)"],
+        "K (µM)": values["K (µM)"],
+        "n": values["n"],
+        "Dynamic range": values["ymax (RPU)"] / values["ymin (RPUx10-3)"] * 1e3,
+        "start": values["K (µM)"] / values["K/start"],
+        "ymax Linear": values["ymax Linear"],
+        "std": rng.uniform(distribution.std_range[0], distribution.std_range[1], n),
+    })
+    # Drop the draws without a linear regime, or whose linear regime may not rise above the leak
+    std = distribution.std_range[1]
+    valid = (values["K/start"] > 1) & (df["ymax Linear"] * (1 - std) > df["ymin (RPUx10-3)"] * 1e-3 * (1 + std))
+    return df[valid]
+
+
+def generate_library(distribution: LibraryDistribution, n_parts: int, seed: int = 0,
+                     compatible_fraction: Optional[float] = None,
+                     requirements: Optional[Sequence[Tuple[float, float]]] = None,
+                     regime: str = "max", require_all: bool = True,
+                     batch_size: int = 4096, max_batches: int = 1000) -> pd.DataFrame:
+    """
+    Draws a synthetic sensor library, in the schema of `data/marionette_data.csv`
+
+    Parameters are drawn from `distribution`. With `compatible_fraction`,
+    draws are classified with `compatible_sensors` and accepted until the
+    library holds `round(compatible_fraction * n_parts)` compatible parts,
+    the others being incompatible. A part is only counted as compatible
+    (resp. incompatible) if it is at both ends of the range of "std", so
+    that the classification holds whatever "std" `scalability.load_library`
+    draws for it.
+    Args:
+        distribution (LibraryDistribution): From `fit_library_distribution`
+        n_parts (int): Number of sensors
+        seed (int, optional): Seed of the draws. Defaults to 0.
+        compatible_fraction (Optional[float], optional): Fraction of sensors compatible with
+                                                         the processors, or None to keep the
+                                                         fitted one. Defaults to None.
+        requirements (Optional[Sequence[Tuple[float, float]]], optional): `(lower, upper)` bounds
+                                                                         assumed on each slot,
+                                                                         required with
+                                                                         `compatible_fraction`.
+                                                                         Defaults to None.
+        regime (str, optional): Regime in which compatibility is checked. Defaults to "max".
+        require_all (bool, optional): Compatible sensors must fit every slot instead of some slot.
+                                      Defaults to True.
+        batch_size (int, optional): Parameters drawn at a time. Defaults to 4096.
+        max_batches (int, optional): Draws before giving up on `compatible_fraction`. Defaults to 1000.
+
+    Returns:
+        pd.DataFrame: The library, with sensors named "syn<i>" and a "std" column
+    """
+    rng = np.random.default_rng(seed)
+    if compatible_fraction is None:
+        quotas = {None: n_parts}
+    elif requirements is None:
+        raise ValueError("requirements are needed to control the fraction of compatible sensors.")
+    elif not 0 <= compatible_fraction <= 1:
+        raise ValueError(f"compatible_fraction must be between 0 and 1, not {compatible_fraction}.")
+    else:
+        n_compatible = int(round(compatible_fraction * n_parts))
+        quotas = {True: n_compatible, False: n_parts - n_compatible}
+    accepted = {key: [] for key in quotas}
+    counts = dict.fromkeys(quotas, 0)
+    for _ in range(max_batches):
+        if all(counts[key] >= quotas[key] for key in quotas):
+            break
+        batch = _sample_table(distribution, batch_size, rng)
+        if compatible_fraction is None:
+            classes = {None: np.ones(len(batch), dtype=bool)}
+        else:
+            low, high = (compatible_sensors(batch, requirements, regime, require_all, std=std)
+                         for std in distribution.std_range)
+            classes = {True: low & high, False: ~low & ~high}
+        for key, mask in classes.items():
+            missing = quotas[key] - counts[key]
+            if missing > 0:
+                rows = batch[mask].iloc[:missing]
+                accepted[key].append(rows)
+                counts[key] += len(rows)
+    else:
+        if any(counts[key] < quotas[key] for key in quotas):
+            raise ValueError(
+                f"Could not draw {quotas} sensors in {max_batches} batches of {batch_size}, only {counts}."
+            )
+    # Interleave compatible and incompatible sensors, so that library order does not reveal the class
+    df = pd.concat([rows for key in quotas for rows in accepted[key]], ignore_index=True)
+    df = df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+    names = [f"syn{i}" for i in range(len(df))]
+    df.insert(0, "Inducer", names)
+    df.insert(1, "Plasmid", "synthetic")
+    df.insert(2, "Regulator", [f"R{name}" for name in names])
+    df.insert(3, "Promoter", [f"P{name}" for name in names])
+    return df
@@ -0,0 +1,266 @@
+import contextlib
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Hashable, List, Mapping, Optional, Sequence, Tuple
+from pacti.iocontract import IoContract, Var
+from utils.canonical import exact_hash
+from utils.composition_cache import CompositionCache
+from utils.failures import CompositionFailure
+from utils.stage_profiler import StageProfiler
+
+
+class CircuitTopology:
+    """
+    Declarative description of a circuit as a DAG of library slots and processors.
+
+    Library slots are signals driven by a sensor chosen from the library.
+    Processors are fixed contracts. Edges are signals: a processor consumes
+    every signal named by one of its input variables, whether it is driven
+    by a slot or by another processor's output.
+
+    Args:
+        slots (Sequence[str]): The signals driven by library sensors.
+        processors (Mapping[str, IoContract]): The fixed contracts, by name.
+
+    Raises:
+        ValueError: A processor input is driven by nothing, a signal is driven twice,
+                    the graph has a cycle, or it does not have a single root.
+    """
+
+    def __init__(self, slots: Sequence[str], processors: Mapping[str, IoContract]):
+        self.slots = list(slots)
+        self.processors = dict(processors)
+        producers: Dict[str, str] = {slot: slot for slot in self.slots}
+        for name, contract in self.processors.items():
+            for var in contract.outputvars:
+                if str(var) in producers:
+                    raise ValueError(f"Signal {var} is driven by both {producers[str(var)]} and {name}.")
+                producers[str(var)] = name
+        # Children of each processor: the nodes driving its inputs
+        self.children: Dict[str, List[str]] = {}
+        for name, contract in self.processors.items():
+            missing = [str(var) for var in contract.inputvars if str(var) not in producers]
+            if missing:
+                raise ValueError(f"Inputs {missing} of {name} are not driven by a slot or a processor.")
+            self.children[name] = [producers[str(var)] for var in contract.inputvars]
+        self.order = self._topological_order()
+        consumed = {child for children in self.children.values() for child in children}
+        roots = [name for name in self.processors if name not in consumed]
+        if len(roots) != 1:
+            raise ValueError(f"The topology must have exactly one root processor, found {roots}.")
+        self.root = roots[0]
+        # Library slots below each processor, in slot order
+        self.subtree_slots: Dict[str, Tuple[str, ...]] = {}
+        for name in self.order:
+            below = set()
+            for child in self.children[name]:
+                below.update(self.subtree_slots.get(child, (child,)))
+            self.subtree_slots[name] = tuple(slot for slot in self.slots if slot in below)
+
+    @property
+    def outputs(self) -> List[str]:
+        """The output variables of the root processor."""
+        return [str(var) for var in self.processors[self.root].outputvars]
+
+    def symmetric_slot_classes(self) -> List[List[str]]:
+        """
+        Groups of library slots that are provably interchangeable.
+
+        Two slots are interchangeable if they feed the same processor and
+        swapping their variables leaves that processor's contract unchanged.
+        Exchanging the sensors placed on such slots then yields an equivalent
+        design. Only these sibling symmetries are detected, so slots in
+        different classes may still be symmetric through larger subtree swaps.
+
+        Returns:
+            List[List[str]]: A partition of `slots`, each class in slot order.
+        """
+        parent = {slot: slot for slot in self.slots}
+
+        def find(slot: str) -> str:
+            while parent[slot] != slot:
+                slot = parent[slot]
+            return slot
+
+        for name, children in self.children.items():
+            leaves = [child for child in children if child not in self.processors]
+            for i, first in enumerate(leaves):
+                for second in leaves[i + 1:]:
+                    if find(first) != find(second) and _swap_invariant(self.processors[name], first, second):
+                        parent[find(second)] = find(first)
+        classes: Dict[str, List[str]] = {}
+        for slot in self.slots:
+            classes.setdefault(find(slot), []).append(slot)
+        return list(classes.values())
+
+    def levels(self) -> List[List[str]]:
+        """
+        Processors grouped so that each group only depends on earlier groups.
+
+        Returns:
+            List[List[str]]: The processors of each level, leaves first.
+        """
+        depth: Dict[str, int] = {}
+        for name in self.order:
+            depth[name] = 1 + max((depth.get(child, -1) for child in self.children[name]), default=-1)
+        levels: List[List[str]] = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+        for name in self.order:
+            levels[depth[name]].append(name)
+        return levels
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        state: Dict[str, int] = {}
+
+        def visit(name: str) -> None:
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f"The topology has a cycle through {name}.")
+            state[name] = 1
+            for child in self.children[name]:
+                if child in self.processors:
+                    visit(child)
+            state[name] = 2
+            order.append(name)
+
+        for name in self.processors:
+            visit(name)
+        return order
+
+
+def _term_set(terms: Sequence) -> frozenset:
+    return frozenset(
+        (tuple(sorted((str(var), float(coeff)) for var, coeff in term.variables.items())), float(term.constant))
+        for term in terms
+    )
+
+
+def _swap_invariant(contract: IoContract, first: str, second: str) -> bool:
+    # Whether exchanging variables `first` and `second` leaves the contract unchanged
+    placeholder = Var(f"__swap_{first}_{second}")
+    swapped = contract.rename_variable(Var(first), placeholder)
+    swapped = swapped.rename_variable(Var(second), Var(first))
+    swapped = swapped.rename_variable(placeholder, Var(second))
+    return (
+        set(map(str, swapped.inputvars)) == set(map(str, contract.inputvars))
+        and set(map(str, swapped.outputvars)) == set(map(str, contract.outputvars))
+        and _term_set(swapped.a.terms) == _term_set(contract.a.terms)
+        and _term_set(swapped.g.terms) == _term_set(contract.g.terms)
+    )
+
+
+def compose_topology(
+    topology: CircuitTopology,
+    placements: Mapping[str, Tuple[str, str]],
+    leaf_contract: Callable[[str, str, str], IoContract],
+    cache: Optional[CompositionCache] = None,
+    executor: Optional[Executor] = None,
+    cache_root: bool = False,
+    profiler: Optional[StageProfiler] = None,
+    canonical: bool = False,
+) -> Dict[str, Any]:
+    """
+    Compose a circuit along its topology, leaves first.
+
+    Each processor is composed with the composition of its children, in the
+    order of its inputs. Processors of the same level do not depend on each
+    other and are submitted together to `executor`, if given. The result of
+    each processor is looked up in `cache` under
+    `(processor, ((slot, sensor, regime), ...))`, the placements of the slots
+    below it, so sub-results are shared with other designs placing the same
+    sensors on those slots.
+
+    With `canonical`, processors fed by other processors are instead looked
+    up under the `utils.canonical.exact_hash` of their children's results,
+    which can be identical for designs that place the same sensors in
+    another order. Their composition then runs once per set of identical
+    inputs. The root is still only cached with `cache_root`.
+
+    Args:
+        topology (CircuitTopology): The circuit.
+        placements (Mapping[str, Tuple[str, str]]): `(sensor, regime)` placed on each slot.
+        leaf_contract (Callable[[str, str, str], IoContract]): Contract of `(sensor, slot, regime)`.
+        cache (Optional[CompositionCache], optional): Cache of processor sub-results. Defaults to None.
+        executor (Optional[Executor], optional): Runs the processors of a level concurrently.
+                                                 Defaults to None (sequential).
+        cache_root (bool, optional): Also cache the root composition, which is rarely shared.
+                                     Defaults to False.
+        profiler (Optional[StageProfiler], optional): Times the compositions of each processor, as stages
+            "pair_compose" (sensors feeding a processor composed together), "children_compose" (other
+            inputs composed together), "processor_compose" and "final_compose" (the root processor).
+            Cache hits are not timed. Defaults to None.
+        canonical (bool, optional): Share the compositions of processors fed by other processors between
+            designs whose sub-results have the same exact form. Defaults to False.
+
+    Returns:
+        Dict[str, Any]: For each processor that was attempted, its composed contract or the
+        `CompositionFailure` it raised. Processors below a failure are not attempted.
+    """
+    results: Dict[str, Any] = {}
+
+    def by_class(name: str) -> bool:
+        return canonical and any(child in topology.processors for child in topology.children[name])
+
+    def node_key(name: str) -> Hashable:
+        if by_class(name):
+            return name, tuple(
+                exact_hash(results[child]) if child in topology.processors else (child, *placements[child])
+                for child in topology.children[name]
+            )
+        return name, tuple((slot, *placements[slot]) for slot in topology.subtree_slots[name])
+
+    def timed(stage: str, name: str) -> Any:
+        if profiler is None or not profiler.enabled:
+            return contextlib.nullcontext()
+        sensors = [placements[slot][0] for slot in topology.subtree_slots[name]]
+        return profiler.stage(stage, sensors, processor=name)
+
+    def compose_node(name: str) -> IoContract:
+        children = topology.children[name]
+        stage = "children_compose" if any(child in topology.processors for child in children) else "pair_compose"
+        start = time.perf_counter()
+        try:
+            with timed(stage, name):
+                composed = None
+                for child in children:
+                    if child in topology.processors:
+                        contract = results[child]
+                    else:
+                        sensor, regime = placements[child]
+                        contract = leaf_contract(sensor, child, regime)
+                    composed = contract if composed is None else contract.compose(composed)
+            stage = "final_compose" if name == topology.root else "processor_compose"
+            start = time.perf_counter()
+            with timed(stage, name):
+                return composed.compose(topology.processors[name])
+        except Exception as e:
+            slots = topology.subtree_slots[name]
+            sensors = tuple(placements[slot][0] for slot in slots)
+            raise CompositionFailure(stage, name, slots, sensors, time.perf_counter() - start, e) from e
+
+    def run(name: str) -> Any:
+        try:
+            if cache is None or (name == topology.root and not cache_root):
+                return compose_node(name)
+            return cache.get_or_compose(node_key(name), lambda: compose_node(name))
+        except CompositionFailure as e:
+            if by_class(name):
+                # The failure may have been cached by another design: report the sensors of this one
+                slots = topology.subtree_slots[name]
+                sensors = tuple(placements[slot][0] for slot in slots)
+                return CompositionFailure(e.stage, name, slots, sensors, e.duration, e.cause, e.failure_class)
+            return e
+        except Exception as e:
+            return e
+
+    for level in topology.levels():
+        ready = [
+            name
+            for name in level
+            if all(child not in topology.processors or not isinstance(results.get(child, Exception()), Exception)
+                   for child in topology.children[name])
+        ]
+        outcomes = executor.map(run, ready) if executor is not None else map(run, ready)
+        results.update(zip(ready, outcomes))
+    return results